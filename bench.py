@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import git
+import main
+import prep
+import history
+import gitpool
+import classifier
+import results
+import sqllexer
+
+CHANGE_TYPES = ["rename", "dml", "comment", "whitespace", "ddl"]
+
+
+def get_change_weights(mix_txt):
+    # "rename=1,dml=3,..." (missing change types have the weight 0)
+    change_weights = dict.fromkeys(CHANGE_TYPES, 0)
+    for item in mix_txt.split(","):
+        change_type, weight = item.split("=")
+        if change_type not in change_weights:
+            raise ValueError(f"Unknown change type: '{change_type}'")
+        change_weights[change_type] = float(weight)
+    return change_weights
+
+
+def get_changed_lines(change_type, file_id, diff_size, rnd):
+    if change_type == "dml":
+        return [f"insert into tab_{file_id} values ({rnd.randint(0, 10**6)}, "
+                f"'value_{rnd.randint(0, 10**6)}');" for _ in range(diff_size)]
+    if change_type == "comment":
+        if rnd.random() < 0.5:
+            return [f"-- comment {rnd.randint(0, 10**6)}" for _ in range(diff_size)]
+        return ["/* comment"] + [f"   line {i}" for i in range(diff_size - 2)] + ["*/"]
+    return [f"    col_{rnd.randint(0, 10**6)} int not null," for _ in range(diff_size)]
+
+
+def get_fast_import_data(data):
+    data = data.encode("utf-8")
+    return b"data %d\n%s\n" % (len(data), data)
+
+
+def generate_repo(repo_path, commits_num=1000, sql_files_num=10, diff_size=5,
+                  change_weights=None, seed=0):
+    # synthetic repository (branch 'master') created with a single 'git fast-import'
+    rnd = random.Random(seed)
+    change_weights = change_weights or dict.fromkeys(CHANGE_TYPES, 1)
+    os.makedirs(repo_path, exist_ok=True)
+    repo_cmd = git.cmd.Git(repo_path)
+    repo_cmd.execute(["git", "init", "-q"])
+    repo_cmd.execute(["git", "symbolic-ref", "HEAD", "refs/heads/master"])
+
+    files = {}
+    next_file_id = 0
+    stream = []
+    for i in range(commits_num):
+        timestamp = 1577836800 + i * 60
+        stream.append(b"commit refs/heads/master\n"
+                      b"author Bench <bench@example.com> %d +0000\n"
+                      b"committer Bench <bench@example.com> %d +0000\n" % (timestamp, timestamp))
+        stream.append(get_fast_import_data(f"Commit {i}"))
+        if len(files) < sql_files_num:
+            change_type = "create"
+        else:
+            change_type = rnd.choices(CHANGE_TYPES,
+                                      [change_weights[ct] for ct in CHANGE_TYPES])[0]
+
+        if change_type == "create":
+            path = f"sql/schema_{next_file_id}.sql"
+            files[path] = [f"create table tab_{next_file_id} ("] + \
+                get_changed_lines("ddl", next_file_id, diff_size, rnd) + [");"]
+            next_file_id += 1
+        else:
+            path = rnd.choice(sorted(files))
+            lines = files[path]
+            if change_type == "rename":
+                new_path = f"sql/schema_{next_file_id}.sql"
+                next_file_id += 1
+                stream.append(f'R "{path}" "{new_path}"\n'.encode("utf-8"))
+                files[new_path] = files.pop(path)
+                path = None
+            elif change_type == "whitespace":
+                for idx in rnd.sample(range(len(lines)), min(diff_size, len(lines))):
+                    lines[idx] = "  " + lines[idx].strip() + " "
+            else:
+                idx = rnd.randint(1, len(lines) - 1)
+                lines[idx:idx] = get_changed_lines(change_type, i, diff_size, rnd)
+
+        if path is not None:
+            stream.append(f"M 100644 inline {path}\n".encode("utf-8"))
+            stream.append(get_fast_import_data("\n".join(files[path]) + "\n"))
+        # other (non-SQL) files are changed as well
+        if rnd.random() < 0.3:
+            stream.append(b"M 100644 inline README.md\n")
+            stream.append(get_fast_import_data(f"Version {i}\n"))
+        stream.append(b"\n")
+
+    with tempfile.TemporaryFile() as stream_f:
+        stream_f.write(b"".join(stream))
+        stream_f.seek(0)
+        repo_cmd.execute(["git", "fast-import", "--quiet"], istream=stream_f)
+    repo_cmd.execute(["git", "reset", "-q", "--hard"])
+    return repo_cmd
+
+
+def time_stage(timings, stage, func, items):
+    # calls 'func' for all items and records the duration of the stage
+    start = time.perf_counter()
+    res_lst = [func(item) for item in items]
+    seconds = time.perf_counter() - start
+    timings[stage] = {"seconds": round(seconds, 6),
+                      "items": len(res_lst),
+                      "per_item_ms": round(1000 * seconds / max(1, len(res_lst)), 6)}
+    return res_lst
+
+
+# blocks (repeated texts) on which the regex of 'Comments' backtracks: unclosed '/*'
+# (quadratic time) and comment starts in strings (also removed by the regex)
+# (the blocks repeat the texts, '{i}' is replaced by the number of the repetition)
+ADVERSARIAL_COMMENTS = {"unclosed_openers": "/* a ",
+                        "unclosed_opener_lines": "/* x\n",
+                        "comment_starts_in_strings": "'-- x', \"# y\" ",
+                        "closed_comments": "/* x */ y ",
+                        "unclosed_distinct_dollar_tags": "$t{i}$ x "}
+
+
+def get_adversarial_block(text, size):
+    return "".join(text.replace("{i}", str(i)) for i in range(size))
+
+
+def run_comments_benchmark(data_regex, sizes=(250, 500, 1000)):
+    # the seconds of removing the comments of the adversarial blocks of increasing sizes
+    # by the regex of 'Comments' and by the SQL lexer (see 'sqllexer')
+    pattern = re.compile(data_regex["Comments"], flags=re.M)
+    comments_timings = {}
+    for name, text in ADVERSARIAL_COMMENTS.items():
+        comments_timings[name] = {"sizes": list(sizes), "regex_seconds": [],
+                                  "lexer_seconds": []}
+        for size in sizes:
+            block = get_adversarial_block(text, size)
+            for method, strip_comments in [("regex", lambda block: pattern.sub("", block)),
+                                           ("lexer", sqllexer.strip_comments)]:
+                start = time.perf_counter()
+                strip_comments(block)
+                comments_timings[name][f"{method}_seconds"].append(
+                    round(time.perf_counter() - start, 6))
+    return comments_timings
+
+
+def run_startup_benchmark(repo_path, runs=3):
+    # the seconds (median of 'runs') of new processes classifying a diff on stdin and a commit
+    # with the lightweight 'cli', and of 'main.py --help' (with the imports of the analysis of
+    # whole projects) for comparison
+    script_dir_path = os.path.dirname(os.path.abspath(__file__))
+    cli_command = [sys.executable, os.path.join(script_dir_path, "cli.py"), "classify"]
+    diff_txt = git.cmd.Git(repo_path).execute(["git", "show", "HEAD"],
+                                              strip_newline_in_stdout=False)
+    commands = {"cli_classify_diff": (cli_command, diff_txt),
+                "cli_classify_commit": (cli_command + ["HEAD", "--repo", repo_path], ""),
+                "main_help": ([sys.executable, os.path.join(script_dir_path, "main.py"), "--help"],
+                              "")}
+    startup_timings = {}
+    for name, (command, input_txt) in commands.items():
+        seconds_lst = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.run(command, input=input_txt.encode("utf-8"), stdout=subprocess.DEVNULL,
+                           cwd=script_dir_path, check=True)
+            seconds_lst.append(time.perf_counter() - start)
+        startup_timings[name] = {"runs": runs,
+                                 "seconds": round(statistics.median(seconds_lst), 6)}
+    return startup_timings
+
+
+def run_benchmark(repo_path, sample_num=200, data_regex=None, comments_sizes=(250, 500, 1000),
+                  startup_runs=3):
+    # timings of the single stages of the analysis ('sample_num' commits for the stages
+    # with git calls per commit/file)
+    data_regex = data_regex or prep.get_json_data_regex()
+    repo_cmd = git.cmd.Git(repo_path)
+    timings = {}
+
+    res = time_stage(timings, "get_commits", main.get_commits, [repo_cmd])[0]
+    commits = main.prepare_commits_df(res)["commit"].tolist()
+    sample_commits = commits[:sample_num]
+
+    type_files_lsts = time_stage(timings, "get_change_type",
+                                 lambda commit: main.get_change_type(repo_cmd, commit),
+                                 sample_commits)
+    commit_files = [(commit, changed_file)
+                    for commit, type_files_lst in zip(sample_commits, type_files_lsts)
+                    for type_, changed_file in main.keep_only_sql_files(type_files_lst)
+                    if not type_.startswith("R100")]
+    diff_txts = time_stage(timings, "get_commit_file_diff_text",
+                           lambda commit_file: main.get_commit_file_diff_text(repo_cmd,
+                                                                              *commit_file),
+                           commit_files)
+    diff_txts = ["\n".join(diff_txt.split("\n")[1:]) for diff_txt in diff_txts]
+    # (the same by the persistent git processes, see 'gitpool')
+    status_records = time_stage(timings, "get_change_type_pooled",
+                                lambda commit: history.get_status_record(repo_cmd, commit),
+                                sample_commits)
+    diff_txts_pooled = time_stage(
+        timings, "get_commit_file_diff_text_pooled",
+        lambda commit_file: history.get_diff_txt_dict(repo_cmd, commit_file[0]).get(
+            commit_file[1], ""), commit_files)
+    gitpool.close_pools()
+    time_stage(timings, "prepare_changed_blocks", main.prepare_changed_blocks, diff_txts)
+
+    sql_classifier = classifier.Classifier(data_regex)
+    categories_lsts = time_stage(timings, "classification", sql_classifier.get_categories,
+                                 diff_txts)
+    regex_stats = dict(sql_classifier.regex_stats)
+    # (without ruling out categories by their required literals, see 'prefilter')
+    categories_lsts_no_prefilter = time_stage(
+        timings, "classification_no_prefilter",
+        classifier.Classifier(data_regex, use_prefilter=False).get_categories, diff_txts)
+    # (all diffs at once, see 'classifier.Classifier.get_categories_batch')
+    categories_lsts_batch = time_stage(timings, "classification_batch",
+                                       sql_classifier.get_categories_batch, [diff_txts])[0]
+    categories_lsts_per_category = time_stage(
+        timings, "classification_per_category",
+        lambda diff_txt: get_categories_per_category(diff_txt, data_regex), diff_txts)
+
+    # all commits with the streaming reader
+    records = time_stage(timings, "iter_commit_records", lambda record: record,
+                         history.iter_commit_records(repo_cmd, commits))
+    commits_res = time_stage(timings, "analyze_commit",
+                             lambda record: main.analyze_commit(record, sql_classifier), records)
+    # (the same with the diffs computed in-process, see 'xdiff')
+    records_python = time_stage(timings, "iter_commit_records_python", lambda record: record,
+                                history.iter_commit_records(repo_cmd, commits,
+                                                            diff_engine="python"))
+    commits_res_python = time_stage(timings, "analyze_commit_python",
+                                    lambda record: main.analyze_commit(record, sql_classifier),
+                                    records_python)
+
+    result_store = results.ResultStore(main.prepare_commits_df(res))
+    for record, commit_res in zip(records, commits_res):
+        result_store.add_commit_res(record.commit, commit_res)
+    with tempfile.TemporaryDirectory() as tmp_dir_path:
+        time_stage(timings, "csv_write", result_store.write_csv,
+                   [os.path.join(tmp_dir_path, "bench.csv")])
+    # (both classifications must give the same results)
+    mismatches_num = sum(categories_lst != categories_lst_per_category or
+                         categories_lst != categories_lst_no_prefilter
+                         for categories_lst, categories_lst_per_category,
+                         categories_lst_no_prefilter in
+                         zip(categories_lsts, categories_lsts_per_category,
+                             categories_lsts_no_prefilter))
+    batch_mismatches_num = sum(categories_lst != categories_lst_batch
+                               for categories_lst, categories_lst_batch in
+                               zip(categories_lsts, categories_lsts_batch))
+    pooled_mismatches_num = sum(
+        record.type_files_lst != type_files_lst
+        for record, type_files_lst in zip(status_records, type_files_lsts)) + sum(
+        diff_txt != diff_txt_pooled for diff_txt, diff_txt_pooled in zip(diff_txts,
+                                                                          diff_txts_pooled))
+    diff_engine_mismatches_num = sum(commit_res != commit_res_python
+                                     for commit_res, commit_res_python in
+                                     zip(commits_res, commits_res_python))
+    return {"commits": len(commits), "sample_commits": len(sample_commits),
+            "classification_mismatches": mismatches_num,
+            "batch_classification_mismatches": batch_mismatches_num,
+            "diff_engine_mismatches": diff_engine_mismatches_num,
+            "pooled_mismatches": pooled_mismatches_num, **regex_stats,
+            "stages": timings,
+            "comments_adversarial": run_comments_benchmark(data_regex, comments_sizes),
+            "startup": run_startup_benchmark(repo_path, startup_runs) if startup_runs > 0 else {}}
+
+
+def get_categories_per_category(diff_txt, data_regex):
+    # the classification with the per-category functions of 'main' (for comparison)
+    diff_txt = diff_txt.replace("\\ No newline at end of file", "").strip()
+    if len(diff_txt) == 0:
+        return ["Whitespace"]
+    if "@@ " not in diff_txt:
+        return ["NoDiffInfo"]
+    changed_blocks = main.prepare_changed_blocks(diff_txt)
+    categories_lst = []
+    for category, regex in data_regex.items():
+        size_before = main.calculate_total_block_diff_size(changed_blocks)
+        changed_blocks = main.check_modify_changed_blocks(changed_blocks, regex, category)
+        if size_before > main.calculate_total_block_diff_size(changed_blocks):
+            categories_lst.append(category)
+        if len(changed_blocks) == 0:
+            break
+    if len(changed_blocks) != 0:
+        categories_lst.append("Other")
+    return categories_lst
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark on a synthetic repository")
+    parser.add_argument("--commits", type=int, default=1000, help="number of commits")
+    parser.add_argument("--sql-files", type=int, default=10, help="number of SQL files")
+    parser.add_argument("--diff-size", type=int, default=5, help="changed lines per commit")
+    parser.add_argument("--mix", default="rename=1,dml=1,comment=1,whitespace=1,ddl=1",
+                        help="weights of the change types")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sample", type=int, default=200,
+                        help="number of commits for the stages with git calls per commit/file")
+    parser.add_argument("--comments-sizes", default="250,500,1000",
+                        help="repetitions of the adversarial blocks for the removal of comments")
+    parser.add_argument("--startup-runs", type=int, default=3,
+                        help="runs of the startup benchmark of 'cli.py' (0: none)")
+    parser.add_argument("--repo-path", help="keep the generated repository in this folder")
+    parser.add_argument("--output", help="JSON file for the results (default: stdout)")
+    return parser.parse_args(argv)
+
+
+def main_bench(argv=None):
+    args = parse_args(argv)
+    change_weights = get_change_weights(args.mix)
+    with tempfile.TemporaryDirectory() as tmp_dir_path:
+        repo_path = args.repo_path or os.path.join(tmp_dir_path, "repo")
+        start = time.perf_counter()
+        generate_repo(repo_path, args.commits, args.sql_files, args.diff_size,
+                      change_weights, args.seed)
+        generation_seconds = time.perf_counter() - start
+        bench_res = run_benchmark(repo_path, args.sample, comments_sizes=[
+            int(size) for size in args.comments_sizes.split(",")], startup_runs=args.startup_runs)
+
+    bench_res["config"] = {"commits": args.commits, "sql_files": args.sql_files,
+                           "diff_size": args.diff_size, "mix": change_weights,
+                           "seed": args.seed, "sample": args.sample}
+    bench_res["generation_seconds"] = round(generation_seconds, 6)
+    bench_res["environment"] = {"python": platform.python_version(),
+                                "platform": platform.platform(),
+                                "git": git.cmd.Git().version()}
+    if args.output is None:
+        json.dump(bench_res, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w", encoding="utf-8") as json_f:
+            json.dump(bench_res, json_f, indent=2)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main_bench()
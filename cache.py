@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+import json
+import sqlite3
+import hashlib
+from collections import OrderedDict
+
+# to be increased if the analysis itself changes (the cached results become invalid)
+CACHE_VERSION = 2
+
+
+def get_regex_hash(data_regex, comments_lexer=True, diff_engine="git"):
+    # the order of the categories is relevant for the classification (no 'sort_keys');
+    # ('comments_lexer': the comments are removed by 'sqllexer' instead of the regex;
+    # 'diff_engine': the hunks of 'xdiff' may differ from those of git)
+    regex_txt = json.dumps({"version": CACHE_VERSION, "regex": data_regex,
+                            "comments": "lexer" if comments_lexer else "regex",
+                            "diff_engine": diff_engine})
+    return hashlib.sha1(regex_txt.encode("utf-8")).hexdigest()
+
+
+class CommitCache:
+    # results of already analyzed commits of a repository (SQLite file),
+    # keyed by the commit SHA and the hash of the regex config
+
+    def __init__(self, cache_path, regex_hash):
+        self.regex_hash = regex_hash
+        self.conn = sqlite3.connect(cache_path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS results ("
+                          "regex_hash TEXT NOT NULL, "
+                          "commit_sha TEXT NOT NULL, "
+                          "result TEXT NOT NULL, "
+                          "PRIMARY KEY (regex_hash, commit_sha))")
+        # results for another regex config will never be used again
+        self.conn.execute("DELETE FROM results WHERE regex_hash != ?", (regex_hash,))
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_results(self, commits, chunk_size=500):
+        # (queried in chunks of commits, e.g. for the chunks of the streamed results)
+        commits_res = {}
+        for i in range(0, len(commits), chunk_size):
+            chunk = commits[i:i + chunk_size]
+            placeholders = ", ".join("?" * len(chunk))
+            cursor = self.conn.execute("SELECT commit_sha, result FROM results "
+                                       f"WHERE regex_hash = ? AND commit_sha IN ({placeholders})",
+                                       (self.regex_hash, *chunk))
+            commits_res.update((commit, json.loads(result)) for commit, result in cursor)
+        return commits_res
+
+    def get_cached_commits(self, commits):
+        # only the SHAs of the cached commits (without loading the results)
+        commits_set = set(commits)
+        cursor = self.conn.execute("SELECT commit_sha FROM results WHERE regex_hash = ?",
+                                   (self.regex_hash,))
+        return {commit for commit, in cursor if commit in commits_set}
+
+    def add_result(self, commit, commit_res):
+        self.conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+                          (self.regex_hash, commit, json.dumps(commit_res)))
+
+    def clear(self):
+        self.conn.execute("DELETE FROM results")
+
+    def flush(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+
+class BlobPairCache:
+    # classification results (categories) of single-file diffs, keyed by the
+    # (old blob, new blob) pair of the diff and the hash of the regex config;
+    # in-memory LRU with an optional on-disk tier (SQLite file, shared by projects)
+
+    def __init__(self, regex_hash, maxsize=100000, cache_path=None):
+        self.regex_hash = regex_hash
+        self.maxsize = maxsize
+        self.cache_path = cache_path
+        self.lru = OrderedDict()
+        self.conn = None
+        self.pending_num = 0
+
+    def __getstate__(self):
+        # (e.g. for worker processes) without the connection and the in-memory entries
+        state = self.__dict__.copy()
+        state.update(lru=OrderedDict(), conn=None, pending_num=0)
+        return state
+
+    def __contains__(self, blob_pair):
+        return self.get(blob_pair) is not None
+
+    def get_conn(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.cache_path, timeout=60)
+            self.conn.execute("CREATE TABLE IF NOT EXISTS blob_pairs ("
+                              "regex_hash TEXT NOT NULL, "
+                              "old_blob TEXT NOT NULL, "
+                              "new_blob TEXT NOT NULL, "
+                              "categories TEXT NOT NULL, "
+                              "PRIMARY KEY (regex_hash, old_blob, new_blob))")
+        return self.conn
+
+    def add_to_lru(self, blob_pair, categories_lst):
+        self.lru[blob_pair] = categories_lst
+        self.lru.move_to_end(blob_pair)
+        if len(self.lru) > self.maxsize:
+            self.lru.popitem(last=False)
+
+    def peek(self, blob_pair):
+        # only the in-memory entries, without updating them (e.g. from another thread)
+        return blob_pair in self.lru
+
+    def get(self, blob_pair):
+        categories_lst = self.lru.get(blob_pair)
+        if categories_lst is not None:
+            self.lru.move_to_end(blob_pair)
+            return categories_lst
+        if self.cache_path is None:
+            return None
+        row = self.get_conn().execute("SELECT categories FROM blob_pairs WHERE regex_hash = ? "
+                                      "AND old_blob = ? AND new_blob = ?",
+                                      (self.regex_hash, *blob_pair)).fetchone()
+        if row is None:
+            return None
+        categories_lst = json.loads(row[0])
+        self.add_to_lru(blob_pair, categories_lst)
+        return categories_lst
+
+    def put(self, blob_pair, categories_lst):
+        self.add_to_lru(blob_pair, categories_lst)
+        if self.cache_path is None:
+            return
+        self.get_conn().execute("INSERT OR REPLACE INTO blob_pairs VALUES (?, ?, ?, ?)",
+                                (self.regex_hash, *blob_pair, json.dumps(categories_lst)))
+        # short transactions, the file may be used by several processes
+        self.pending_num += 1
+        if self.pending_num >= 1000:
+            self.flush()
+
+    def flush(self):
+        if self.conn is not None:
+            self.conn.commit()
+        self.pending_num = 0
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.commit()
+            self.conn.close()
+            self.conn = None
+        self.pending_num = 0
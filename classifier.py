@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+
+import re
+import warnings
+from functools import partial
+import hunks
+import metrics
+import prefilter
+import sqllexer
+
+
+def prepare_changed_lines(diff_txt):
+    # the lines of the changed blocks (lowercase; without +/-, leading/trailing chars and
+    # empty lines), tokenized once
+    blocks_lines_lst = []
+    lines_num = 0
+    for hunk in hunks.iter_hunks(diff_txt):
+        block_lines = []
+        for line in hunk.lines:
+            line = line[1:].strip()
+            if line != "":
+                block_lines.append(line.lower())
+        if len(block_lines) > 0:
+            blocks_lines_lst.append(block_lines)
+            lines_num += len(block_lines)
+    metrics.count("lines_classified", lines_num)
+    return blocks_lines_lst
+
+
+class Classifier:
+    # evaluates all categories of 'conf/regex.json' (in their order) on the lines of a diff:
+    # consecutive line categories are checked in one pass (a line is removed by the first
+    # matching category), the 'Comments' category modifies the whole blocks
+    # (single-line and multi-line comments are removed by the SQL lexer or by its regex);
+    # the categories whose required literals are not in a block are not evaluated on its
+    # lines (see 'prefilter.LiteralPrefilter')
+
+    def __init__(self, data_regex, use_prefilter=True, comments_lexer=True):
+        self.categories = list(data_regex.keys())
+        self.stages = []
+        # (the comments of a block are removed by 'sqllexer.strip_comments', in linear time and
+        # not within strings, or by the substitution of the regex of 'Comments')
+        self.strip_comments = sqllexer.strip_comments
+        for category, regex in data_regex.items():
+            if category == "Comments":
+                self.stages.append((category, re.compile(regex, flags=re.M)))
+                if not comments_lexer:
+                    self.strip_comments = partial(self.stages[-1][1].sub, "")
+            elif len(self.stages) > 0 and isinstance(self.stages[-1], list):
+                self.stages[-1].append((category, re.compile(regex, flags=re.I)))
+            else:
+                self.stages.append([(category, re.compile(regex, flags=re.I))])
+        self.prefilters = [None] * len(self.stages)
+        if use_prefilter:
+            self.prefilters = []
+            for stage in self.stages:
+                if not isinstance(stage, list) and comments_lexer:
+                    # (the comments found by the lexer start with its literals)
+                    stage = (stage[0], sqllexer.COMMENT_START_REGEX)
+                self.prefilters.append(prefilter.LiteralPrefilter(
+                    stage if isinstance(stage, list) else [stage]))
+        # the regex evaluations (per line or per block) and the ones ruled out by the prefilter
+        self.regex_stats = {"regex_evaluations": 0, "regex_evaluations_skipped": 0}
+
+    @staticmethod
+    def remove_matching_lines(blocks_lines_lst, patterns, hits, metrics_obj=None,
+                              stage_prefilter=None, regex_stats=None):
+        searches = [(category, pattern.search) for category, pattern in patterns]
+        if metrics_obj is not None:
+            # (the time of each category)
+            searches = [(category, metrics_obj.timed(search, f"regex:{category}"))
+                        for category, search in searches]
+        evaluations_num = skipped_num = 0
+        blocks_lines_mod_lst = []
+        for block_lines in blocks_lines_lst:
+            block_searches = searches
+            if stage_prefilter is not None:
+                candidates = stage_prefilter.get_candidates("\n".join(block_lines))
+                block_searches = [(category, search) for category, search in searches
+                                  if category in candidates]
+            block_lines_mod = []
+            for line in block_lines:
+                for position, (category, search) in enumerate(block_searches):
+                    if search(line):
+                        hits[category] += 1
+                        evaluations_num += position + 1
+                        # (the ruled out categories before the matching one)
+                        skipped_num += stage_prefilter.categories.index(category) - position \
+                            if stage_prefilter is not None else 0
+                        break
+                else:
+                    block_lines_mod.append(line)
+                    evaluations_num += len(block_searches)
+                    skipped_num += len(searches) - len(block_searches)
+            if len(block_lines_mod) > 0:
+                blocks_lines_mod_lst.append(block_lines_mod)
+        if regex_stats is not None:
+            regex_stats["regex_evaluations"] += evaluations_num
+            regex_stats["regex_evaluations_skipped"] += skipped_num
+        return blocks_lines_mod_lst
+
+    @staticmethod
+    def remove_comments(blocks_lines_lst, category, strip_comments, hits, stage_prefilter=None,
+                        regex_stats=None):
+        blocks_lines_mod_lst = []
+        for block_lines in blocks_lines_lst:
+            if stage_prefilter is not None and \
+                    category not in stage_prefilter.get_candidates("\n".join(block_lines)):
+                # (lines without comments)
+                blocks_lines_mod_lst.append(block_lines)
+                if regex_stats is not None:
+                    regex_stats["regex_evaluations_skipped"] += 1
+                continue
+            if regex_stats is not None:
+                regex_stats["regex_evaluations"] += 1
+            block_lines_mod = []
+            block = strip_comments("\n".join(block_lines))
+            for line in block.split("\n"):
+                line_mod = line.strip()
+                if line_mod != "":
+                    block_lines_mod.append(line_mod)
+            hits[category] += len(block_lines) - len(block_lines_mod)
+            if len(block_lines_mod) > 0:
+                blocks_lines_mod_lst.append(block_lines_mod)
+        return blocks_lines_mod_lst
+
+    def classify(self, blocks_lines_lst):
+        # returns the number of removed lines per category and the lines left over
+        hits = {category: 0 for category in self.categories}
+        metrics_obj = metrics.ACTIVE_METRICS
+        regex_stats = {"regex_evaluations": 0, "regex_evaluations_skipped": 0}
+        for stage, stage_prefilter in zip(self.stages, self.prefilters):
+            if len(blocks_lines_lst) == 0:
+                break
+            if isinstance(stage, list):
+                blocks_lines_lst = self.remove_matching_lines(blocks_lines_lst, stage, hits,
+                                                              metrics_obj, stage_prefilter,
+                                                              regex_stats)
+            else:
+                with metrics.timer(f"regex:{stage[0]}"):
+                    blocks_lines_lst = self.remove_comments(blocks_lines_lst, stage[0],
+                                                            self.strip_comments, hits,
+                                                            stage_prefilter, regex_stats)
+        for counter, value in regex_stats.items():
+            self.regex_stats[counter] += value
+            metrics.count(counter, value)
+        return hits, blocks_lines_lst
+
+    @staticmethod
+    def get_special_categories(diff_txt):
+        # the categories of diffs without changed lines (None otherwise) and the diff text
+        # without additional (unnecessary) information from Git
+        diff_txt = diff_txt.replace("\\ No newline at end of file", "").strip()
+        if len(diff_txt) == 0:
+            return ["Whitespace"], diff_txt
+        if "@@ " not in diff_txt:
+            return ["NoDiffInfo"], diff_txt
+        return None, diff_txt
+
+    def get_categories(self, diff_txt):
+        # all categories of a (single-file) diff as determined in 'main.main'
+        categories_lst, diff_txt = self.get_special_categories(diff_txt)
+        if categories_lst is not None:
+            return categories_lst
+        with metrics.timer("hunk_splitting"):
+            blocks_lines_lst = prepare_changed_lines(diff_txt)
+        hits, blocks_lines_lst = self.classify(blocks_lines_lst)
+        categories_lst = [category for category in self.categories if hits[category] > 0]
+        if len(blocks_lines_lst) != 0:
+            categories_lst.append("Other")
+        return categories_lst
+
+    @staticmethod
+    def prepare_lines_df(diff_txt_lst, categories_lsts):
+        # the changed lines of all diffs with changed lines in one table (diff, block, line)
+        # (pandas is imported only for the batch classification, see 'cli')
+        import pandas as pd  # pylint: disable=import-outside-toplevel
+        diff_ids, block_ids, lines = [], [], []
+        for diff_id, diff_txt in enumerate(diff_txt_lst):
+            if categories_lsts[diff_id] is not None:
+                continue
+            categories_lsts[diff_id] = []
+            for block_lines in prepare_changed_lines(diff_txt):
+                diff_ids.extend([diff_id] * len(block_lines))
+                block_ids.extend([len(block_ids)] * len(block_lines))
+                lines.extend(block_lines)
+        return pd.DataFrame({"diff": pd.Series(diff_ids, dtype="int64"),
+                             "block": pd.Series(block_ids, dtype="int64"),
+                             "line": pd.Series(lines, dtype="object")})
+
+    @staticmethod
+    def remove_comments_df(lines_df, strip_comments):
+        # the same as 'remove_comments' for all blocks of the table
+        # (the lines of a block are consecutive)
+        import numpy as np  # pylint: disable=import-outside-toplevel
+        import pandas as pd  # pylint: disable=import-outside-toplevel
+        lines = lines_df["line"].tolist()
+        block_ids = lines_df["block"].to_numpy()
+        starts = np.flatnonzero(np.diff(block_ids, prepend=-1))
+        ends = np.append(starts[1:], len(lines))
+        blocks_df = pd.DataFrame({"diff": lines_df["diff"].to_numpy()[starts],
+                                  "block_txt": ["\n".join(lines[start:end])
+                                                for start, end in zip(starts, ends)]},
+                                 index=block_ids[starts])
+        block_lines = (blocks_df["block_txt"].map(strip_comments)
+                       .str.split("\n").explode().str.strip())
+        block_lines = block_lines[block_lines != ""]
+        return pd.DataFrame({"diff": blocks_df.loc[block_lines.index, "diff"].to_numpy(),
+                             "block": block_lines.index.to_numpy(),
+                             "line": block_lines.to_numpy()})
+
+    def get_categories_batch(self, diff_txt_lst):
+        # the same as 'get_categories' for many diffs (e.g. of all SQL files of many commits):
+        # each category is applied once to the changed lines of all diffs (with the vectorized
+        # string functions of pandas), the categories per diff come from a group-by of the hits
+        import pandas as pd  # pylint: disable=import-outside-toplevel
+        special_categories = [self.get_special_categories(diff_txt) for diff_txt in diff_txt_lst]
+        categories_lsts = [categories_lst for categories_lst, _ in special_categories]
+        with metrics.timer("hunk_splitting"):
+            lines_df = self.prepare_lines_df([diff_txt for _, diff_txt in special_categories],
+                                             categories_lsts)
+        category_ids = {category: category_id
+                        for category_id, category in enumerate(self.categories + ["Other"])}
+        hits_lst = []
+        for stage in self.stages:
+            if len(lines_df) == 0:
+                break
+            for category, pattern in stage if isinstance(stage, list) else [stage]:
+                with metrics.timer(f"regex:{category}"):
+                    if isinstance(stage, list):
+                        with warnings.catch_warnings():
+                            # (the match groups of the patterns are not used)
+                            warnings.simplefilter("ignore", UserWarning)
+                            matches = lines_df["line"].str.contains(pattern)
+                        hits = lines_df.loc[matches, "diff"]
+                        lines_df = lines_df[~matches]
+                    else:
+                        lines_num = lines_df.groupby("diff").size()
+                        lines_df = self.remove_comments_df(lines_df, self.strip_comments)
+                        lines_num = lines_num.sub(lines_df.groupby("diff").size(), fill_value=0)
+                        hits = lines_num[lines_num > 0].index.to_series()
+                hits_lst.append(pd.DataFrame({"diff": hits.to_numpy(),
+                                              "category_id": category_ids[category]}))
+        # (the presence of not yet identified changes)
+        hits_lst.append(pd.DataFrame({"diff": lines_df["diff"].to_numpy(),
+                                      "category_id": category_ids["Other"]}))
+        # diff x category
+        categories = self.categories + ["Other"]
+        hits_df = (pd.concat(hits_lst).groupby(["diff", "category_id"]).size().unstack()
+                   .reindex(columns=range(len(categories))).notna())
+        # (in the order of the categories)
+        for category_id, category in enumerate(categories):
+            for diff_id in hits_df.index[hits_df[category_id].to_numpy()]:
+                categories_lsts[diff_id].append(category)
+        return categories_lsts
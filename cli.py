@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import argparse
+import prep
+import history
+import gitpool
+import classifier
+
+# (only light modules are imported at startup: GitPython and 'main' only for a commit,
+# pandas never, so that the classification can run in git hooks)
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULT_COUNT_KEYS = ["ChangedFilesNum", "SQLFilesNum"]
+
+
+def analyze_diff(diff_txt, sql_classifier):
+    # the result of a patch (e.g. of 'git show' or 'git diff') as of a commit by 'main':
+    # the numbers of changed (SQL) files and the SQL files per category; a diff without
+    # 'diff --git' headers is classified as a single SQL file '-'; the renamed SQL files are
+    # 'Renaming' (as in 'main.check_for_renaming', those not renamed with 100% similarity
+    # are also classified, by the changes of their rename diff)
+    diff_txt_dict = history.split_file_sections(diff_txt.split("\n"))
+    if len(diff_txt_dict) == 0:
+        diff_txt_dict = {"-": diff_txt}
+        sql_files = ["-"]
+    else:
+        sql_files = [changed_file for changed_file in diff_txt_dict
+                     if changed_file.endswith(".sql")]
+    commit_res = {"ChangedFilesNum": len(diff_txt_dict), "SQLFilesNum": len(sql_files)}
+    similarities = {changed_file: history.get_rename_similarity(diff_txt_dict[changed_file])
+                    for changed_file in sql_files}
+    # (the files renamed with 100% similarity first)
+    renamed_files = sorted((changed_file for changed_file in sql_files
+                            if similarities[changed_file] is not None),
+                           key=lambda changed_file: similarities[changed_file] != 100)
+    if len(renamed_files) > 0:
+        commit_res["Renaming"] = renamed_files
+    for changed_file in sql_files:
+        if similarities[changed_file] == 100:
+            continue
+        for category in sql_classifier.get_categories(diff_txt_dict[changed_file]):
+            commit_res.setdefault(category, []).append(changed_file)
+    return commit_res
+
+
+def analyze_revision(repo_path, rev, sql_classifier, diff_engine="git"):
+    # the full SHA and the result of a commit of the repository (as in the result files)
+    # pylint: disable=import-outside-toplevel
+    import git
+    import main
+    repo_cmd = git.cmd.Git(repo_path)
+    commit = repo_cmd.execute(["git", "rev-parse", "--verify", f"{rev}^{{commit}}"])
+    try:
+        return commit, main.analyze_single_commit(repo_cmd, commit, sql_classifier,
+                                                  diff_engine=diff_engine)
+    finally:
+        gitpool.close_pools()
+
+
+def format_result(commit_res):
+    # one line per number and category (in the order of the result columns)
+    lines = [f"{key}: {commit_res[key]}" for key in RESULT_COUNT_KEYS]
+    lines.extend(f"{key}: {', '.join(files)}" for key, files in commit_res.items()
+                 if key not in RESULT_COUNT_KEYS)
+    return "\n".join(lines)
+
+
+def classify(args):
+    sql_classifier = classifier.Classifier(prep.get_json_data_regex(args.regex_file),
+                                           not args.no_prefilter, not args.comments_regex)
+    if args.rev is None:
+        commit, commit_res = None, analyze_diff(sys.stdin.read(), sql_classifier)
+    else:
+        commit, commit_res = analyze_revision(args.repo, args.rev, sql_classifier,
+                                              args.diff_engine)
+    if args.json:
+        print(json.dumps({"commit": commit, "result": commit_res}))
+    else:
+        if commit is not None:
+            print(f"commit {commit}")
+        print(format_result(commit_res))
+    # (e.g. a hook rejecting the changes of these categories)
+    return 1 if any(category in commit_res for category in args.fail_on) else 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Lightweight classification of the changes "
+                                                 "in SQL files, e.g. in git hooks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    classify_parser = subparsers.add_parser(
+        "classify", help="classify a commit or the diff on stdin "
+                         "(e.g. 'git show | python3 cli.py classify'; the categories of 'main.py' "
+                         "for 'git show -w -b --ignore-space-at-eol --ignore-blank-lines -U0')")
+    classify_parser.add_argument("rev", nargs="?",
+                                 help="the commit to classify (instead of the diff on stdin)")
+    classify_parser.add_argument("--repo", default=".", help="the repository of the commit")
+    classify_parser.add_argument("--regex-file",
+                                 default=os.path.join(SCRIPT_DIR, "conf", "regex.json"),
+                                 help="the regex config of the categories")
+    classify_parser.add_argument("--diff-engine", choices=history.DIFF_ENGINES, default="git",
+                                 help="read the diffs of a commit from git ('git') or compute "
+                                      "them in-process ('python', experimental)")
+    classify_parser.add_argument("--no-prefilter", action="store_true",
+                                 help="evaluate all category regexes")
+    classify_parser.add_argument("--comments-regex", action="store_true",
+                                 help="remove the comments with the regex of 'Comments'")
+    classify_parser.add_argument("--json", action="store_true",
+                                 help="write the commit and its result as JSON")
+    classify_parser.add_argument("--fail-on", nargs="+", default=[], metavar="CATEGORY",
+                                 help="exit with status 1 if a SQL file has one of the categories")
+    return parser.parse_args(argv)
+
+
+def main_cli(argv=None):
+    args = parse_args(argv)
+    return classify(args)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    sys.exit(main_cli())
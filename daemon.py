@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import hmac
+import socket
+import secrets
+import argparse
+import threading
+import http.client
+import socketserver
+from urllib.parse import urlsplit, parse_qs, urlencode
+from http.server import HTTPServer, BaseHTTPRequestHandler
+import git
+import main
+import prep
+import cache
+import gitpool
+import classifier
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# the file with the token of the HTTP server (relative to the working directory)
+DEFAULT_TOKEN_FILE = "daemon.token"
+# the options of 'refresh' selecting the commits (see 'history.CommitQuery')
+QUERY_PARAMS = ["since", "until", "rev_range"]
+# the header with the token of the HTTP server (see 'AnalysisHTTPServer')
+TOKEN_HEADER = "X-Token"
+# the separators of the ends of a revision range (the symmetric difference first)
+RANGE_SEPARATORS = ["...", ".."]
+
+
+class RequestError(Exception):
+    # an invalid request (HTTP status 400)
+    pass
+
+
+class AnalysisService:
+    # the state kept warm between the requests: the compiled classifier, the blob cache,
+    # the repository handles with their persistent git processes (see 'gitpool') and the
+    # commit caches of the projects; the requests are handled one at a time by the thread
+    # of the server, which also opens the SQLite connections
+
+    def __init__(self, args, projects_json_lst=None):
+        # args: the analysis options of 'main.parse_args'
+        self.args = args
+        data_regex = prep.get_json_data_regex()
+        self.sql_classifier = classifier.Classifier(data_regex, not args.no_prefilter,
+                                                    not args.comments_regex)
+        self.regex_hash = cache.get_regex_hash(data_regex, not args.comments_regex,
+                                               args.diff_engine)
+        self.blob_cache = main.get_blob_cache(args, self.regex_hash)
+        self.results_dir_path = os.path.join(main.HOME_DIR, "results")
+        prep.check_create_results_folder(self.results_dir_path)
+        if projects_json_lst is None:
+            projects_json_lst = prep.get_json_data_projects()
+        self.projects = {prj["name"]: prj for prj in projects_json_lst}
+        self.repo_cmds = {}
+        self.commit_caches = {}
+        self.started = time.time()
+        self.requests_num = 0
+
+    def get_repo_cmd(self, name):
+        if name not in self.projects:
+            raise LookupError(f"unknown project '{name}'")
+        repo_cmd = self.repo_cmds.get(name)
+        if repo_cmd is None:
+            repo_path = os.path.join(main.HOME_DIR, "repos", name)
+            if not os.path.exists(repo_path):
+                raise LookupError(f"the repository for project '{name}' has not been cloned")
+            repo_cmd = self.repo_cmds[name] = git.cmd.Git(repo_path)
+        return repo_cmd
+
+    def get_commit_cache(self, name):
+        commit_cache = self.commit_caches.get(name)
+        if commit_cache is None:
+            commit_cache = self.commit_caches[name] = cache.CommitCache(
+                os.path.join(self.results_dir_path, f"{name}.sqlite"), self.regex_hash)
+        return commit_cache
+
+    def resolve_commit(self, repo_cmd, commit):
+        # (a full SHA is used as it is, other revisions such as 'HEAD' are resolved by git)
+        if len(commit) == 40 and all(char in "0123456789abcdef" for char in commit):
+            return commit
+        if commit.startswith("-"):
+            raise RequestError(f"invalid revision '{commit}'")
+        try:
+            return repo_cmd.execute(["git", "rev-parse", "--verify", "--quiet",
+                                     "--end-of-options", f"{commit}^{{commit}}"])
+        except git.exc.GitCommandError as e:
+            raise LookupError(f"unknown commit '{commit}'") from e
+
+    def resolve_range(self, repo_cmd, rev_range):
+        # the range with both ends resolved to commits (e.g. 'v1.0..HEAD' -> '<SHA>..<SHA>',
+        # an empty end stays empty), so that no other revision syntax reaches 'git log'
+        for separator in RANGE_SEPARATORS:
+            if separator in rev_range:
+                start, end = rev_range.split(separator, 1)
+                return separator.join(self.resolve_commit(repo_cmd, rev) if rev else ""
+                                      for rev in (start, end))
+        return self.resolve_commit(repo_cmd, rev_range)
+
+    def classify_commit(self, name, commit):
+        # the result of a single commit as in the result files of 'main' (from the commit
+        # cache of the project if the commit was already analyzed)
+        repo_cmd = self.get_repo_cmd(name)
+        commit = self.resolve_commit(repo_cmd, commit)
+        commit_cache = None if self.args.no_cache else self.get_commit_cache(name)
+        commit_res = None if commit_cache is None else commit_cache.get_results([commit]).get(
+            commit)
+        cached = commit_res is not None
+        if not cached:
+            try:
+                commit_res = main.analyze_single_commit(repo_cmd, commit, self.sql_classifier,
+                                                        self.blob_cache, self.args.diff_engine)
+            except ValueError as e:
+                raise LookupError(str(e)) from e
+            if commit_cache is not None:
+                commit_cache.add_result(commit, commit_res)
+                commit_cache.flush()
+        return {"project": name, "commit": commit, "cached": cached, "result": commit_res}
+
+    def refresh_project(self, name, query_args=None):
+        # the analysis of the project as by 'main' (e.g. of the new commits), with the warm
+        # classifier and caches; query_args: e.g. 'since' (see 'QUERY_PARAMS')
+        repo_cmd = self.get_repo_cmd(name)
+        query_args = dict(query_args or {})
+        if query_args.get("rev_range") is not None:
+            query_args["rev_range"] = self.resolve_range(repo_cmd, query_args["rev_range"])
+        args = argparse.Namespace(**{**vars(self.args), **query_args})
+        start = time.perf_counter()
+        path_prefix = main.analyze_project_commits(self.projects[name], self.sql_classifier,
+                                                   self.regex_hash, self.results_dir_path, args,
+                                                   blob_cache=self.blob_cache)
+        if self.blob_cache is not None:
+            self.blob_cache.flush()
+        return {"project": name, "seconds": round(time.perf_counter() - start, 3),
+                "results": path_prefix}
+
+    def get_status(self):
+        return {"projects": sorted(self.projects), "warm_projects": sorted(self.repo_cmds),
+                "uptime_seconds": round(time.time() - self.started, 3),
+                "requests": self.requests_num}
+
+    def close(self):
+        for commit_cache in self.commit_caches.values():
+            commit_cache.close()
+        self.commit_caches = {}
+        if self.blob_cache is not None:
+            self.blob_cache.close()
+        gitpool.close_pools()
+
+
+def get_param(params, name):
+    values = params.get(name)
+    if not values:
+        raise RequestError(f"missing parameter '{name}'")
+    return values[-1]
+
+
+def handle_classify(service, params):
+    return service.classify_commit(get_param(params, "project"), get_param(params, "commit"))
+
+
+def handle_refresh(service, params):
+    query_args = {name: params[name][-1] for name in QUERY_PARAMS if name in params}
+    if "path" in params:
+        query_args["paths"] = params["path"]
+    return service.refresh_project(get_param(params, "project"), query_args)
+
+
+def handle_status(service, _params):
+    return service.get_status()
+
+
+# (method, path) -> handler(service, query parameters) returning the JSON response
+ROUTES = {("GET", "/status"): handle_status,
+          ("GET", "/classify"): handle_classify,
+          ("POST", "/refresh"): handle_refresh}
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    # JSON responses; errors: {"error": message} with the status 400, 401, 404 or 500
+    # (the details of the failures of git and of unexpected errors are only logged)
+
+    def do_GET(self):
+        self.handle_route("GET")
+
+    def do_POST(self):
+        self.handle_route("POST")
+
+    def is_authorized(self):
+        # (all requests to the HTTP server, including 'shutdown', need its token)
+        if self.server.token is None:
+            return True
+        return hmac.compare_digest(self.headers.get(TOKEN_HEADER, "").encode("utf-8"),
+                                   self.server.token.encode("utf-8"))
+
+    def handle_route(self, method):
+        url = urlsplit(self.path)
+        if not self.is_authorized():
+            self.send_json(401, {"error": f"missing or invalid header '{TOKEN_HEADER}'"})
+            return
+        if (method, url.path) == ("POST", "/shutdown"):
+            self.send_json(200, {"shutdown": True})
+            # (from another thread, 'shutdown' waits for the end of 'serve_forever')
+            threading.Thread(target=self.server.shutdown).start()
+            return
+        route = ROUTES.get((method, url.path))
+        if route is None:
+            self.send_json(404, {"error": f"unknown request '{method} {url.path}'"})
+            return
+        self.server.service.requests_num += 1
+        try:
+            self.send_json(200, route(self.server.service, parse_qs(url.query)))
+        except RequestError as e:
+            self.send_json(400, {"error": str(e)})
+        except LookupError as e:
+            self.send_json(404, {"error": str(e.args[0]) if e.args else repr(e)})
+        except (gitpool.GitProcessError, git.exc.GitCommandError) as e:
+            self.log_error("git failed: %r", e)
+            self.send_json(500, {"error": "git failed for the request"})
+        except Exception as e:  # pylint: disable=broad-except
+            self.log_error("request failed: %r", e)
+            self.send_json(500, {"error": f"internal error ({type(e).__name__})"})
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # (no client address on a Unix socket)
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "local"
+
+
+class AnalysisHTTPServer(HTTPServer):
+    # the requests need the random token of the server in the header 'TOKEN_HEADER' (other
+    # local users and web pages can reach the port); the token is written to 'token_path'
+    # (readable only by the user) for the clients
+
+    def __init__(self, server_address, service, token_path=None):
+        self.service = service
+        self.token = secrets.token_hex(16)
+        self.token_path = token_path
+        super().__init__(server_address, RequestHandler)
+        if token_path is not None:
+            if os.path.exists(token_path):
+                os.remove(token_path)
+            token_fd = os.open(token_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(token_fd, "w", encoding="utf-8") as token_f:
+                token_f.write(self.token)
+
+    def server_close(self):
+        super().server_close()
+        if self.token_path is not None and os.path.exists(self.token_path):
+            os.remove(self.token_path)
+
+
+class UnixHTTPServer(socketserver.UnixStreamServer):
+    # (no token: only the user may connect to the socket)
+
+    def __init__(self, socket_path, service):
+        self.service = service
+        self.token = None
+        super().__init__(socket_path, RequestHandler)
+
+    def server_bind(self):
+        # (a socket file left by a previous daemon is replaced; only the user may connect)
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        super().server_bind()
+        os.chmod(self.server_address, 0o600)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+def create_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None,
+                  token_path=None):
+    # a Unix socket if 'socket_path' is given, otherwise HTTP on 'host':'port'
+    # (port 0: any free port, see 'server.server_address'; the token: 'server.token')
+    if socket_path is not None:
+        return UnixHTTPServer(socket_path, service)
+    return AnalysisHTTPServer((host, port), service, token_path)
+
+
+def serve(server):
+    # (the service is closed by the thread of the server, which opened its connections)
+    try:
+        server.serve_forever()
+    finally:
+        server.service.close()
+        server.server_close()
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+
+    def __init__(self, socket_path, timeout=60):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def read_token(token_path=DEFAULT_TOKEN_FILE):
+    # the token of the HTTP server written by 'main_daemon'
+    with open(token_path, encoding="utf-8") as token_f:
+        return token_f.read().strip()
+
+
+def request(address, method, path, params=None, timeout=600, token=None):
+    # a request to the daemon at 'address' ((host, port) or the path of the Unix socket);
+    # token: the token of the HTTP server (see 'read_token');
+    # returns the HTTP status and the JSON response
+    if isinstance(address, str):
+        conn = UnixHTTPConnection(address, timeout)
+    else:
+        conn = http.client.HTTPConnection(*address, timeout=timeout)
+    headers = {} if token is None else {TOKEN_HEADER: token}
+    try:
+        conn.request(method, path + ("?" + urlencode(params, doseq=True) if params else ""),
+                     headers=headers)
+        response = conn.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        conn.close()
+
+
+def parse_args(argv=None):
+    # the options of the daemon and (the rest) the analysis options of 'main'
+    parser = argparse.ArgumentParser(
+        description="Answer requests for the analysis of the projects with warm repositories "
+                    "and caches (GET /status, GET /classify?project=P&commit=C, "
+                    "POST /refresh?project=P[&since=DATE&until=DATE&rev_range=A..B&path=PATH], "
+                    "POST /shutdown; over HTTP with the token of the server in the header "
+                    f"'{TOKEN_HEADER}'); the other options are those of 'main.py'")
+    parser.add_argument("--host", default=DEFAULT_HOST,
+                        help="address of the HTTP server (only local by default)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                        help="port of the HTTP server")
+    parser.add_argument("--socket", metavar="PATH",
+                        help="listen on a Unix socket instead of HTTP")
+    parser.add_argument("--token-file", default=DEFAULT_TOKEN_FILE, metavar="PATH",
+                        help="file for the token of the HTTP server (readable only by the user)")
+    daemon_args, analysis_argv = parser.parse_known_args(argv)
+    return daemon_args, main.parse_args(analysis_argv)
+
+
+def main_daemon(argv=None):
+    daemon_args, analysis_args = parse_args(argv)
+    server = create_server(AnalysisService(analysis_args), daemon_args.host, daemon_args.port,
+                           daemon_args.socket, os.path.abspath(daemon_args.token_file))
+    if daemon_args.socket is not None:
+        print(f"Listening on {daemon_args.socket}", file=sys.stderr)
+    else:
+        print("Listening on http://{}:{} (token in {})".format(*server.server_address[:2],
+                                                              server.token_path),
+              file=sys.stderr)
+    try:
+        serve(server)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main_daemon()
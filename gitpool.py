@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import queue
+import threading
+import subprocess
+from collections import deque
+from contextlib import contextmanager
+import metrics
+
+# (as 'git.compat.defenc', without importing GitPython, see 'cli')
+defenc = sys.getfilesystemencoding()
+# (a line that is not an object name: echoed by 'git diff-tree --stdin' after the output of
+# the commit before it)
+END_MARKER = "--end--"
+# the requests written at once to a process (so that its input pipe never fills up while
+# its output is not read)
+BATCH_SIZE = 256
+# restarts of a failed process for the same request
+MAX_RESTARTS = 1
+
+# the persistent process pools of the repositories in this process (see 'get_pool')
+POOLS = {}
+POOLS_LOCK = threading.Lock()
+
+
+class GitProcessError(Exception):
+    pass
+
+
+class GitBatchProcess:
+    # a long-running git process reading one request per line from stdin; a process that
+    # exited, was inherited by a forked process or returned an unexpected response is
+    # restarted and the request is sent again
+
+    def __init__(self, repo_path, command):
+        self.repo_path = repo_path
+        self.command = command
+        self.proc = None
+        self.pid = None
+        self.stderr_lines = deque(maxlen=20)
+
+    def start(self):
+        # (not 'git.cmd.Git.execute' with 'as_process': its handle kills the process when
+        # it is collected, also in a forked worker process)
+        self.proc = subprocess.Popen(self.command, cwd=self.repo_path, stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        self.pid = os.getpid()
+        # stderr is read in the background, so that git never blocks on a full pipe
+        threading.Thread(target=self.stderr_lines.extend, args=(self.proc.stderr,),
+                         daemon=True).start()
+
+    def is_alive(self):
+        return self.proc is not None and self.pid == os.getpid() and self.proc.poll() is None
+
+    def stop(self, timeout=5):
+        # (the processes of a parent process are left alone)
+        if self.proc is None or self.pid != os.getpid():
+            self.proc = None
+            return
+        try:
+            self.proc.stdin.close()
+            self.proc.wait(timeout)
+        except (OSError, subprocess.TimeoutExpired):
+            self.proc.kill()
+            self.proc.wait()
+        self.proc.stdout.close()
+        self.proc = None
+
+    def kill(self):
+        # (the rest of the output of the current request is unknown)
+        self.proc.kill()
+        self.proc.wait()
+
+    def request(self, lines, read_response):
+        # writes the request lines and returns 'read_response(stdout)'
+        for _ in range(MAX_RESTARTS + 1):
+            if not self.is_alive():
+                if self.proc is not None:
+                    metrics.count("git_process_restarts", per_commit=False)
+                    self.stop()
+                self.start()
+            try:
+                self.proc.stdin.write("".join(f"{line}\n" for line in lines).encode(defenc))
+                self.proc.stdin.flush()
+                return read_response(self.proc.stdout)
+            except (OSError, ValueError, GitProcessError) as e:
+                error = e
+                self.kill()
+        raise GitProcessError(f"'{' '.join(self.command)}' failed: {error} "
+                              f"{b''.join(self.stderr_lines).decode(defenc, 'replace')}")
+
+
+def read_line(stdout):
+    line = stdout.readline()
+    if not line.endswith(b"\n"):
+        raise GitProcessError("unexpected end of the output")
+    return line[:-1]
+
+
+def read_object(stdout, name, with_data):
+    # '<object> <type> <size>\n[<data>\n]' or '<name> missing' (None)
+    header = read_line(stdout).decode(defenc).split(" ")
+    if header[-1] in ("missing", "ambiguous"):
+        return None
+    if len(header) != 3 or not header[2].isdigit() or (
+            len(name) == len(header[0]) and name != header[0]):
+        raise GitProcessError(f"unexpected response for {name}: {' '.join(header)}")
+    type_, size = header[1], int(header[2])
+    if not with_data:
+        return type_, size
+    data = stdout.read(size)
+    if len(data) != size or stdout.read(1) != b"\n":
+        raise GitProcessError(f"incomplete data of {name}")
+    return data
+
+
+def read_until_end_marker(stdout):
+    lines = []
+    end_line = END_MARKER.encode(defenc)
+    while True:
+        line = read_line(stdout)
+        if line == end_line:
+            return lines
+        lines.append(line)
+
+
+class GitProcessPool:
+    # persistent git processes of a repository instead of a new process per git command:
+    # 'git cat-file --batch' (blobs), 'git cat-file --batch-check' (types and sizes) and
+    # 'git diff-tree --stdin' (one process per list of options); up to 'size' processes
+    # of each kind, each used by one thread at a time
+
+    def __init__(self, repo_path, size=1):
+        self.repo_path = repo_path
+        self.size = size
+        self.idle_processes = {}
+        self.processes = {}
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @contextmanager
+    def acquire(self, command):
+        key = tuple(command)
+        with self.lock:
+            idle_processes = self.idle_processes.setdefault(key, queue.LifoQueue())
+            processes = self.processes.setdefault(key, [])
+            process = None
+            if idle_processes.empty() and len(processes) < self.size:
+                process = GitBatchProcess(self.repo_path, command)
+                processes.append(process)
+        if process is None:
+            process = idle_processes.get()
+        try:
+            yield process
+        finally:
+            idle_processes.put(process)
+
+    def iter_objects(self, names, with_data):
+        command = ["git", "cat-file", "--batch" if with_data else "--batch-check"]
+        for start in range(0, len(names), BATCH_SIZE):
+            batch = names[start:start + BATCH_SIZE]
+            with self.acquire(command) as process:
+                yield from process.request(
+                    batch, lambda stdout, batch=batch: [read_object(stdout, name, with_data)
+                                                        for name in batch])
+
+    def get_blobs(self, blobs):
+        # the data of the blobs (requested together; b"" for the null blob)
+        names = [blob for blob in blobs if set(blob) != {"0"}]
+        blobs_data = dict(zip(names, self.iter_objects(names, True)))
+        for blob, data in blobs_data.items():
+            if data is None:
+                raise ValueError(f"blob {blob} not found")
+        return [blobs_data.get(blob, b"") for blob in blobs]
+
+    def get_blob(self, blob):
+        return self.get_blobs([blob])[0]
+
+    def get_object_info(self, names):
+        # (type, size) of the objects (None if not found)
+        return list(self.iter_objects(list(names), False))
+
+    def get_diff_tree_lines(self, options, commit):
+        # the output lines of 'git diff-tree <options> <commit>' (without the commit line)
+        command = ["git", "diff-tree", "--stdin", "--always"] + options
+        with self.acquire(command) as process:
+            lines = process.request([commit, END_MARKER], read_until_end_marker)
+        # (an unknown commit has no output)
+        if len(lines) == 0 or not lines[0].decode(defenc).startswith(commit):
+            raise ValueError(f"commit {commit} not found")
+        return b"\n".join(lines[1:]).decode(defenc, "surrogateescape").split("\n")
+
+    def close(self):
+        with self.lock:
+            for processes in self.processes.values():
+                for process in processes:
+                    process.stop()
+            self.processes = {}
+            self.idle_processes = {}
+
+
+def get_pool(repo_cmd, size=1):
+    # the pool of the repository in this process (a forked worker process starts its own
+    # processes); 'size': the processes of each kind at least (e.g. for the fetch threads)
+    key = (os.getpid(), repo_cmd.working_dir)
+    with POOLS_LOCK:
+        pool = POOLS.get(key)
+        if pool is None:
+            pool = POOLS[key] = GitProcessPool(repo_cmd.working_dir, size)
+        pool.size = max(pool.size, size)
+    return pool
+
+
+def close_pools():
+    # (the pools of this process)
+    with POOLS_LOCK:
+        keys = [key for key in POOLS if key[0] == os.getpid()]
+        pools = [POOLS.pop(key) for key in keys]
+    for pool in pools:
+        pool.close()
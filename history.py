@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+
+import secrets
+import itertools
+import subprocess
+import threading
+from collections import namedtuple
+import metrics
+import xdiff
+import gitpool
+
+defenc = gitpool.defenc
+# same options as used by 'main.get_commit_file_diff_text'
+DIFF_OPTIONS = ["--ignore-space-at-eol", "-b", "-w", "--ignore-blank-lines", "-U0"]
+# 'python': diffs of the blobs computed in-process (see 'xdiff'), 'git': diffs read from git
+DIFF_ENGINES = ["python", "git"]
+NULL_MODE = "000000"
+# the options of the statuses (with renames, as with 'git show --name-status')
+# and of the diffs of the SQL files (without renames, as with 'git show -- <file>')
+STATUS_OPTIONS = ["--raw", "--no-abbrev"]
+PATCH_OPTIONS = ["-p", "--no-renames", "--src-prefix=a/", "--dst-prefix=b/"] + DIFF_OPTIONS
+# ('git diff-tree' compares the root commits with nothing and finds the renames
+# only with these options, unlike 'git log'; '--no-renames' comes later)
+DIFF_TREE_OPTIONS = ["-r", "--root", "-M"]
+
+# the commits of the analysis, selected by the 'git log' walk itself (see 'get_log_args'):
+# rev_range: revisions such as 'v1.0..v2.0' (by default HEAD); since/until: the window of
+# the commit dates (any date accepted by git, e.g. '2 weeks ago'); paths: the directories
+# or SQL files whose changes are analyzed (by default all SQL files); refs: the branches
+# whose histories are walked together, each commit once (if there is no 'rev_range')
+CommitQuery = namedtuple("CommitQuery", ["rev_range", "since", "until", "paths", "refs"],
+                         defaults=[None, None, None, None, None])
+
+# diff_txt_dict: SQL file -> diff text (None if the diffs of the commit were not read)
+# blobs_dict: file -> (old blob, new blob) of the diff without renames
+# modes_dict: file -> (old mode, new mode) of the diff without renames
+# changed_files_num: number of all changed files (if 'type_files_lst' holds only the SQL files)
+CommitRecord = namedtuple("CommitRecord", ["commit", "type_files_lst", "diff_txt_dict",
+                                           "blobs_dict", "modes_dict", "changed_files_num"],
+                          defaults=[None, None])
+
+
+def get_sql_pathspecs(paths=None):
+    # (a directory matches the SQL files at any depth below it, '*' also matches '/')
+    if not paths:
+        return ["*.sql"]
+    return [path if path.endswith(".sql") else path.rstrip("/") + "/*.sql" for path in paths]
+
+
+def check_revisions(revisions):
+    # (a revision starting with '-' would be an option of git, e.g. '--output=<file>')
+    for revision in revisions:
+        if revision.startswith("-"):
+            raise ValueError(f"Invalid revision: '{revision}'")
+    return list(revisions)
+
+
+def get_log_args(query=None):
+    # the revisions, limits and pathspecs of the 'git log' walk of the query: git stops the
+    # walk at the bounds, so that the cost depends on the size of the window and not on
+    # the length of the history
+    query = query or CommitQuery()
+    args = []
+    if query.since is not None:
+        args.append(f"--since={query.since}")
+    if query.until is not None:
+        args.append(f"--until={query.until}")
+    pathspecs = get_sql_pathspecs(query.paths)
+    # ('--follow' works only with a single pathspec)
+    if len(pathspecs) == 1:
+        args.append("--follow")
+    if query.rev_range is not None:
+        args += ["--end-of-options"] + check_revisions([query.rev_range])
+    elif query.refs is not None:
+        args += ["--end-of-options"] + check_revisions(query.refs)
+    return args + ["--"] + pathspecs
+
+
+def get_commit_refs(repo_cmd, refs, since=None):
+    # commit -> the bits of the refs containing it (bit i: refs[i]) for all commits of the refs,
+    # from a single walk of the union of their histories with the children before the parents
+    # (the cost grows with the number of unique commits, not with the refs times the history);
+    # since: the walk stops at the commits before the date (as for 'CommitQuery.since'; the
+    # commits after 'until' are walked, as the bits come from the tips)
+    commit_refs = {}
+    refs = check_revisions(refs)
+    tips = repo_cmd.execute(["git", "rev-parse"] + [f"{ref}^{{commit}}" for ref in refs])
+    for ref_id, tip in enumerate(tips.split("\n")):
+        commit_refs[tip] = commit_refs.get(tip, 0) | (1 << ref_id)
+    limits = [] if since is None else [f"--since={since}"]
+    graph_txt = repo_cmd.execute(["git", "rev-list", "--topo-order", "--parents"] + limits +
+                                 ["--end-of-options"] + refs)
+    for line in graph_txt.splitlines():
+        commit, *parents = line.split(" ")
+        ref_bits = commit_refs.get(commit, 0)
+        for parent in parents:
+            commit_refs[parent] = commit_refs.get(parent, 0) | ref_bits
+    return commit_refs
+
+
+def parse_name_status(name_status_lines):
+    type_files_lst = []
+    for fc in name_status_lines:
+        if fc.startswith("R"):
+            type_, _, new_path = fc.split("\t")
+        else:
+            type_, curr_path = fc.split("\t")
+            new_path = curr_path
+        type_files_lst.append((type_, new_path))
+    return type_files_lst
+
+
+def parse_raw_line(line):
+    # ':<old mode> <new mode> <old blob> <new blob> <type>\t<path>[\t<new path>]'
+    # -> type, old path, new path, (old blob, new blob), (old mode, new mode)
+    info, *paths = line.split("\t")
+    old_mode, new_mode, old_blob, new_blob, type_ = info.split(" ")
+    old_mode = old_mode[1:]
+    if type_.startswith("R"):
+        # the file is compared with nothing (as with 'git show -- <new path>')
+        old_mode, old_blob = NULL_MODE, "0" * len(old_blob)
+    return type_, paths[0], paths[-1], (old_blob, new_blob), (old_mode, new_mode)
+
+
+def parse_raw(raw_lines):
+    type_files_lst = []
+    blobs_dict = {}
+    modes_dict = {}
+    for line in raw_lines:
+        type_, _, new_path, blob_pair, mode_pair = parse_raw_line(line)
+        type_files_lst.append((type_, new_path))
+        blobs_dict[new_path] = blob_pair
+        modes_dict[new_path] = mode_pair
+    return type_files_lst, blobs_dict, modes_dict
+
+
+def strip_path_prefix(path):
+    # 'b/<path>' or '"b/<path>"' (quoted) -> '<path>' or '"<path>"'
+    if path.startswith('"'):
+        return '"' + path[3:]
+    return path[2:]
+
+
+def get_diff_header_path(header_line):
+    # "diff --git a/<path> b/<path>" (without renames both paths are equal, possibly quoted)
+    paths = header_line[len("diff --git "):]
+    return strip_path_prefix(paths[(len(paths) + 1) // 2:])
+
+
+def get_extended_header_path(line):
+    # the new path of a line of the header of a file section ('rename to <path>' or
+    # '+++ b/<path>'; the paths of a rename differ, so 'get_diff_header_path' does not apply;
+    # git ends the '+++' line with a TAB if the path has a space, a path with a TAB is quoted)
+    if line.startswith("rename to "):
+        return line[len("rename to "):]
+    if line.startswith("+++ ") and line != "+++ /dev/null":
+        return strip_path_prefix(line[len("+++ "):].rstrip("\t"))
+    return None
+
+
+def get_rename_similarity(diff_txt):
+    # the similarity index (in percent) of a file section of a patch with renames
+    # (e.g. of 'git show'), None if the file is not renamed
+    similarity = None
+    for line in diff_txt.split("\n")[1:]:
+        if line.startswith("@@"):
+            break
+        if line.startswith("similarity index "):
+            similarity = int(line[len("similarity index "):].rstrip("%"))
+        elif line.startswith("rename from "):
+            return 100 if similarity is None else similarity
+    return None
+
+
+def split_file_sections(diff_lines):
+    # split the patch of one commit into the texts of the single files
+    # (keyed by the new paths, also of the renamed files)
+    diff_txt_dict = {}
+    path, section, in_header = None, [], False
+    for line in diff_lines:
+        if line.startswith("diff --git "):
+            if path is not None:
+                diff_txt_dict[path] = "\n".join(section)
+            path, section, in_header = get_diff_header_path(line), [line], True
+        elif path is not None:
+            if in_header:
+                if line.startswith("@@"):
+                    in_header = False
+                else:
+                    path = get_extended_header_path(line) or path
+            section.append(line)
+    if path is not None:
+        diff_txt_dict[path] = "\n".join(section)
+    return diff_txt_dict
+
+
+def get_chunk_marker():
+    # the start of the output of each commit: a NUL byte and a random token, which the
+    # content cannot contain by chance (NUL bytes after the binary check of git, i.e. the
+    # first 8000 bytes, are in the text diffs)
+    return b"\0" + secrets.token_hex(8).encode("ascii")
+
+
+def start_git_log(repo_cmd, options, commits, marker):
+    # a single long-lived 'git log' process for the given commits (in the given order)
+    command = ["git", "log", "--no-walk=unsorted", "--stdin",
+               f"--format=%x00{marker[1:].decode('ascii')}%H"] + options
+    proc = repo_cmd.execute(command, as_process=True, istream=subprocess.PIPE)
+    # stderr is read in the background, so that git never blocks on a full pipe
+    stderr_chunks = []
+    stderr_thread = threading.Thread(target=lambda: stderr_chunks.extend(proc.stderr),
+                                     daemon=True)
+    stderr_thread.start()
+    proc.stdin.write("".join(f"{commit}\n" for commit in commits).encode(defenc))
+    proc.stdin.close()
+    return proc, stderr_thread, stderr_chunks
+
+
+def wait_git_log(proc, stderr_thread, stderr_chunks):
+    stderr_thread.join()
+    proc.wait(stderr=b"".join(stderr_chunks))
+
+
+def get_commit_chunk(data):
+    # the commit and the lines of its output (after the marker of the format)
+    lines = data.decode(defenc, "surrogateescape").split("\n")
+    if len(lines) > 1 and lines[-1] == "":
+        lines.pop()
+    return lines[0], lines[1:]
+
+
+def iter_commit_chunks(proc, marker, bytes_counter=None, read_size=1 << 16):
+    # the output is read in blocks and split at the markers before the commits (see
+    # 'get_chunk_marker'), each commit is decoded once; the end of a block that may be the
+    # start of a marker is kept for the next block;
+    # ('bytes_counter': the counter of the metrics for the bytes of each commit)
+    data_blocks = []
+    first_chunk = True
+    pending = b""
+    for block in iter(lambda: proc.stdout.read1(read_size), b""):
+        block = pending + block
+        start = 0
+        end = block.find(marker)
+        while end != -1:
+            data_blocks.append(block[start:end])
+            if not first_chunk:
+                data = b"".join(data_blocks)
+                if bytes_counter is not None:
+                    metrics.count(bytes_counter, len(data) + len(marker))
+                yield get_commit_chunk(data)
+            first_chunk = False
+            data_blocks = []
+            start = end + len(marker)
+            end = block.find(marker, start)
+        keep = max(start, len(block) - len(marker) + 1)
+        data_blocks.append(block[start:keep])
+        pending = block[keep:]
+    data_blocks.append(pending)
+    if not first_chunk:
+        data = b"".join(data_blocks)
+        if bytes_counter is not None:
+            metrics.count(bytes_counter, len(data) + len(marker))
+        yield get_commit_chunk(data)
+
+
+def iter_git_log_chunks(repo_cmd, options, commits, bytes_counter=None):
+    if len(commits) == 0:
+        return
+    marker = get_chunk_marker()
+    log = start_git_log(repo_cmd, options, commits, marker)
+    yield from iter_commit_chunks(log[0], marker, bytes_counter)
+    wait_git_log(*log)
+
+
+def iter_status_records(repo_cmd, commits):
+    # the type/status of all files of the commits (with renames) and their blobs
+    for commit, lines in iter_git_log_chunks(repo_cmd, STATUS_OPTIONS, commits,
+                                              "git_status_bytes"):
+        type_files_lst, blobs_dict, modes_dict = parse_raw([line for line in lines if line != ""])
+        yield CommitRecord(commit, type_files_lst, None, blobs_dict, modes_dict)
+
+
+def get_status_record(repo_cmd, commit):
+    # the status record of a single commit (by the persistent 'git diff-tree' process
+    # of the repository, see 'gitpool'), e.g. instead of 'main.get_change_type'
+    with metrics.timer("git_diff_tree"):
+        lines = gitpool.get_pool(repo_cmd).get_diff_tree_lines(
+            DIFF_TREE_OPTIONS + STATUS_OPTIONS, commit)
+    type_files_lst, blobs_dict, modes_dict = parse_raw([line for line in lines if line != ""])
+    return CommitRecord(commit, type_files_lst, None, blobs_dict, modes_dict)
+
+
+def get_diff_txt_dict(repo_cmd, commit):
+    # the diffs of the SQL files of a single commit (see 'get_status_record'), e.g. instead of
+    # 'main.get_commit_file_diff_text' for each file
+    with metrics.timer("git_diff_tree"):
+        lines = gitpool.get_pool(repo_cmd).get_diff_tree_lines(
+            DIFF_TREE_OPTIONS + PATCH_OPTIONS + ["--", "*.sql"], commit)
+    return split_file_sections(lines)
+
+
+def get_blob_diff_text(data_1, data_2, old_mode, new_mode):
+    # the diff text of a file as in the output of git (the file headers shown by git
+    # even without hunks and the hunks)
+    header_lines = []
+    if old_mode == NULL_MODE:
+        header_lines.append(f"new file mode {new_mode}")
+    elif new_mode == NULL_MODE:
+        header_lines.append(f"deleted file mode {old_mode}")
+    elif old_mode != new_mode:
+        header_lines.extend([f"old mode {old_mode}", f"new mode {new_mode}"])
+    if xdiff.is_binary(data_1) or xdiff.is_binary(data_2):
+        if data_1 != data_2:
+            header_lines.append("Binary files differ")
+        return "\n".join(header_lines)
+    hunks_txt = xdiff.get_hunks_text(data_1, data_2, defenc)
+    if hunks_txt == "":
+        return "\n".join(header_lines)
+    return "\n".join(header_lines + [hunks_txt])
+
+
+class BlobDiffs:
+    # the 'diff_txt_dict' of a commit for the 'python' diff engine: the diffs are computed
+    # from the blobs (read by the persistent 'git cat-file' processes, see 'gitpool')
+    # only for the requested files
+
+    def __init__(self, repo_cmd, record):
+        self.repo_cmd = repo_cmd
+        self.record = record
+        # blobs read ahead (see 'prefetch')
+        self.blob_data = {}
+
+    def read_blobs(self, blobs):
+        if len(blobs) == 0:
+            return []
+        with metrics.timer("blob_read"):
+            blobs_data = gitpool.get_pool(self.repo_cmd).get_blobs(blobs)
+        metrics.count("blob_bytes", sum(len(data) for data in blobs_data))
+        return blobs_data
+
+    def is_diffed_by_git(self, path):
+        # submodules and type changes (e.g. file -> symlink) are diffed by git
+        old_mode, new_mode = self.record.modes_dict[path]
+        return "160000" in (old_mode, new_mode) or (
+            NULL_MODE not in (old_mode, new_mode) and
+            int(old_mode, 8) & 0o170000 != int(new_mode, 8) & 0o170000)
+
+    def prefetch(self, paths):
+        # reads the blobs of the files ahead, together (e.g. in a fetch thread,
+        # see 'main.iter_pipelined_records')
+        blobs = list(dict.fromkeys(blob for path in paths
+                                   if path in self.record.blobs_dict and
+                                   not self.is_diffed_by_git(path)
+                                   for blob in self.record.blobs_dict[path]
+                                   if blob not in self.blob_data))
+        self.blob_data.update(zip(blobs, self.read_blobs(blobs)))
+
+    def get(self, path, default=None):
+        if path not in self.record.blobs_dict:
+            return default
+        if self.is_diffed_by_git(path):
+            with metrics.timer("git_show"):
+                diff_txt = self.repo_cmd.execute(["git", "show", self.record.commit, "--oneline"] +
+                                                 DIFF_OPTIONS + ["--", path])
+            return "\n".join(diff_txt.split("\n")[1:])
+        (old_blob, new_blob), (old_mode, new_mode) = (self.record.blobs_dict[path],
+                                                      self.record.modes_dict[path])
+        blobs = [blob for blob in dict.fromkeys([old_blob, new_blob]) if blob not in self.blob_data]
+        self.blob_data.update(zip(blobs, self.read_blobs(blobs)))
+        data_1, data_2 = self.blob_data[old_blob], self.blob_data[new_blob]
+        for blob in {old_blob, new_blob}:
+            del self.blob_data[blob]
+        with metrics.timer("blob_diff"):
+            return get_blob_diff_text(data_1, data_2, old_mode, new_mode)
+
+
+def iter_diff_records(repo_cmd, status_records, diff_commits):
+    # the status records with the diffs of the SQL files of 'diff_commits' (in their order)
+    diff_commits_set = set(diff_commits)
+    diff_chunks = iter_git_log_chunks(repo_cmd, PATCH_OPTIONS + ["--", "*.sql"], diff_commits,
+                                      "git_diff_bytes")
+    # commits without (SQL) changes are omitted in the diff output
+    next_diff = next(diff_chunks, None)
+    for record in status_records:
+        if record.commit in diff_commits_set:
+            diff_txt_dict = {}
+            if next_diff is not None and next_diff[0] == record.commit:
+                diff_txt_dict = split_file_sections(next_diff[1])
+                next_diff = next(diff_chunks, None)
+            record = record._replace(diff_txt_dict=diff_txt_dict)
+        yield record
+    for _ in diff_chunks:
+        pass
+
+
+def iter_commit_records(repo_cmd, commits, need_diff=None, diff_engine="git",
+                        status_records=None, need_diff_chunk_size=1000):
+    # replaces 'get_change_type' and 'get_commit_file_diff_text' for every commit/file
+    # by two git processes: one for the status of all files (with renames)
+    # and one for the diffs of the SQL files (without renames, as with 'git show -- <file>');
+    # with 'need_diff' (record -> bool) the statuses are read in chunks of
+    # 'need_diff_chunk_size' commits and only the diffs of the selected commits of a chunk
+    # are read (by a git process per chunk, so that the statuses are not all kept in memory);
+    # with the 'python' diff engine only the statuses are read from git;
+    # 'status_records' (e.g. from 'sqlindex.SQLChangeIndex') replace the statuses of git
+    if status_records is None:
+        status_records = iter_status_records(repo_cmd, commits)
+    if diff_engine == "python":
+        for record in status_records:
+            yield record._replace(diff_txt_dict=BlobDiffs(repo_cmd, record))
+        return
+    if need_diff is None:
+        yield from iter_diff_records(repo_cmd, status_records, commits)
+        return
+    status_records = iter(status_records)
+    for chunk in iter(lambda: list(itertools.islice(status_records, need_diff_chunk_size)), []):
+        yield from iter_diff_records(repo_cmd, chunk,
+                                     [record.commit for record in chunk if need_diff(record)])
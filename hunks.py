@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+
+import re
+from collections import namedtuple
+
+HUNK_HEADER_REGEX = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+class Hunk(namedtuple("Hunk", ["old_start", "old_count", "new_start", "new_count", "lines"])):
+    # 'lines' holds the changed lines of the hunk (with their +/- prefix) in the diff order
+    __slots__ = ()
+
+    @property
+    def removed_lines(self):
+        return [line[1:] for line in self.lines if line.startswith("-")]
+
+    @property
+    def added_lines(self):
+        return [line[1:] for line in self.lines if line.startswith("+")]
+
+
+def parse_hunk_header(header_line):
+    # '@@ -<start>[,<count>] +<start>[,<count>] @@' (the count is 1 if omitted)
+    match = HUNK_HEADER_REGEX.match(header_line)
+    if match is None:
+        return None, None, None, None
+    old_start, old_count, new_start, new_count = match.groups()
+    return (int(old_start), 1 if old_count is None else int(old_count),
+            int(new_start), 1 if new_count is None else int(new_count))
+
+
+def iter_hunks(diff_txt):
+    # single pass over the diff; everything before the first @@-line (file headers) is skipped
+    header, lines = None, []
+    for line in diff_txt.split("\n"):
+        if line.startswith("@@ "):
+            if header is not None:
+                yield Hunk(*parse_hunk_header(header), lines)
+            header, lines = line, []
+        elif header is not None and (line.startswith("+") or line.startswith("-")):
+            lines.append(line)
+    if header is not None:
+        yield Hunk(*parse_hunk_header(header), lines)
@@ -2,41 +2,41 @@
 
 import os
 import re
+import json
+import hashlib
+import sys
+import math
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import git
-import pandas as pd
-from tqdm import tqdm
 import prep
+import history
+import classifier
+import cache
+import metrics
+import sqlindex
+import pipeline
+import gitpool
+import sqllexer
 
 HOME_DIR = os.getcwd()
 
 
 def prepare_changed_blocks(diff_txt):
-    # get a list of blocks starting with @@ (and remove these @@-lines at the end)
-    diff_txt_lst = diff_txt.split("\n")
-    ids = [diff_txt_lst.index(line) for line in
-           diff_txt_lst if line.startswith("@@ ")] + [len(diff_txt_lst)]
-    blocks_lst = [diff_txt_lst[id1+1:id2] for id1, id2 in zip(ids, ids[1:])]
-    # modify blocks (make lowercase; remove +/-, leading/trailing chars and empty lines)
-    blocks_mod_lst = []
-    for block in blocks_lst:
-        block_mod = []
-        for line in block:
-            if line.startswith("+") or line.startswith("-"):
-                line = line[1:].strip()
-                if line != "":
-                    block_mod.append(line.lower())
-        if len(block_mod) > 0:
-            blocks_mod_lst.append("\n".join(block_mod))
-    return blocks_mod_lst
+    # get a list of blocks starting with @@ (single pass, see 'hunks.iter_hunks')
+    # and modify them (make lowercase; remove +/-, leading/trailing chars and empty lines)
+    return ["\n".join(block_lines) for block_lines in classifier.prepare_changed_lines(diff_txt)]
 
 
-def check_modify_changed_blocks(blocks_lst, regex, category):
+def check_modify_changed_blocks(blocks_lst, regex, category, comments_lexer=True):
     blocks_mod_lst = []
     for block in blocks_lst:
         block_mod = []
-        # remove single-line and multi-line comments
+        # remove single-line and multi-line comments (see 'sqllexer')
         if category == "Comments":
-            block = re.sub(regex, "", block, flags=re.M)
+            block = (sqllexer.strip_comments(block) if comments_lexer
+                     else re.sub(regex, "", block, flags=re.M))
             for line in block.split("\n"):
                 line_mod = line.strip()
                 if line_mod != "":
@@ -69,126 +69,592 @@ def check_for_renaming(type_files_lst):
 
 
 def get_change_type(repo_cmd, commit):
-    type_files_lst = []
     command = ["git", "show", commit, "--oneline", "--name-status"]
     res = repo_cmd.execute(command)
-    change_files_lst = res.split("\n")[1:]
-    for fc in change_files_lst:
-        if fc.startswith("R"):
-            type_, old_path, new_path = fc.split("\t")
-        else:
-            type_, curr_path = fc.split("\t")
-            new_path = curr_path
-        type_files_lst.append((type_, new_path))
-    return type_files_lst
+    return history.parse_name_status(res.split("\n")[1:])
 
 
 def keep_only_sql_files(type_files_lst):
     return [type_file for type_file in type_files_lst if type_file[1].endswith(".sql")]
 
 
-def prepare_df(res):
-    records_lst = res.split("\n")
+def prepare_commits_df(res):
+    # (pandas, tqdm and 'results' are imported only for the analysis of whole projects,
+    # not for the classification of single commits, see 'cli')
+    import pandas as pd  # pylint: disable=import-outside-toplevel
+    # (no commits, e.g. in an empty window of '--since/--until')
+    records_lst = res.split("\n") if len(res) > 0 else []
     df = pd.DataFrame.from_records(map(lambda record: record.split(";"), records_lst),
                                    columns=["commit", "commit_date", "author_date"])
     # transform type of date-records
     df['commit_date'] = pd.to_datetime(df['commit_date'])
     df['author_date'] = pd.to_datetime(df['author_date'])
     df.sort_values("commit_date", inplace=True)
+    return df
+
+
+def prepare_df(res):
+    import results  # pylint: disable=import-outside-toplevel
+    df = prepare_commits_df(res)
     # add the remaining columns
     df["ChangedFilesNum"] = 0
     df["SQLFilesNum"] = 0
-    columns = ["Whitespace", "DML", "Index", "Comments", "NoDiffInfo",
-               "Privilege", "PK", "Engine", "Renaming", "Other"]
-    for col in columns:
+    for col in results.CATEGORY_COLUMNS:
         df[col] = df.apply(lambda x: set(), axis=1)
     return df
 
 
-def get_commits(repo_cmd):
-    return repo_cmd.execute(["git", "log", "--no-merges",
-                             "--pretty=format:%H;%aI;%cI", "--follow", "--", "*.sql"])
+def get_commits(repo_cmd, commit_query=None):
+    # (by default all commits changing SQL files, see 'history.CommitQuery')
+    return repo_cmd.execute(["git", "log", "--no-merges", "--pretty=format:%H;%aI;%cI"] +
+                            history.get_log_args(commit_query))
+
+
+def add_commits_refs(repo_cmd, commits_df, refs, since=None):
+    # the column 'refs' (after the dates): the refs containing each commit (formatted as the
+    # sets of SQL files); the commits of all refs are analyzed only once
+    import results  # pylint: disable=import-outside-toplevel
+    with metrics.timer("get_commit_refs", per_commit=False):
+        commit_refs = history.get_commit_refs(repo_cmd, refs, since)
+    commits_df["refs"] = [results.format_sql_files([ref for ref_id, ref in enumerate(refs)
+                                                    if commit_refs.get(commit, 0) >> ref_id & 1])
+                          for commit in commits_df["commit"]]
 
 
 def get_commit_file_diff_text(repo_cmd, commit, sql_file):
-    return repo_cmd.execute(["git", "show", commit, "--oneline", "--ignore-space-at-eol",
-                             "-b", "-w", "--ignore-blank-lines", "-U0", "--", sql_file])
+    return repo_cmd.execute(["git", "show", commit, "--oneline"] +
+                            history.DIFF_OPTIONS + ["--", sql_file])
 
 
 def calculate_total_block_diff_size(blocks_lst):
     return sum([len(block.strip().split("\n")) for block in blocks_lst])
 
 
-def main():
+def get_file_diff_text(record, changed_file, repo_cmd=None):
+    if record.diff_txt_dict is None:
+        # (the diffs of the commit were not read, since all of them were cached)
+        return history.get_diff_txt_dict(repo_cmd, record.commit).get(changed_file, "")
+    # (files without changes after ignoring whitespace are omitted by git)
+    return record.diff_txt_dict.get(changed_file, "")
+
+
+def get_cached_file_categories(record, changed_file, blob_cache=None):
+    # identical file changes (the same blob pair) are classified only once
+    blob_pair = record.blobs_dict.get(changed_file)
+    if blob_cache is not None and blob_pair is not None:
+        categories_lst = blob_cache.get(blob_pair)
+        if categories_lst is not None:
+            metrics.count("blob_cache_hits")
+            return categories_lst
+    return None
+
+
+def get_file_categories(record, changed_file, sql_classifier, blob_cache=None, repo_cmd=None):
+    categories_lst = get_cached_file_categories(record, changed_file, blob_cache)
+    if categories_lst is not None:
+        return categories_lst
+
+    diff_txt = get_file_diff_text(record, changed_file, repo_cmd)
+    # WHITESPACE, NO-DIFF-INFO, the categories of 'conf/regex.json' and OTHER
+    # (the presence of not yet identified changes)
+    with metrics.timer("classification"):
+        categories_lst = sql_classifier.get_categories(diff_txt)
+    metrics.count("files_classified")
+
+    blob_pair = record.blobs_dict.get(changed_file)
+    if blob_cache is not None and blob_pair is not None:
+        blob_cache.put(blob_pair, categories_lst)
+    return categories_lst
+
+
+def classify_records_batch(records, sql_classifier, blob_cache=None, repo_cmd=None):
+    # the categories of the changed SQL files of the records (a dict per record), classified
+    # together (see 'classifier.Classifier.get_categories_batch'); identical file changes
+    # (the same blob pair) are classified only once
+    files_categories_lst = [{} for _ in records]
+    diff_ids = {}
+    diff_txt_lst = []
+    blob_pairs = []
+    record_files = []
+    for record_id, record in enumerate(records):
+        for changed_file in get_files_to_classify(record):
+            categories_lst = get_cached_file_categories(record, changed_file, blob_cache)
+            if categories_lst is not None:
+                files_categories_lst[record_id][changed_file] = categories_lst
+                continue
+            blob_pair = record.blobs_dict.get(changed_file)
+            key = (record.commit, changed_file) if blob_pair is None else blob_pair
+            if key not in diff_ids:
+                diff_ids[key] = len(diff_txt_lst)
+                diff_txt_lst.append(get_file_diff_text(record, changed_file, repo_cmd))
+                blob_pairs.append(blob_pair)
+            record_files.append((record_id, changed_file, diff_ids[key]))
+
+    with metrics.timer("classification", per_commit=False):
+        categories_lsts = sql_classifier.get_categories_batch(diff_txt_lst)
+    metrics.count("files_classified", len(diff_txt_lst), per_commit=False)
+    for record_id, changed_file, diff_id in record_files:
+        files_categories_lst[record_id][changed_file] = categories_lsts[diff_id]
+    if blob_cache is not None:
+        for blob_pair, categories_lst in zip(blob_pairs, categories_lsts):
+            if blob_pair is not None:
+                blob_cache.put(blob_pair, categories_lst)
+    return files_categories_lst
+
+
+def get_files_to_classify(record):
+    # SQL files without renaming (R100)
+    return [changed_file for type_, changed_file in keep_only_sql_files(record.type_files_lst)
+            if not type_.startswith("R100")]
+
+
+def analyze_commit(record, sql_classifier, blob_cache=None, repo_cmd=None, files_categories=None):
+    # the numbers of changed (SQL) files and the SQL files per category of a single commit
+    # (files_categories: the already classified files, see 'classify_records_batch')
+    type_files_lst = record.type_files_lst
+    type_sql_files_lst = keep_only_sql_files(type_files_lst)
+    # (the records of the SQL change index hold only the SQL files)
+    commit_res = {"ChangedFilesNum": len(type_files_lst) if record.changed_files_num is None
+                                     else record.changed_files_num,
+                  "SQLFilesNum": len(type_sql_files_lst)}
+
+    # RENAMING
+    renamed_files_lst, other_renamed_files = check_for_renaming(type_sql_files_lst)
+    if len(renamed_files_lst + other_renamed_files) > 0:
+        commit_res["Renaming"] = renamed_files_lst + other_renamed_files
+
+    for _, changed_file in type_sql_files_lst:
+        if changed_file in renamed_files_lst:
+            continue
+        categories_lst = (None if files_categories is None
+                          else files_categories.get(changed_file))
+        if categories_lst is None:
+            categories_lst = get_file_categories(record, changed_file, sql_classifier,
+                                                 blob_cache, repo_cmd)
+        for category in categories_lst:
+            commit_res.setdefault(category, []).append(changed_file)
+    return commit_res
+
+
+def analyze_single_commit(repo_cmd, commit, sql_classifier, blob_cache=None,
+                          diff_engine="git"):
+    # the result of a single commit (its full SHA) read by the persistent git processes of the
+    # repository (see 'history.get_status_record'), e.g. for 'cli' and 'daemon'
+    record = history.get_status_record(repo_cmd, commit)
+    if diff_engine == "python":
+        record = record._replace(diff_txt_dict=history.BlobDiffs(repo_cmd, record))
+    return analyze_commit(record, sql_classifier, blob_cache, repo_cmd)
+
+
+def iter_index_records(repo_cmd, commits):
+    # (the index is updated before the analysis, see 'analyze_project_commits')
+    with sqlindex.SQLChangeIndex(sqlindex.get_index_path(repo_cmd)) as sql_index:
+        yield from sql_index.iter_records(commits)
+
+
+def iter_commit_records(repo_cmd, commits, blob_cache=None, diff_engine="git", use_index=False,
+                        prefetch=False):
+    # with 'use_index' the statuses are read from the SQL change index instead of git
+    status_records = iter_index_records(repo_cmd, commits) if use_index else None
+    if blob_cache is None or diff_engine == "python":
+        # (the 'python' diff engine computes only the diffs of the requested files)
+        return history.iter_commit_records(repo_cmd, commits, diff_engine=diff_engine,
+                                           status_records=status_records)
+    # the diffs are read only for commits with not yet classified file changes (decided per
+    # chunk of commits while the statuses are read); with 'prefetch' the records are read by
+    # another thread, which sees only the in-memory entries of the blob cache (the diffs of
+    # the other commits are read unnecessarily, but the results are the same)
+    is_cached = blob_cache.peek if prefetch else blob_cache.__contains__
+    return history.iter_commit_records(
+        repo_cmd, commits, status_records=status_records,
+        need_diff=lambda record: not all(is_cached(record.blobs_dict.get(changed_file))
+                                         for changed_file in get_files_to_classify(record)))
+
+
+def iter_pipelined_records(repo_cmd, records, pipeline_config, blob_cache=None,
+                           diff_engine="git"):
+    # the git output is read by a thread up to 'queue_size' records ahead of the analysis;
+    # with the 'python' diff engine the blobs of the files to classify are read ahead by
+    # 'fetch_workers' threads (with their own 'git cat-file' processes, see 'gitpool')
+    records = pipeline.iter_prefetched(records, pipeline_config.queue_size)
+    if diff_engine != "python":
+        yield from records
+        return
+    gitpool.get_pool(repo_cmd, pipeline_config.fetch_workers + 1)
+
+    def fetch_blobs(record):
+        # (not the already classified file changes)
+        record.diff_txt_dict.prefetch(
+            [changed_file for changed_file in get_files_to_classify(record)
+             if blob_cache is None or not blob_cache.peek(record.blobs_dict.get(changed_file))])
+        return record
+
+    yield from pipeline.iter_mapped(fetch_blobs, records, pipeline_config.fetch_workers,
+                                    pipeline_config.queue_size)
+
+
+def iter_analyzed_commits(repo_cmd, commits, sql_classifier, blob_cache=None,
+                          diff_engine="git", use_index=False, batch_size=0,
+                          pipeline_config=None):
+    prefetch = pipeline_config is not None and pipeline_config.queue_size > 0
+    records = iter_commit_records(repo_cmd, commits, blob_cache, diff_engine, use_index,
+                                  prefetch)
+    if prefetch:
+        records = iter_pipelined_records(repo_cmd, records, pipeline_config, blob_cache,
+                                         diff_engine)
+    # (the time of reading the git output, i.e. of waiting for the pipeline,
+    # and of the analysis per commit)
+    records = metrics.iter_timed("git_read", records)
+    # with 'batch_size' the changed SQL files of that many commits are classified together
+    if batch_size > 0:
+        batches = iter(lambda: list(itertools.islice(records, batch_size)), [])
+    else:
+        batches = ([record] for record in records)
+    for batch in batches:
+        files_categories_lst = [None] * len(batch)
+        if batch_size > 0:
+            files_categories_lst = classify_records_batch(batch, sql_classifier, blob_cache,
+                                                          repo_cmd)
+        for record, files_categories in zip(batch, files_categories_lst):
+            with metrics.timer("analyze_commit"):
+                commit_res = analyze_commit(record, sql_classifier, blob_cache, repo_cmd,
+                                            files_categories)
+            metrics.end_commit(record.commit)
+            yield record.commit, commit_res
+
+
+def analyze_commits_shard(repo_path, commits, sql_classifier, blob_cache=None,
+                          collect_metrics=False, diff_engine="git", use_index=False,
+                          batch_size=0, pipeline_config=None):
+    # (in a worker process, with its own git handle, streaming reader and metrics)
+    repo_cmd = git.cmd.Git(repo_path)
+    shard_metrics = metrics.activate(metrics.Metrics()) if collect_metrics else None
+    try:
+        commits_res = list(iter_analyzed_commits(repo_cmd, commits, sql_classifier, blob_cache,
+                                                 diff_engine, use_index, batch_size,
+                                                 pipeline_config))
+    finally:
+        metrics.deactivate()
+        gitpool.close_pools()
+    if blob_cache is not None:
+        blob_cache.close()
+    return commits_res, shard_metrics
+
+
+def iter_commits_res(repo_cmd, commits, sql_classifier, shards=1, blob_cache=None,
+                     diff_engine="git", use_index=False, batch_size=0, pipeline_config=None):
+    if shards <= 1:
+        yield from iter_analyzed_commits(repo_cmd, commits, sql_classifier, blob_cache,
+                                         diff_engine, use_index, batch_size, pipeline_config)
+        return
+    # several shards per worker process, so that the progress is updated regularly
+    shard_size = max(1, math.ceil(len(commits) / (shards * 4)))
+    commits_shards = [commits[i:i + shard_size] for i in range(0, len(commits), shard_size)]
+    collect_metrics = metrics.ACTIVE_METRICS is not None
+    with ProcessPoolExecutor(max_workers=shards) as executor:
+        for commits_res, shard_metrics in executor.map(
+                analyze_commits_shard,
+                [repo_cmd.working_dir] * len(commits_shards),
+                commits_shards,
+                [sql_classifier] * len(commits_shards),
+                [blob_cache] * len(commits_shards),
+                [collect_metrics] * len(commits_shards),
+                [diff_engine] * len(commits_shards),
+                [use_index] * len(commits_shards),
+                [batch_size] * len(commits_shards),
+                [pipeline_config] * len(commits_shards)):
+            if shard_metrics is not None:
+                metrics.ACTIVE_METRICS.merge(shard_metrics)
+            yield from commits_res
+
+
+def get_blob_cache(args, regex_hash):
+    if args.no_cache or (args.blob_cache_size == 0 and args.blob_cache_file is None):
+        return None
+    return cache.BlobPairCache(regex_hash, args.blob_cache_size, args.blob_cache_file)
+
+
+def analyze_project(prj, sql_classifier, regex_hash, results_dir_path, args,
+                    position=None, blob_cache=None):
+    # (with '--metrics' the timings/counters of the stages are collected for the project;
+    # returns the path of the result files without the extension)
+    prj_metrics = metrics.activate(metrics.Metrics()) if args.metrics else None
+    try:
+        path_prefix = analyze_project_commits(prj, sql_classifier, regex_hash, results_dir_path,
+                                              args, position, blob_cache)
+    finally:
+        metrics.deactivate()
+        # (the persistent git processes of the project, see 'gitpool')
+        gitpool.close_pools()
+    if prj_metrics is not None:
+        prj_metrics.write(path_prefix)
+    return path_prefix
+
+
+def iter_new_commits_res(prj, repo_cmd, new_commits, sql_classifier, results_dir_path, args,
+                         position=None, blob_cache=None):
+    from tqdm import tqdm  # pylint: disable=import-outside-toplevel
+    profiler = None
+    if args.profile_commits is not None:
+        profiler = metrics.CommitRangeProfiler(*args.profile_commits)
+        profiler.step(0)
+    # name-status and diffs of all commits are read in a single pass (per shard)
+    for position_commit, (commit, commit_res) in enumerate(
+            tqdm(iter_commits_res(repo_cmd, new_commits, sql_classifier, args.shards,
+                                  blob_cache, args.diff_engine, not args.no_index,
+                                  args.batch_size,
+                                  pipeline.PipelineConfig(args.prefetch, args.fetch_workers)),
+                 total=len(new_commits), desc=prj["name"], position=position)):
+        yield commit, commit_res
+        if profiler is not None:
+            profiler.step(position_commit + 1)
+    if profiler is not None:
+        profiler.dump(os.path.join(results_dir_path, f'{prj["name"]}.prof'))
+
+
+def write_commits_res_stream(prj, repo_cmd, commits_df, path_prefix, commit_cache, regex_hash,
+                             sql_classifier, results_dir_path, args, position=None,
+                             blob_cache=None):
+    # the results are written in chunks of commits while the commits are analyzed, so that
+    # the memory does not grow with the history and an interrupted run resumes after the
+    # last written chunk (the results of the analyzed commits are in the commit cache)
+    import results  # pylint: disable=import-outside-toplevel
+    commits = commits_df["commit"].tolist()
+    writer = results.ResultStreamWriter(path_prefix, args.output_format, regex_hash)
+    start = writer.start(commits_df, resume=not args.no_cache)
+    cached_commits = commit_cache.get_cached_commits(commits[start:])
+    metrics.count("commits_resumed", start, per_commit=False)
+    metrics.count("commits_cached", len(cached_commits), per_commit=False)
+    new_commits_res = iter_new_commits_res(
+        prj, repo_cmd, [commit for commit in commits[start:] if commit not in cached_commits],
+        sql_classifier, results_dir_path, args, position, blob_cache)
+
+    for chunk_start in range(start, len(commits), args.chunk_size):
+        chunk_commits = commits[chunk_start:chunk_start + args.chunk_size]
+        chunk_store = results.ResultStore(
+            commits_df.iloc[chunk_start:chunk_start + args.chunk_size])
+        commits_res = commit_cache.get_results(chunk_commits)
+        for commit in chunk_commits:
+            if commit in commits_res:
+                chunk_store.add_commit_res(commit, commits_res[commit])
+                continue
+            # (the new commits are analyzed in the order of the output)
+            commit, commit_res = next(new_commits_res)
+            with metrics.timer("populate", per_commit=False):
+                chunk_store.add_commit_res(commit, commit_res)
+                commit_cache.add_result(commit, commit_res)
+        with metrics.timer("write", per_commit=False):
+            commit_cache.flush()
+            writer.write_chunk(chunk_store)
+    # (ends the progress bar and the profiler)
+    for _ in new_commits_res:
+        pass
+    with metrics.timer("write", per_commit=False):
+        writer.close()
+
+
+def analyze_project_commits(prj, sql_classifier, regex_hash, results_dir_path, args,
+                            position=None, blob_cache=None):
+    # (returns the path of the result files without the extension)
+    import results  # pylint: disable=import-outside-toplevel
+    prj_repo_path = os.path.join(HOME_DIR, "repos", prj["name"])
+    repo_cmd = git.cmd.Git(prj_repo_path)
+    with metrics.timer("get_commits", per_commit=False):
+        commit_query = get_commit_query(args, prj)
+        res = get_commits(repo_cmd, commit_query)
+    commits_df = prepare_commits_df(res)
+    if commit_query.refs is not None and commit_query.rev_range is None:
+        add_commits_refs(repo_cmd, commits_df, commit_query.refs, commit_query.since)
+    commits = commits_df["commit"].tolist()
+    path_prefix = os.path.join(results_dir_path, get_results_name(prj, commit_query))
+    if not args.no_index:
+        # the statuses of the commits are read from git only once
+        with sqlindex.SQLChangeIndex(sqlindex.get_index_path(repo_cmd)) as sql_index:
+            sql_index.update(repo_cmd, commits)
+
+    # only the commits not yet analyzed (with the current regex config) are analyzed
+    with cache.CommitCache(os.path.join(results_dir_path, f'{prj["name"]}.sqlite'),
+                           regex_hash) as commit_cache:
+        if args.no_cache:
+            commit_cache.clear()
+        if args.stream:
+            write_commits_res_stream(prj, repo_cmd, commits_df, path_prefix, commit_cache,
+                                     regex_hash, sql_classifier, results_dir_path, args,
+                                     position, blob_cache)
+            return path_prefix
+
+        result_store = results.ResultStore(commits_df)
+        commits_res = commit_cache.get_results(commits)
+        new_commits = [commit for commit in commits if commit not in commits_res]
+        for commit, commit_res in commits_res.items():
+            result_store.add_commit_res(commit, commit_res)
+        metrics.count("commits_cached", len(commits_res), per_commit=False)
+
+        for commit, commit_res in iter_new_commits_res(prj, repo_cmd, new_commits,
+                                                       sql_classifier, results_dir_path, args,
+                                                       position, blob_cache):
+            with metrics.timer("populate", per_commit=False):
+                result_store.add_commit_res(commit, commit_res)
+                commit_cache.add_result(commit, commit_res)
+
+    with metrics.timer("write", per_commit=False):
+        result_store.write(path_prefix, args.output_format)
+    return path_prefix
+
+
+def analyze_project_process(prj, data_regex, results_dir_path, args, position):
+    # (in a worker process of the pool, see 'analyze_projects_parallel')
+    regex_hash = cache.get_regex_hash(data_regex, not args.comments_regex, args.diff_engine)
+    blob_cache = get_blob_cache(args, regex_hash)
+    analyze_project(prj, classifier.Classifier(data_regex, not args.no_prefilter,
+                                               not args.comments_regex),
+                    regex_hash, results_dir_path, args, position, blob_cache)
+    if blob_cache is not None:
+        blob_cache.close()
+
+
+def analyze_projects_parallel(projects_json_lst, data_regex, results_dir_path, args):
+    # each project in its own worker process; a failed project does not abort the others
+    from tqdm import tqdm  # pylint: disable=import-outside-toplevel
+    failed_projects = []
+    with ProcessPoolExecutor(max_workers=args.jobs, initializer=tqdm.set_lock,
+                             initargs=(tqdm.get_lock(),)) as executor:
+        futures = {executor.submit(analyze_project_process, prj, data_regex, results_dir_path,
+                                   args, position): prj["name"]
+                   for position, prj in enumerate(projects_json_lst)}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:  # pylint: disable=broad-except
+                print(f"The analysis of project '{futures[future]}' failed: {e!r}")
+                failed_projects.append(futures[future])
+    return sorted(failed_projects)
+
+
+def get_commit_query(args, prj=None):
+    # (the branches of the project only if listed in 'conf/projects.json', see 'prep.get_refs')
+    refs = None if prj is None else prj.get("refs")
+    return history.CommitQuery(args.rev_range, args.since, args.until, args.paths, refs)
+
+
+def get_results_name(prj, commit_query):
+    # the results of the whole history are in '<project>.<ext>', those of a window of the
+    # history ('--rev-range', '--since', '--until', '--paths') in '<project>_window_<hash of
+    # the window>.<ext>', so that a window does not replace the full results
+    window = [commit_query.rev_range, commit_query.since, commit_query.until, commit_query.paths]
+    if not any(window):
+        return prj["name"]
+    window_hash = hashlib.sha1(json.dumps(window).encode("utf-8")).hexdigest()[:10]
+    return f'{prj["name"]}_window_{window_hash}'
+
+
+def parse_commit_range(range_txt):
+    start, end = range_txt.split(":")
+    start, end = int(start or 0), int(end) if end else None
+    if start < 0 or (end is not None and end <= start):
+        raise argparse.ArgumentTypeError(f"invalid commit range: '{range_txt}'")
+    return start, end
+
+
+def parse_args(argv=None):
+    import results  # pylint: disable=import-outside-toplevel
+    parser = argparse.ArgumentParser(description="Changes in SQL files in Git repositories")
+    parser.add_argument("--since", metavar="DATE",
+                        help="analyze only the commits with a commit date after DATE "
+                             "(any date accepted by git, e.g. '2024-01-01' or '1 week ago')")
+    parser.add_argument("--until", metavar="DATE",
+                        help="analyze only the commits with a commit date before DATE")
+    parser.add_argument("--rev-range", metavar="A..B",
+                        help="analyze only the commits of the revision range "
+                             "(e.g. between two release tags) instead of HEAD")
+    parser.add_argument("--paths", nargs="+", metavar="PATH",
+                        help="analyze only the commits changing SQL files in these directories "
+                             "or these SQL files")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="analyze all commits without using cached results "
+                             "(and rebuild the cache of analyzed commits)")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="number of projects analyzed concurrently (in separate processes)")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="number of worker processes analyzing the commits of a project")
+    parser.add_argument("--blob-cache-size", type=int, default=100000,
+                        help="number of classified file changes (blob pairs) kept in memory")
+    parser.add_argument("--blob-cache-file",
+                        help="SQLite file for the classified file changes (shared by projects)")
+    parser.add_argument("--diff-engine", choices=history.DIFF_ENGINES, default="git",
+                        help="read the diffs from git ('git') or compute them in-process "
+                             "from the blobs ('python', experimental)")
+    parser.add_argument("--batch-size", type=int, default=0,
+                        help="classify the changed SQL files of N commits together "
+                             "(vectorized over all their changed lines)")
+    parser.add_argument("--prefetch", type=int, default=0, metavar="N",
+                        help="read the git output (and with the 'python' diff engine the blobs) "
+                             "in threads up to N commits ahead of the classification")
+    parser.add_argument("--fetch-workers", type=int, default=1,
+                        help="number of threads reading the blobs ahead (with '--prefetch')")
+    parser.add_argument("--no-prefilter", action="store_true",
+                        help="evaluate all category regexes without ruling out the categories "
+                             "whose required literals are not in a block")
+    parser.add_argument("--comments-regex", action="store_true",
+                        help="remove the comments with the regex of 'Comments' instead of "
+                             "the SQL lexer (also within strings)")
+    parser.add_argument("--no-index", action="store_true",
+                        help="read the statuses of the commits from git instead of the SQL change "
+                             "index (kept in the git directory of each clone)")
+    parser.add_argument("--metrics", action="store_true",
+                        help="write the timings/counters of the stages per project "
+                             "('<project>.metrics.json' and per commit '<project>.metrics.csv')")
+    parser.add_argument("--profile-commits", type=parse_commit_range, metavar="START:END",
+                        help="write a cProfile of the analysis of the commits START..END-1 "
+                             "(positions among the analyzed commits) to '<project>.prof'")
+    parser.add_argument("--output-format", choices=results.OUTPUT_FORMATS, default="csv",
+                        help="format of the result files ('parquet' and 'feather' require pyarrow)")
+    parser.add_argument("--stream", action="store_true",
+                        help="write the results in chunks of commits while analyzing them "
+                             "(bounded memory, an interrupted run resumes after the last written "
+                             "chunk; 'csv' and 'parquet' only)")
+    parser.add_argument("--chunk-size", type=int, default=1000,
+                        help="number of commits per written chunk (with '--stream')")
+    args = parser.parse_args(argv)
+    if args.stream and args.output_format not in results.STREAM_OUTPUT_FORMATS:
+        parser.error(f"--stream is not supported with --output-format {args.output_format}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
     projects_json_lst = prep.get_json_data_projects()
     results_dir_path = os.path.join(HOME_DIR, "results")
     prep.check_create_results_folder(results_dir_path)
 
     data_regex = prep.get_json_data_regex()
 
+    cloned_projects_json_lst = []
     for prj in projects_json_lst:
-        prj_repo_path = os.path.join(HOME_DIR, "repos", prj["name"])
-        if not os.path.exists(prj_repo_path):
+        if not os.path.exists(os.path.join(HOME_DIR, "repos", prj["name"])):
             print(f"The repository for project '{prj['name']}' has not been cloned. "
                    "Run the 'prep.py' script first.")
             continue
-        repo_cmd = git.cmd.Git(prj_repo_path)
-        res = get_commits(repo_cmd)
-        df = prepare_df(res)
-
-        for idx, row in tqdm(df.iterrows(), total=df.shape[0], desc=prj["name"]):
-            type_files_lst = get_change_type(repo_cmd, row["commit"])
-            df.at[idx, "ChangedFilesNum"] = len(type_files_lst)
-
-            type_sql_files_lst = keep_only_sql_files(type_files_lst)
-            df.at[idx, "SQLFilesNum"] = len(type_sql_files_lst)
-
-            # RENAMING
-            renamed_files_lst, other_renamed_files = check_for_renaming(type_sql_files_lst)
-            populate_df(df, idx, renamed_files_lst + other_renamed_files, "Renaming")
-
-            for type_, changed_file in type_sql_files_lst:
-                if changed_file in renamed_files_lst:
-                    continue
-
-                diff_txt = get_commit_file_diff_text(repo_cmd, row["commit"], changed_file)
-                # remove the commit message
-                diff_txt = "\n".join(diff_txt.split("\n")[1:])
-                # remove additional (unnecessary) information from Git
-                diff_txt = diff_txt.replace("\\ No newline at end of file", "").strip()
-
-                # WHITESPACE
-                if len(diff_txt) == 0:
-                    populate_df(df, idx, [changed_file], "Whitespace")
-                    continue
-
-                # NO-DIFF-INFO
-                if "@@ " not in diff_txt:
-                    populate_df(df, idx, [changed_file], "NoDiffInfo")
-                    continue
-
-                changed_blocks = prepare_changed_blocks(diff_txt)
-
-                for category in data_regex.keys():
-                    # calculate the total block size before and after check/modification.
-                    # (if the size has become smaller, mark the presence of a change of the current category)
-                    total_block_diff_size_before = calculate_total_block_diff_size(changed_blocks)
-                    changed_blocks = check_modify_changed_blocks(changed_blocks,
-                                                                 data_regex[category],
-                                                                 category)
-                    total_block_diff_size_after = calculate_total_block_diff_size(changed_blocks)
-
-                    if total_block_diff_size_before > total_block_diff_size_after:
-                        populate_df(df, idx, [changed_file], category)
-
-                    if len(changed_blocks) == 0:
-                        break
-
-                # if there are still blocks left, then mark as the presence of not yet identified changes
-                if len(changed_blocks) != 0:
-                    populate_df(df, idx, [changed_file], "Other")
-
-        df.to_csv(os.path.join(results_dir_path, f'{prj["name"]}.csv'), index=False)
+        cloned_projects_json_lst.append(prj)
+
+    if args.jobs > 1:
+        failed_projects = analyze_projects_parallel(cloned_projects_json_lst, data_regex,
+                                                    results_dir_path, args)
+        if len(failed_projects) > 0:
+            sys.exit(f"Failed projects: {', '.join(failed_projects)}")
+        return
+
+    # the regex patterns are compiled only once for all projects
+    sql_classifier = classifier.Classifier(data_regex, not args.no_prefilter,
+                                           not args.comments_regex)
+    regex_hash = cache.get_regex_hash(data_regex, not args.comments_regex, args.diff_engine)
+    # (classified file changes are shared by all projects)
+    blob_cache = get_blob_cache(args, regex_hash)
+    for prj in cloned_projects_json_lst:
+        analyze_project(prj, sql_classifier, regex_hash, results_dir_path, args,
+                        blob_cache=blob_cache)
+    if blob_cache is not None:
+        blob_cache.close()
 
 
 if __name__ == "__main__":  # pragma: no cover
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+import csv
+import json
+import time
+import cProfile
+import threading
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+# the metrics of the current analysis (None: no instrumentation)
+ACTIVE_METRICS = None
+
+
+class Metrics:
+    # cumulative timings of the stages (in seconds; stages may be nested),
+    # counters and per-commit timings/counters
+    # (stages of other threads, e.g. of 'pipeline', are added to the current commit)
+
+    def __init__(self):
+        self.timings = defaultdict(float)
+        self.counters = defaultdict(int)
+        self.commit_rows = []
+        self.commit_values = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        # (e.g. for the metrics of a worker process) without the lock
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def timer(self, stage, per_commit=True):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start, per_commit)
+
+    def add_time(self, stage, seconds, per_commit=True):
+        with self.lock:
+            self.timings[stage] += seconds
+            if per_commit:
+                self.commit_values[stage] += seconds
+
+    def count(self, counter, value=1, per_commit=True):
+        with self.lock:
+            self.counters[counter] += value
+            if per_commit:
+                self.commit_values[counter] += value
+
+    def timed(self, func, stage):
+        # 'func' with the time of each call added to the stage
+        def timed_func(*args):
+            start = time.perf_counter()
+            res = func(*args)
+            self.add_time(stage, time.perf_counter() - start)
+            return res
+        return timed_func
+
+    def iter_timed(self, stage, iterable):
+        # the time needed to get each item (e.g. from a git process)
+        iterator = iter(iterable)
+        while True:
+            with self.timer(stage):
+                item = next(iterator, None)
+            if item is None:
+                return
+            yield item
+
+    def end_commit(self, commit):
+        with self.lock:
+            self.commit_rows.append({"commit": commit, **{key: round(value, 6) for key, value
+                                                          in self.commit_values.items()}})
+            self.commit_values = defaultdict(int)
+
+    def merge(self, other):
+        # (e.g. the metrics of a worker process)
+        for stage, seconds in other.timings.items():
+            self.timings[stage] += seconds
+        for counter, value in other.counters.items():
+            self.counters[counter] += value
+        self.commit_rows.extend(other.commit_rows)
+
+    def to_dict(self):
+        return {"stages": {stage: round(seconds, 6) for stage, seconds in self.timings.items()},
+                "counters": dict(self.counters),
+                "commits": len(self.commit_rows)}
+
+    def write(self, path_prefix):
+        # '<prefix>.metrics.json' (totals) and '<prefix>.metrics.csv' (per commit)
+        with open(f"{path_prefix}.metrics.json", "w", encoding="utf-8") as json_f:
+            json.dump(self.to_dict(), json_f, indent=2)
+        columns = ["commit"] + sorted({key for row in self.commit_rows for key in row} -
+                                      {"commit"})
+        with open(f"{path_prefix}.metrics.csv", "w", encoding="utf-8", newline="") as csv_f:
+            writer = csv.DictWriter(csv_f, fieldnames=columns, restval=0)
+            writer.writeheader()
+            writer.writerows(self.commit_rows)
+
+
+class CommitRangeProfiler:
+    # cProfile of the analysis of the commits at the positions start..end-1
+    # (end None: up to the last commit)
+
+    def __init__(self, start, end=None):
+        self.start = start
+        self.end = end
+        self.profile = cProfile.Profile()
+        self.enabled = False
+
+    def step(self, position):
+        # (before the analysis of the commit at the position)
+        if position == self.start:
+            self.profile.enable()
+            self.enabled = True
+        if position == self.end and self.enabled:
+            self.profile.disable()
+            self.enabled = False
+
+    def dump(self, path):
+        if self.enabled:
+            self.profile.disable()
+            self.enabled = False
+        self.profile.dump_stats(path)
+
+
+def activate(metrics_obj):
+    global ACTIVE_METRICS  # pylint: disable=global-statement
+    ACTIVE_METRICS = metrics_obj
+    return metrics_obj
+
+
+def deactivate():
+    activate(None)
+
+
+def timer(stage, per_commit=True):
+    if ACTIVE_METRICS is None:
+        return nullcontext()
+    return ACTIVE_METRICS.timer(stage, per_commit)
+
+
+def count(counter, value=1, per_commit=True):
+    if ACTIVE_METRICS is not None:
+        ACTIVE_METRICS.count(counter, value, per_commit)
+
+
+def iter_timed(stage, iterable):
+    if ACTIVE_METRICS is None:
+        return iterable
+    return ACTIVE_METRICS.iter_timed(stage, iterable)
+
+
+def end_commit(commit):
+    if ACTIVE_METRICS is not None:
+        ACTIVE_METRICS.end_commit(commit)
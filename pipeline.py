@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+import queue
+import threading
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+# queue_size: items produced ahead of the consumer (0: no pipeline),
+# fetch_workers: threads running the fetches of the items (see 'iter_mapped')
+PipelineConfig = namedtuple("PipelineConfig", ["queue_size", "fetch_workers"], defaults=[0, 1])
+
+# (the end of the items of a producer)
+END = object()
+
+
+def iter_prefetched(iterable, queue_size):
+    # the items of the iterable, produced by a thread at most 'queue_size' items ahead of the
+    # consumer (the full queue blocks the producer); an exception of the producer is raised
+    # in the consumer, a closed consumer stops the producer
+    items_queue = queue.Queue(maxsize=queue_size)
+    stopped = threading.Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                items_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        iterator = iter(iterable)
+        try:
+            for item in iterator:
+                if not put((item, None)):
+                    break
+            else:
+                put((END, None))
+        except BaseException as e:  # pylint: disable=broad-except
+            put((END, e))
+        finally:
+            # (e.g. a generator with a git process or an SQLite connection of this thread)
+            if hasattr(iterator, "close"):
+                iterator.close()
+
+    producer = threading.Thread(target=produce, name="pipeline-producer", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item, error = items_queue.get()
+            if error is not None:
+                raise error
+            if item is END:
+                return
+            yield item
+    finally:
+        stopped.set()
+        producer.join()
+
+
+def iter_mapped(func, iterable, workers=1, queue_size=1):
+    # func(item) for the items in 'workers' threads, at most 'queue_size' items ahead of
+    # the consumer (the results in the order of the items)
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pipeline-fetch")
+    futures = deque()
+    try:
+        for item in iterable:
+            futures.append(executor.submit(func, item))
+            if len(futures) >= queue_size:
+                yield futures.popleft().result()
+        while len(futures) > 0:
+            yield futures.popleft().result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
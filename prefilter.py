@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+import re
+try:
+    # (Python 3.11+)
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:  # pragma: no cover
+    import sre_parse  # pylint: disable=deprecated-module
+    import sre_constants  # pylint: disable=deprecated-module
+# (the opcodes of the constants modules are created at runtime)
+# pylint: disable=no-member
+
+REPEATS = [sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT,
+           getattr(sre_constants, "POSSESSIVE_REPEAT", sre_constants.MAX_REPEAT)]
+# characters matching ASCII characters with re.IGNORECASE beyond 'str.lower'
+# ('İ' has a lowercase form of two characters)
+FOLD_TABLE = str.maketrans({"İ": "i", "ı": "i", "ſ": "s"})
+
+
+def fold_text(text):
+    # (the text for the literals of case-insensitive regexes)
+    if not text.isascii():
+        text = text.translate(FOLD_TABLE)
+    return text.lower()
+
+
+def get_better_literals(literals_1, literals_2):
+    # the requirement with the longer literals (and with fewer alternatives)
+    if literals_1 is None:
+        return literals_2
+    if literals_2 is None:
+        return literals_1
+    key_1 = (min(len(literal) for literal, _ in literals_1), -len(literals_1))
+    key_2 = (min(len(literal) for literal, _ in literals_2), -len(literals_2))
+    return literals_2 if key_2 > key_1 else literals_1
+
+
+def get_item_literals(op, av, ignore_case):
+    if op == sre_constants.SUBPATTERN:
+        _, add_flags, del_flags, items = av
+        ignore_case = (ignore_case or bool(add_flags & re.I)) and not del_flags & re.I
+        return get_sequence_literals(items, ignore_case)
+    if op == getattr(sre_constants, "ATOMIC_GROUP", None):
+        return get_sequence_literals(av, ignore_case)
+    if op == sre_constants.BRANCH:
+        branches_literals = [get_sequence_literals(items, ignore_case) for items in av[1]]
+        if any(literals is None for literals in branches_literals):
+            return None
+        return frozenset().union(*branches_literals)
+    if op in REPEATS and av[0] >= 1:
+        return get_sequence_literals(av[2], ignore_case)
+    # (character sets, wildcards, anchors, assertions, ...)
+    return None
+
+
+def get_sequence_literals(items, ignore_case):
+    # all items of a sequence must match: the best requirement of the runs of
+    # literal characters and of the single items
+    best_literals = None
+    run = []
+    for op, av in list(items) + [(None, None)]:
+        if op == sre_constants.LITERAL and (not ignore_case or chr(av).isascii()):
+            run.append(chr(av).lower() if ignore_case else chr(av))
+            continue
+        if len(run) > 0:
+            best_literals = get_better_literals(best_literals,
+                                                frozenset([("".join(run), ignore_case)]))
+            run = []
+        if op is not None:
+            best_literals = get_better_literals(best_literals,
+                                                get_item_literals(op, av, ignore_case))
+    return best_literals
+
+
+def get_required_literals(regex, flags=0):
+    # (literal, ignore_case) pairs of which at least one is contained in every match of the
+    # regex (None if there are no such literals); the literals of case-insensitive parts
+    # are lowercase (see 'fold_text')
+    parsed = sre_parse.parse(regex, flags)
+    return get_sequence_literals(parsed, bool(parsed.state.flags & re.I))
+
+
+class LiteralPrefilter:
+    # rules out the categories whose regex cannot match a text, since the text contains none
+    # of the required literals of the regex (a fast scan for substrings instead of the regex)
+
+    def __init__(self, patterns):
+        # patterns: (category, compiled regex) pairs
+        self.categories = [category for category, _ in patterns]
+        self.category_literals = {category: get_required_literals(pattern.pattern, pattern.flags)
+                                  for category, pattern in patterns}
+        # (categories without literals are never ruled out)
+        self.unfiltered = {category for category, literals in self.category_literals.items()
+                           if literals is None}
+        literal_categories = {}
+        for category, literals in self.category_literals.items():
+            for literal in sorted(literals or []):
+                literal_categories.setdefault(literal, set()).add(category)
+        self.literal_categories = [(literal, ignore_case, frozenset(categories))
+                                   for (literal, ignore_case), categories
+                                   in literal_categories.items()]
+        self.fold = any(ignore_case for _, ignore_case, _ in self.literal_categories)
+
+    def get_candidates(self, text):
+        # the categories whose regex may match the text
+        folded_text = fold_text(text) if self.fold else text
+        candidates = set(self.unfiltered)
+        for literal, ignore_case, categories in self.literal_categories:
+            if literal in (folded_text if ignore_case else text):
+                candidates.update(categories)
+        return candidates
@@ -1,14 +1,18 @@
 #!/usr/bin/env python3
 
 import os
+import sys
 import json
-import git
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 HOME_DIR = os.getcwd()
 
 
-def get_json_data_regex():
-    with open(os.path.join(HOME_DIR, "conf", "regex.json"), encoding="utf-8") as json_f:
+def get_json_data_regex(regex_path=None):
+    regex_path = regex_path or os.path.join(HOME_DIR, "conf", "regex.json")
+    with open(regex_path, encoding="utf-8") as json_f:
         json_data = json.load(json_f)
         for key, val in json_data.items():
             json_data[key] = "".join(val) if type(val) == list else val
@@ -34,21 +38,146 @@ def check_create_results_folder(results_dir_path):
         os.mkdir(results_dir_path)
 
 
-def check_clone_repos(projects_json_lst):
-    for prj in projects_json_lst:
-        project_name = prj["name"]
-        repo_path = os.path.join(HOME_DIR, "repos", project_name)
-        if (not os.path.exists(repo_path)) or (len(os.listdir(repo_path)) < 2):
-            print(f"Cloning repo '{project_name}'...")
-            git.Repo.clone_from(prj["url"], repo_path, branch="master")
-
-
-def main():
+def get_repo_path(prj):
+    return os.path.join(HOME_DIR, "repos", prj["name"])
+
+
+def get_refs(prj):
+    # the branches of the project to analyze ('refs' in 'conf/projects.json'), the first one
+    # is checked out
+    return prj.get("refs", ["master"])
+
+
+def is_cloned(repo_path):
+    # (GitPython is imported only for cloning, so that 'get_json_data_regex' is fast, see 'cli')
+    import git  # pylint: disable=import-outside-toplevel
+    try:
+        return git.Repo(repo_path).head.is_valid()
+    except (git.exc.InvalidGitRepositoryError, git.exc.NoSuchPathError):
+        return False
+
+
+def is_partial_clone(repo_cmd):
+    return repo_cmd.execute(["git", "config", "--bool", "--default", "false",
+                             "remote.origin.promisor"]) == "true"
+
+
+def get_missing_sql_blobs(repo_cmd, refs=("HEAD",)):
+    # the blobs of the SQL files (in all commits of the refs) not yet in the partial clone
+    raw_txt = repo_cmd.execute(["git", "log", "--raw", "--no-abbrev", "--no-renames", "--format=",
+                                *refs, "--", "*.sql"])
+    sql_blobs = {blob for line in raw_txt.split("\n") if line.startswith(":")
+                 for blob in line.split("\t")[0].split(" ")[2:4]}
+    # (objects missing in the partial clone are listed without fetching them)
+    objects_txt = repo_cmd.execute(["git", "rev-list", "--objects", "--missing=print", *refs])
+    missing_objects = {line[1:] for line in objects_txt.split("\n") if line.startswith("?")}
+    return sorted(sql_blobs & missing_objects)
+
+
+def fetch_sql_blobs(repo_cmd, refs=("HEAD",)):
+    # a single fetch of the missing blobs (as git does for blobs needed on demand)
+    blobs = get_missing_sql_blobs(repo_cmd, refs)
+    if len(blobs) > 0:
+        with tempfile.TemporaryFile() as blobs_f:
+            blobs_f.write("".join(f"{blob}\n" for blob in blobs).encode("utf-8"))
+            blobs_f.seek(0)
+            repo_cmd.execute(["git", "-c", "fetch.negotiationAlgorithm=noop", "fetch", "--no-tags",
+                              "--no-write-fetch-head", "--recurse-submodules=no",
+                              "--filter=blob:none", "--stdin", "origin"], istream=blobs_f)
+    return len(blobs)
+
+
+def update_branches(repo_cmd, refs):
+    # the local branches of the refs set to the fetched remote branches
+    for ref in refs:
+        repo_cmd.execute(["git", "update-ref", f"refs/heads/{ref}", f"refs/remotes/origin/{ref}"])
+
+
+def clone_repo(prj, repo_path, partial=False):
+    import git  # pylint: disable=import-outside-toplevel
+    refs = get_refs(prj)
+    if not partial:
+        git.Repo.clone_from(prj["url"], repo_path, branch=refs[0])
+        # (the other branches of the clone are only remote branches)
+        update_branches(git.cmd.Git(repo_path), refs[1:])
+        return
+    # commits and trees only (no checkout), then the blobs of the SQL files
+    git.Repo.clone_from(prj["url"], repo_path, branch=refs[0],
+                        multi_options=["--filter=blob:none", "--no-checkout"])
+    repo_cmd = git.cmd.Git(repo_path)
+    update_branches(repo_cmd, refs[1:])
+    fetch_sql_blobs(repo_cmd, refs)
+
+
+def update_repo(repo_path, refs=("master",)):
+    # fetches the new commits of the refs into an existing (full or partial) clone
+    import git  # pylint: disable=import-outside-toplevel
+    repo_cmd = git.cmd.Git(repo_path)
+    # (the remote branches of all refs, also if the clone tracks only some branches)
+    repo_cmd.execute(["git", "fetch", "--no-tags", "origin"] +
+                     [f"+refs/heads/{ref}:refs/remotes/origin/{ref}" for ref in refs])
+    if is_partial_clone(repo_cmd):
+        # (partial clones have no checkout)
+        update_branches(repo_cmd, refs)
+        fetch_sql_blobs(repo_cmd, refs)
+    else:
+        # (the first ref is checked out, also if another branch was checked out meanwhile,
+        # so that only its working tree is merged; the other branches are set by 'update-ref')
+        repo_cmd.execute(["git", "checkout", "-q", refs[0]])
+        repo_cmd.execute(["git", "merge", "-q", "--ff-only", f"refs/remotes/origin/{refs[0]}"])
+        update_branches(repo_cmd, refs[1:])
+
+
+def check_clone_repo(prj, partial=False, update=False):
+    project_name = prj["name"]
+    repo_path = get_repo_path(prj)
+    if not is_cloned(repo_path):
+        print(f"Cloning repo '{project_name}'...")
+        clone_repo(prj, repo_path, partial)
+    elif update:
+        print(f"Updating repo '{project_name}'...")
+        update_repo(repo_path, get_refs(prj))
+
+
+def check_clone_repos(projects_json_lst, jobs=1, partial=False, update=False):
+    # the repositories are cloned/updated concurrently (git runs in separate processes);
+    # a failed project does not abort the others
+    failed_projects = []
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        futures = {executor.submit(check_clone_repo, prj, partial, update): prj["name"]
+                   for prj in projects_json_lst}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:  # pylint: disable=broad-except
+                print(f"The preparation of project '{futures[future]}' failed: {e!r}")
+                failed_projects.append(futures[future])
+    return sorted(failed_projects)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Clone the repositories of the projects")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="number of repositories cloned/updated concurrently")
+    parser.add_argument("--partial", action="store_true",
+                        help="partial clones without checkout: only the commits, trees and "
+                             "the blobs of the SQL files are downloaded")
+    parser.add_argument("--update", action="store_true",
+                        help="fetch the new commits into existing clones")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    # (without arguments, e.g. in 'conftest', the defaults are used)
+    args = parse_args([] if argv is None else argv)
     projects_json_lst = get_json_data_projects()
     if len(projects_json_lst) > 0:
         check_create_repos_folder()
-        check_clone_repos(projects_json_lst)
+        failed_projects = check_clone_repos(projects_json_lst, args.jobs, args.partial,
+                                            args.update)
+        if len(failed_projects) > 0:
+            sys.exit(f"Failed projects: {', '.join(failed_projects)}")
 
 
 if __name__ == "__main__":  # pragma: no cover
-    main()
+    main(sys.argv[1:])
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import shutil
+import hashlib
+from array import array
+import numpy as np
+import pandas as pd
+
+CATEGORY_COLUMNS = ["Whitespace", "DML", "Index", "Comments", "NoDiffInfo",
+                    "Privilege", "PK", "Engine", "Renaming", "Other"]
+
+# csv: '<name>.csv' (one column per category)
+# parquet/feather: '<name>.<ext>' (commits) and '<name>_files.<ext>' (commit, file, category)
+OUTPUT_FORMATS = ["csv", "parquet", "feather"]
+# (the Arrow IPC file format of feather needs the same dictionaries in all chunks)
+STREAM_OUTPUT_FORMATS = ["csv", "parquet"]
+
+
+def get_utc_offsets(dates):
+    # the UTC offsets (in minutes) of the dates of the committer/author time zones
+    return pd.Series([pd.Timestamp(date).utcoffset().total_seconds() // 60 for date in dates],
+                     index=dates.index, dtype="int16")
+
+
+def format_sql_files(sql_files):
+    # the same as str(set), but (independent of the hash seed) with sorted file names
+    if len(sql_files) == 0:
+        return "set()"
+    return "{" + ", ".join(repr(sql_file) for sql_file in sorted(sql_files)) + "}"
+
+
+class ResultStore:
+    # results of a project: the numbers of changed (SQL) files per commit and
+    # a long-format table (commit, file, category) with file paths interned to integer IDs
+
+    def __init__(self, commits_df):
+        # commits_df: 'commit', 'commit_date' and 'author_date' (in the order of the output)
+        self.commits_df = commits_df.reset_index(drop=True)
+        self.commit_ids = {commit: commit_id for commit_id, commit in
+                           enumerate(self.commits_df["commit"])}
+        self.changed_files_num = array("I", [0]) * len(self.commits_df)
+        self.sql_files_num = array("I", [0]) * len(self.commits_df)
+        self.file_ids = {}
+        self.files = []
+        self.rows_commit_id = array("I")
+        self.rows_file_id = array("I")
+        self.rows_category_id = array("B")
+
+    def __len__(self):
+        return len(self.rows_commit_id)
+
+    def get_file_id(self, sql_file):
+        file_id = self.file_ids.get(sql_file)
+        if file_id is None:
+            file_id = self.file_ids[sql_file] = len(self.files)
+            self.files.append(sql_file)
+        return file_id
+
+    def add_commit_res(self, commit, commit_res):
+        # commit_res: see 'main.analyze_commit'
+        commit_id = self.commit_ids[commit]
+        self.changed_files_num[commit_id] = commit_res["ChangedFilesNum"]
+        self.sql_files_num[commit_id] = commit_res["SQLFilesNum"]
+        for category_id, category in enumerate(CATEGORY_COLUMNS):
+            for sql_file in commit_res.get(category, []):
+                self.rows_commit_id.append(commit_id)
+                self.rows_file_id.append(self.get_file_id(sql_file))
+                self.rows_category_id.append(category_id)
+
+    def iter_rows(self):
+        for commit_id, file_id, category_id in zip(self.rows_commit_id, self.rows_file_id,
+                                                   self.rows_category_id):
+            yield (self.commits_df.at[commit_id, "commit"], self.files[file_id],
+                   CATEGORY_COLUMNS[category_id])
+
+    def get_category_files(self):
+        # category -> commit ID -> set of SQL files
+        category_files = [{} for _ in CATEGORY_COLUMNS]
+        for commit_id, file_id, category_id in zip(self.rows_commit_id, self.rows_file_id,
+                                                   self.rows_category_id):
+            category_files[category_id].setdefault(commit_id, set()).add(self.files[file_id])
+        return dict(zip(CATEGORY_COLUMNS, category_files))
+
+    def to_df(self, sql_files_func=format_sql_files):
+        # the wide format of the CSV files (one column per category)
+        df = self.commits_df.copy()
+        df["ChangedFilesNum"] = pd.Series(self.changed_files_num, dtype="int64")
+        df["SQLFilesNum"] = pd.Series(self.sql_files_num, dtype="int64")
+        empty_set = frozenset()
+        for category, commits_files in self.get_category_files().items():
+            df[category] = [sql_files_func(commits_files.get(commit_id, empty_set))
+                            for commit_id in range(len(df))]
+        return df
+
+    def to_commits_df(self):
+        # typed commits table (dates in UTC, with the UTC offsets of the dates of the CSV files
+        # in '<date>_utc_offset')
+        df = self.commits_df.copy()
+        for date_column in ("commit_date", "author_date"):
+            df[f"{date_column}_utc_offset"] = get_utc_offsets(df[date_column])
+            df[date_column] = pd.to_datetime(df[date_column], utc=True)
+        df["ChangedFilesNum"] = pd.Series(self.changed_files_num, dtype="int64")
+        df["SQLFilesNum"] = pd.Series(self.sql_files_num, dtype="int64")
+        return df
+
+    def to_files_df(self):
+        # normalized long-format table (commit x file x category)
+        return pd.DataFrame({
+            "commit": pd.Categorical.from_codes(np.asarray(self.rows_commit_id, dtype="int64"),
+                                                categories=self.commits_df["commit"]),
+            "file": pd.Categorical.from_codes(np.asarray(self.rows_file_id, dtype="int64"),
+                                              categories=self.files),
+            "category": pd.Categorical.from_codes(np.asarray(self.rows_category_id,
+                                                             dtype="int64"),
+                                                  categories=CATEGORY_COLUMNS)})
+
+    def write_csv(self, csv_path):
+        self.to_df().to_csv(csv_path, index=False)
+
+    def write(self, path_prefix, output_format="csv"):
+        if output_format == "csv":
+            self.write_csv(f"{path_prefix}.csv")
+        elif output_format == "parquet":
+            self.to_commits_df().to_parquet(f"{path_prefix}.parquet", index=False)
+            self.to_files_df().to_parquet(f"{path_prefix}_files.parquet", index=False)
+        elif output_format == "feather":
+            self.to_commits_df().to_feather(f"{path_prefix}.feather")
+            self.to_files_df().to_feather(f"{path_prefix}_files.feather")
+        else:
+            raise ValueError(f"Unknown output format: '{output_format}'")
+
+
+def fsync_path(path):
+    file_descriptor = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(file_descriptor)
+    finally:
+        os.close(file_descriptor)
+
+
+def update_commits_hash(commits_hash, commits):
+    for commit in commits:
+        commits_hash.update(commit.encode("ascii") + b"\n")
+    return commits_hash
+
+
+class ResultStreamWriter:
+    # results written in chunks of commits (in the order of the output) while the commits are
+    # analyzed: csv: appended to '<name>.csv.partial', parquet: one pair of files per chunk in
+    # '<name>.parquet.parts'; after each chunk the written commits are recorded in
+    # '<name>.<ext>.progress', so that an interrupted run resumes after the last written chunk;
+    # 'close' moves/combines the chunks to the files of 'ResultStore.write'
+
+    def __init__(self, path_prefix, output_format="csv", resume_key=""):
+        if output_format not in STREAM_OUTPUT_FORMATS:
+            raise ValueError(f"Unsupported output format for streaming: '{output_format}'")
+        self.path_prefix = path_prefix
+        self.output_format = output_format
+        # e.g. the hash of the regex config (the chunks of another config are not resumed)
+        self.resume_key = resume_key
+        output_path = f"{path_prefix}.{output_format}"
+        self.partial_path = output_path + (".partial" if output_format == "csv" else ".parts")
+        self.progress_path = output_path + ".progress"
+        self.progress = None
+        self.commits_hash = None
+        self.empty_store = None
+
+    def read_progress(self):
+        try:
+            with open(self.progress_path, encoding="utf-8") as progress_f:
+                return json.load(progress_f)
+        except (OSError, ValueError):
+            return None
+
+    def write_progress(self):
+        self.progress["commits_hash"] = self.commits_hash.hexdigest()
+        tmp_path = self.progress_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as progress_f:
+            json.dump(self.progress, progress_f)
+            progress_f.flush()
+            os.fsync(progress_f.fileno())
+        os.replace(tmp_path, self.progress_path)
+
+    def get_part_paths(self, table_name, parts_num):
+        return [os.path.join(self.partial_path, f"{table_name}-{part:06d}.{self.output_format}")
+                for part in range(parts_num)]
+
+    def start(self, commits_df, resume=True):
+        # commits_df: all commits of the output (see 'ResultStore');
+        # returns the number of commits already written by an interrupted run
+        commits = commits_df["commit"].tolist()
+        self.empty_store = ResultStore(commits_df.iloc[:0])
+        progress = self.read_progress() if resume else None
+        if progress is not None and (
+                progress.get("key") != self.resume_key or progress["commits"] > len(commits) or
+                update_commits_hash(hashlib.sha1(), commits[:progress["commits"]]).hexdigest()
+                != progress["commits_hash"] or not os.path.exists(self.partial_path)):
+            progress = None
+        if progress is None:
+            self.progress = {"key": self.resume_key, "commits": 0, "size": 0, "parts": 0}
+            self.commits_hash = hashlib.sha1()
+            if os.path.isdir(self.partial_path):
+                shutil.rmtree(self.partial_path)
+            if self.output_format == "csv":
+                # (the header)
+                with open(self.partial_path, "w", encoding="utf-8", newline="") as csv_f:
+                    self.empty_store.to_df().to_csv(csv_f, index=False)
+                self.progress["size"] = os.path.getsize(self.partial_path)
+            else:
+                os.makedirs(self.partial_path)
+            fsync_path(self.partial_path)
+            self.write_progress()
+            return 0
+
+        self.progress = progress
+        self.commits_hash = update_commits_hash(hashlib.sha1(), commits[:progress["commits"]])
+        # the rest of a chunk written only partly is dropped
+        if self.output_format == "csv":
+            with open(self.partial_path, "r+b") as csv_f:
+                csv_f.truncate(progress["size"])
+        else:
+            part_paths = set(self.get_part_paths("commits", progress["parts"]) +
+                             self.get_part_paths("files", progress["parts"]))
+            for file_name in os.listdir(self.partial_path):
+                if os.path.join(self.partial_path, file_name) not in part_paths:
+                    os.remove(os.path.join(self.partial_path, file_name))
+        return progress["commits"]
+
+    def write_chunk(self, result_store):
+        # result_store: the results of the next commits of the output
+        if self.output_format == "csv":
+            with open(self.partial_path, "a", encoding="utf-8", newline="") as csv_f:
+                result_store.to_df().to_csv(csv_f, index=False, header=False)
+                csv_f.flush()
+                os.fsync(csv_f.fileno())
+            self.progress["size"] = os.path.getsize(self.partial_path)
+        else:
+            part = self.progress["parts"]
+            for table_name, df in (("commits", result_store.to_commits_df()),
+                                   ("files", result_store.to_files_df())):
+                part_path = os.path.join(self.partial_path,
+                                         f"{table_name}-{part:06d}.{self.output_format}")
+                df.to_parquet(part_path, index=False)
+                fsync_path(part_path)
+            self.progress["parts"] = part + 1
+        update_commits_hash(self.commits_hash, result_store.commits_df["commit"])
+        self.progress["commits"] += len(result_store.commits_df)
+        self.write_progress()
+
+    def combine_parts(self):
+        # pylint: disable=import-outside-toplevel
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        for table_name, suffix in (("commits", ""), ("files", "_files")):
+            part_paths = self.get_part_paths(table_name, self.progress["parts"])
+            # (the dictionaries of the categorical columns differ between the chunks)
+            schema = pq.read_schema(part_paths[0])
+            schema = pa.schema([field.with_type(pa.dictionary(pa.int32(), field.type.value_type))
+                                if pa.types.is_dictionary(field.type) else field
+                                for field in schema], metadata=schema.metadata)
+            with pq.ParquetWriter(f"{self.path_prefix}{suffix}.parquet", schema) as writer:
+                for part_path in part_paths:
+                    writer.write_table(pq.read_table(part_path).cast(schema))
+
+    def close(self):
+        if self.output_format == "csv":
+            os.replace(self.partial_path, f"{self.path_prefix}.csv")
+        else:
+            if self.progress["parts"] == 0:
+                self.empty_store.write(self.path_prefix, self.output_format)
+            else:
+                self.combine_parts()
+            shutil.rmtree(self.partial_path)
+        os.remove(self.progress_path)
+
+
+def read_results(path_prefix, output_format="parquet"):
+    # the commits table and the long-format table (see 'ResultStore.write')
+    if output_format == "parquet":
+        return (pd.read_parquet(f"{path_prefix}.parquet"),
+                pd.read_parquet(f"{path_prefix}_files.parquet"))
+    if output_format == "feather":
+        return (pd.read_feather(f"{path_prefix}.feather"),
+                pd.read_feather(f"{path_prefix}_files.feather"))
+    raise ValueError(f"Unsupported output format: '{output_format}'")
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+import os
+import sqlite3
+import history
+import metrics
+
+# to be increased if the content of the index changes (the index is rebuilt)
+INDEX_VERSION = 1
+INDEX_FILE_NAME = "sql_change_index.sqlite"
+
+
+def get_index_path(repo_cmd):
+    # (in the git directory of the clone, so that 'repos' holds only the clones)
+    git_dir = repo_cmd.execute(["git", "rev-parse", "--absolute-git-dir"])
+    return os.path.join(git_dir, INDEX_FILE_NAME)
+
+
+def get_similarity(type_):
+    # the similarity score of renames/copies ('R087' -> 87)
+    if type_[:1] in ("R", "C") and len(type_) > 1:
+        return int(type_[1:])
+    return None
+
+
+class SQLChangeIndex:
+    # the changes of the SQL files per commit of a repository (SQLite file):
+    # status, paths (with the similarity of renames), blobs and modes of the diff without
+    # renames and the number of all changed files of the commit;
+    # built from a single walk over the statuses of the commits and updated incrementally
+
+    def __init__(self, index_path):
+        self.conn = sqlite3.connect(index_path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        version = self.conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if version is not None and int(version[0]) != INDEX_VERSION:
+            self.conn.execute("DROP TABLE IF EXISTS commits")
+            self.conn.execute("DROP TABLE IF EXISTS changes")
+        self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)",
+                          (str(INDEX_VERSION),))
+        self.conn.execute("CREATE TABLE IF NOT EXISTS commits ("
+                          "commit_sha TEXT PRIMARY KEY, "
+                          "changed_files_num INTEGER NOT NULL)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS changes ("
+                          "commit_sha TEXT NOT NULL, "
+                          "position INTEGER NOT NULL, "
+                          "status TEXT NOT NULL, "
+                          "old_path TEXT NOT NULL, "
+                          "path TEXT NOT NULL, "
+                          "similarity INTEGER, "
+                          "old_blob TEXT NOT NULL, "
+                          "new_blob TEXT NOT NULL, "
+                          "old_mode TEXT NOT NULL, "
+                          "new_mode TEXT NOT NULL, "
+                          "PRIMARY KEY (commit_sha, position))")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS changes_path ON changes (path)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS changes_old_path ON changes (old_path)")
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get_indexed_commits(self):
+        return {commit for commit, in self.conn.execute("SELECT commit_sha FROM commits")}
+
+    def add_commit(self, commit, raw_lines):
+        self.conn.execute("INSERT OR REPLACE INTO commits VALUES (?, ?)", (commit, len(raw_lines)))
+        self.conn.execute("DELETE FROM changes WHERE commit_sha = ?", (commit,))
+        for position, line in enumerate(raw_lines):
+            type_, old_path, path, blob_pair, mode_pair = history.parse_raw_line(line)
+            if path.endswith(".sql"):
+                self.conn.execute("INSERT INTO changes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                  (commit, position, type_, old_path, path,
+                                   get_similarity(type_), *blob_pair, *mode_pair))
+
+    def update(self, repo_cmd, commits):
+        # indexes the commits not yet in the index (with a single 'git log' process);
+        # returns the number of new commits
+        indexed_commits = self.get_indexed_commits()
+        new_commits = [commit for commit in commits if commit not in indexed_commits]
+        with metrics.timer("index_update", per_commit=False):
+            for commit, lines in history.iter_git_log_chunks(repo_cmd, ["--raw", "--no-abbrev"],
+                                                             new_commits, "git_status_bytes"):
+                self.add_commit(commit, [line for line in lines if line != ""])
+            self.conn.commit()
+        return len(new_commits)
+
+    def iter_records(self, commits, chunk_size=500):
+        # the records (see 'history.CommitRecord') of the commits with the SQL files only
+        for i in range(0, len(commits), chunk_size):
+            chunk = commits[i:i + chunk_size]
+            placeholders = ", ".join("?" * len(chunk))
+            changes_dict = {}
+            for commit, type_, path, old_blob, new_blob, old_mode, new_mode in self.conn.execute(
+                    "SELECT commit_sha, status, path, old_blob, new_blob, old_mode, new_mode "
+                    f"FROM changes WHERE commit_sha IN ({placeholders}) "
+                    "ORDER BY commit_sha, position", chunk):
+                changes_dict.setdefault(commit, []).append(
+                    (type_, path, (old_blob, new_blob), (old_mode, new_mode)))
+            changed_files_nums = dict(self.conn.execute(
+                "SELECT commit_sha, changed_files_num FROM commits "
+                f"WHERE commit_sha IN ({placeholders})", chunk))
+            for commit in chunk:
+                changes = changes_dict.get(commit, [])
+                yield history.CommitRecord(
+                    commit, [(type_, path) for type_, path, _, _ in changes], None,
+                    {path: blob_pair for _, path, blob_pair, _ in changes},
+                    {path: mode_pair for _, path, _, mode_pair in changes},
+                    changed_files_nums[commit])
+
+    def get_file_commits(self, path):
+        # all indexed commits touching the file (also as the old path of a rename)
+        return self.conn.execute("SELECT commit_sha, status, old_path, path, similarity "
+                                 "FROM changes WHERE path = ? OR old_path = ? "
+                                 "ORDER BY rowid", (path, path)).fetchall()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+import re
+import string
+from collections import namedtuple
+
+# kind: 'code', 'line_comment' ('--' or '#' up to the end of the line), 'block_comment'
+# ('/* */', not nested), 'string' (quoted with ', " or `) or 'dollar_string' ($tag$ $tag$);
+# start: the position of the token in the text
+Token = namedtuple("Token", ["kind", "text", "start"])
+
+COMMENT_KINDS = frozenset(["line_comment", "block_comment"])
+# the starts of the comments (e.g. for 'prefilter.LiteralPrefilter')
+COMMENT_START_REGEX = re.compile(r"--|#|/\*")
+# the starts of the tokens other than code
+SPECIAL_REGEX = re.compile(r"--|#|/\*|['\"`$]")
+# (a '$' in an identifier or a parameter such as '$1' does not start a dollar quote)
+DOLLAR_TAG_REGEX = re.compile(r"\$(?:[a-zA-Z_][a-zA-Z0-9_]*)?\$")
+IDENTIFIER_CHARS = frozenset(string.ascii_letters + string.digits + "_$")
+# the closing quote or an escape: doubled quotes and (except for identifiers in `)
+# backslashes escape the next character
+QUOTE_SEARCHES = {"'": re.compile(r"['\\]").search,
+                  '"': re.compile(r'["\\]').search,
+                  "`": re.compile(r"`").search}
+
+
+def find_quote_end(text, start, quote):
+    # the end of the quoted string at 'start' (-1 if unterminated)
+    search = QUOTE_SEARCHES[quote]
+    position = start + 1
+    while True:
+        match = search(text, position)
+        if match is None:
+            return -1
+        position = match.start()
+        if text[position] == "\\" or text.startswith(quote, position + 1):
+            position += 2
+        else:
+            return position + 1
+
+
+def find_end(text, start, end_txt, end_len):
+    # (-1 if unterminated)
+    position = text.find(end_txt, start)
+    return -1 if position == -1 else position + end_len
+
+
+class DollarTagIndex:
+    # the positions of all '$tag$' in the text, found in one pass (the identifier of a tag ends
+    # at the next '$', so each character is read once), so that the end of each dollar quote
+    # is found in constant amortized time (the dollar quotes start in the order of the text)
+
+    def __init__(self, text):
+        self.tag_positions = {}
+        position = text.find("$")
+        while position != -1:
+            tag_match = DOLLAR_TAG_REGEX.match(text, position)
+            if tag_match is not None:
+                self.tag_positions.setdefault(tag_match.group(), []).append(position)
+            position = text.find("$", position + 1)
+        # tag -> the index of the next position to check
+        self.next_ids = {}
+
+    def find_end(self, tag, start):
+        # the end of the next '$tag$' at or after 'start' (-1 if none)
+        positions = self.tag_positions[tag]
+        position_id = self.next_ids.get(tag, 0)
+        while position_id < len(positions) and positions[position_id] < start:
+            position_id += 1
+        self.next_ids[tag] = position_id
+        return -1 if position_id == len(positions) else positions[position_id] + len(tag)
+
+
+def iter_tokens(text):
+    # a single pass over the text: the starts of the non-code tokens are found by a regex
+    # without backtracking, the ends by a forward search from the start; an unterminated
+    # block comment or string is code (as for the regex of 'Comments', which requires the '*/'),
+    # and so are the same openers after it (their ends are not searched again, so that each
+    # character is read a constant number of times; the ends of the dollar quotes are found
+    # by a 'DollarTagIndex', created for the first one)
+    position = 0
+    code_start = 0
+    dollar_tag_index = None
+    # the openers ('/*', the quotes and the dollar tags) found unterminated
+    unterminated = set()
+    while True:
+        match = SPECIAL_REGEX.search(text, position)
+        if match is None:
+            break
+        start = match.start()
+        special = match.group()
+        if special in ("--", "#"):
+            kind, end = "line_comment", find_end(text, start, "\n", 0)
+            if end == -1:
+                end = len(text)
+        else:
+            opener = special
+            if special == "$":
+                tag_match = None
+                if start == 0 or text[start - 1] not in IDENTIFIER_CHARS:
+                    tag_match = DOLLAR_TAG_REGEX.match(text, start)
+                if tag_match is None:
+                    position = start + 1
+                    continue
+                opener = tag_match.group()
+            if opener in unterminated:
+                kind, end = None, -1
+            elif special == "/*":
+                kind, end = "block_comment", find_end(text, start + 2, "*/", 2)
+            elif special != "$":
+                kind, end = "string", find_quote_end(text, start, special)
+            else:
+                if dollar_tag_index is None:
+                    dollar_tag_index = DollarTagIndex(text)
+                kind, end = "dollar_string", dollar_tag_index.find_end(opener,
+                                                                       start + len(opener))
+            if end == -1:
+                unterminated.add(opener)
+                position = start + len(opener)
+                continue
+        if code_start < start:
+            yield Token("code", text[code_start:start], code_start)
+        yield Token(kind, text[start:end], start)
+        position = code_start = end
+    if code_start < len(text):
+        yield Token("code", text[code_start:], code_start)
+
+
+def strip_comments(text):
+    # the text without the comments (in linear time; comments within strings are kept)
+    if "--" not in text and "#" not in text and "/*" not in text:
+        return text
+    return "".join(token.text for token in iter_tokens(text) if token.kind not in COMMENT_KINDS)
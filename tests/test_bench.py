@@ -0,0 +1,51 @@
+import os
+import git
+import pytest
+
+import bench
+
+
+@pytest.mark.order(40)
+def test_get_change_weights():
+    change_weights = bench.get_change_weights("rename=1,dml=2.5")
+    assert change_weights == {"rename": 1, "dml": 2.5, "comment": 0, "whitespace": 0, "ddl": 0}
+    with pytest.raises(ValueError):
+        bench.get_change_weights("unknown=1")
+
+
+@pytest.mark.order(41)
+def test_generate_repo(tmp_path):
+    repo_path = os.path.join(tmp_path, "repo")
+    bench.generate_repo(repo_path, commits_num=50, sql_files_num=3,
+                        change_weights=bench.get_change_weights("rename=1,dml=1"))
+    repo = git.Repo(repo_path)
+    assert repo.active_branch.name == "master"
+    assert len(list(repo.iter_commits())) == 50
+    assert all(path.endswith(".sql") for path in os.listdir(os.path.join(repo_path, "sql")))
+
+
+@pytest.mark.order(42)
+def test_run_benchmark(tmp_path):
+    repo_path = os.path.join(tmp_path, "repo")
+    bench.generate_repo(repo_path, commits_num=60, sql_files_num=4, diff_size=3)
+    bench_res = bench.run_benchmark(repo_path, sample_num=10, comments_sizes=(50, 100),
+                                    startup_runs=1)
+    assert bench_res["sample_commits"] == 10
+    assert bench_res["classification_mismatches"] == 0
+    assert bench_res["batch_classification_mismatches"] == 0
+    assert bench_res["diff_engine_mismatches"] == 0
+    assert bench_res["pooled_mismatches"] == 0
+    assert 0 < bench_res["regex_evaluations_skipped"]
+    assert list(bench_res["stages"].keys()) == [
+        "get_commits", "get_change_type", "get_commit_file_diff_text", "get_change_type_pooled",
+        "get_commit_file_diff_text_pooled", "prepare_changed_blocks",
+        "classification", "classification_no_prefilter", "classification_batch",
+        "classification_per_category", "iter_commit_records", "analyze_commit",
+        "iter_commit_records_python", "analyze_commit_python", "csv_write"]
+    assert bench_res["stages"]["iter_commit_records"]["items"] == bench_res["commits"]
+    assert all(stage["seconds"] >= 0 for stage in bench_res["stages"].values())
+    assert list(bench_res["comments_adversarial"].keys()) == list(bench.ADVERSARIAL_COMMENTS.keys())
+    assert all(len(comments_timings["lexer_seconds"]) == 2
+               for comments_timings in bench_res["comments_adversarial"].values())
+    assert list(bench_res["startup"].keys()) == ["cli_classify_diff", "cli_classify_commit",
+                                                 "main_help"]
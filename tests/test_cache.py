@@ -0,0 +1,65 @@
+import os
+import pickle
+import pytest
+
+import prep
+import cache
+
+
+@pytest.mark.order(31)
+def test_regex_hash():
+    data_regex = prep.get_json_data_regex()
+    regex_hash = cache.get_regex_hash(data_regex)
+    assert regex_hash == cache.get_regex_hash(prep.get_json_data_regex())
+    # the order of the categories is relevant
+    assert regex_hash != cache.get_regex_hash(dict(reversed(data_regex.items())))
+    # the diffs of the diff engines may differ
+    assert regex_hash != cache.get_regex_hash(data_regex, diff_engine="python")
+    data_regex["PK"] = "primary\\s+key\\s+"
+    assert regex_hash != cache.get_regex_hash(data_regex)
+
+
+@pytest.mark.order(32)
+def test_commit_cache(tmp_path):
+    cache_path = os.path.join(tmp_path, "prj.sqlite")
+    commit_res = {"ChangedFilesNum": 2, "SQLFilesNum": 1, "DML": ["sql_file_1"]}
+    with cache.CommitCache(cache_path, "hash_1") as commit_cache:
+        commit_cache.add_result("commit_1", commit_res)
+        commit_cache.add_result("commit_2", {"ChangedFilesNum": 1, "SQLFilesNum": 1})
+    with cache.CommitCache(cache_path, "hash_1") as commit_cache:
+        assert commit_cache.get_results(["commit_1", "commit_3"]) == {"commit_1": commit_res}
+    # the results become invalid with another regex config
+    with cache.CommitCache(cache_path, "hash_2") as commit_cache:
+        assert commit_cache.get_results(["commit_1", "commit_2"]) == {}
+    with cache.CommitCache(cache_path, "hash_1") as commit_cache:
+        assert commit_cache.get_results(["commit_1", "commit_2"]) == {}
+
+
+@pytest.mark.order(37)
+def test_blob_pair_cache_lru():
+    blob_cache = cache.BlobPairCache("hash_1", maxsize=2)
+    blob_cache.put(("blob_1", "blob_2"), ["DML"])
+    blob_cache.put(("blob_1", "blob_3"), ["Whitespace"])
+    assert blob_cache.get(("blob_1", "blob_2")) == ["DML"]
+    # the least recently used entry is evicted
+    blob_cache.put(("blob_2", "blob_3"), ["Other"])
+    assert ("blob_1", "blob_3") not in blob_cache
+    assert ("blob_1", "blob_2") in blob_cache
+    assert ("blob_2", "blob_3") in blob_cache
+
+
+@pytest.mark.order(38)
+def test_blob_pair_cache_file(tmp_path):
+    cache_path = os.path.join(tmp_path, "blob_pairs.sqlite")
+    blob_cache = cache.BlobPairCache("hash_1", maxsize=1, cache_path=cache_path)
+    blob_cache.put(("blob_1", "blob_2"), ["DML", "Other"])
+    blob_cache.put(("blob_1", "blob_3"), ["Whitespace"])
+    # evicted from memory, but still on disk
+    assert blob_cache.get(("blob_1", "blob_2")) == ["DML", "Other"]
+    blob_cache.close()
+
+    # e.g. in another process/project
+    blob_cache = pickle.loads(pickle.dumps(blob_cache))
+    assert blob_cache.get(("blob_1", "blob_3")) == ["Whitespace"]
+    blob_cache.close()
+    assert cache.BlobPairCache("hash_2", cache_path=cache_path).get(("blob_1", "blob_3")) is None
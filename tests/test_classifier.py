@@ -0,0 +1,121 @@
+import os
+import re
+import pytest
+
+import main
+import bench
+import prep
+import classifier
+import prefilter
+
+
+def get_categories_per_category_pass(diff_txt, data_regex):
+    # the categories as determined before with the per-category functions of 'main'
+    diff_txt = diff_txt.replace("\\ No newline at end of file", "").strip()
+    if len(diff_txt) == 0:
+        return ["Whitespace"]
+    if "@@ " not in diff_txt:
+        return ["NoDiffInfo"]
+    changed_blocks = main.prepare_changed_blocks(diff_txt)
+    categories_lst = []
+    for category in data_regex.keys():
+        total_block_diff_size_before = main.calculate_total_block_diff_size(changed_blocks)
+        changed_blocks = main.check_modify_changed_blocks(changed_blocks,
+                                                          data_regex[category],
+                                                          category)
+        if total_block_diff_size_before > main.calculate_total_block_diff_size(changed_blocks):
+            categories_lst.append(category)
+        if len(changed_blocks) == 0:
+            break
+    if len(changed_blocks) != 0:
+        categories_lst.append("Other")
+    return categories_lst
+
+
+diff_text_scenarios = [
+    "",
+    "diff --git a/empty.sql b/empty.sql\nnew file mode 100644\nindex 0000000..e69de29",
+    "@@ -33 +32,0 @@ set feedback off\n-set lines 200",
+    "@@ -1,0 +2,3 @@\n+/* first line\n+   second line */ insert into tab_1 values (1);\n+-- comment",
+    "@@ -4 +4 @@\n-grant select on tab_1 to user_1;\n+GRANT SELECT ON tab_1 TO user_2;\n"
+    "@@ -10,0 +11 @@\n+) ENGINE=InnoDB;\n\\ No newline at end of file",
+    "@@ -7 +7,2 @@\n-    id int primary key,\n+    id bigint primary key, -- id\n"
+    "+    name varchar(20) /* name\n@@ -20 +21 @@\n+*/ create index idx_1 on tab_1(name);"]
+
+
+@pytest.mark.parametrize("diff_txt", diff_text_scenarios)
+@pytest.mark.order(29)
+def test_classifier_same_as_per_category_pass(diff_txt):
+    data_regex = prep.get_json_data_regex()
+    sql_classifier = classifier.Classifier(data_regex)
+    assert sql_classifier.get_categories(diff_txt) == \
+        get_categories_per_category_pass(diff_txt, data_regex)
+
+
+@pytest.mark.order(30)
+def test_classifier_hits():
+    sql_classifier = classifier.Classifier(prep.get_json_data_regex())
+    blocks_lines_lst = classifier.prepare_changed_lines(diff_text_scenarios[5])
+    hits, blocks_lines_lst = sql_classifier.classify(blocks_lines_lst)
+    assert hits == {"DML": 0, "Comments": 0, "Index": 1, "PK": 2,
+                    "Engine": 0, "Privilege": 0}
+    # (the comment not closed in the block is kept, as by the regex of 'Comments')
+    assert blocks_lines_lst == [["name varchar(20) /* name"]]
+    regex_classifier = classifier.Classifier(prep.get_json_data_regex(), comments_lexer=False)
+    _, regex_blocks_lines_lst = regex_classifier.classify(
+        classifier.prepare_changed_lines(diff_text_scenarios[5]))
+    assert regex_blocks_lines_lst == blocks_lines_lst
+
+
+@pytest.mark.order(54)
+def test_classifier_batch(tmp_path):
+    sql_classifier = classifier.Classifier(prep.get_json_data_regex())
+    diff_txt_lst = diff_text_scenarios * 2
+    assert sql_classifier.get_categories_batch(diff_txt_lst) == \
+        [sql_classifier.get_categories(diff_txt) for diff_txt in diff_txt_lst]
+    assert sql_classifier.get_categories_batch([]) == []
+    assert sql_classifier.get_categories_batch(diff_text_scenarios[:2]) == [["Whitespace"],
+                                                                           ["NoDiffInfo"]]
+
+    # the changed SQL files of several commits classified together
+    repo_path = os.path.join(tmp_path, "repo")
+    repo_cmd = bench.generate_repo(repo_path, commits_num=40, sql_files_num=3)
+    commits = repo_cmd.execute(["git", "rev-list", "--reverse", "master"]).split()
+    assert list(main.iter_commits_res(repo_cmd, commits, sql_classifier, batch_size=15)) == \
+        list(main.iter_commits_res(repo_cmd, commits, sql_classifier))
+
+
+@pytest.mark.parametrize(
+    "regex, flags, literals",
+    [("primary\\s+key", re.I, {("primary", True)}),
+     ("--.*|#.*|(((\\/\\*)+?[\\w\\W]+?(\\*\\/)+))", re.M, {("--", False), ("#", False),
+                                                          ("/*", False)}),
+     ("^(GRANT|revoke)\\s+\\S+", re.I, {("grant", True), ("revoke", True)}),
+     ("(?i:SEL)ect|x+YZ", 0, {("sel", True), ("YZ", False)}),
+     ("a*b?|index", re.I, None),
+     ("[0-9]+", 0, None)])
+@pytest.mark.order(55)
+def test_required_literals(regex, flags, literals):
+    assert prefilter.get_required_literals(regex, flags) == literals
+
+
+@pytest.mark.order(56)
+def test_classifier_prefilter():
+    data_regex = prep.get_json_data_regex()
+    sql_classifier = classifier.Classifier(data_regex)
+    sql_classifier_all = classifier.Classifier(data_regex, use_prefilter=False)
+    # ('ſ' matches 's' with re.IGNORECASE)
+    diff_txt_lst = diff_text_scenarios + ["@@ -1 +1 @@\n+ſelect a from b;"]
+    for diff_txt in diff_txt_lst:
+        assert sql_classifier.get_categories(diff_txt) == \
+            sql_classifier_all.get_categories(diff_txt)
+    stats = sql_classifier.regex_stats
+    assert stats["regex_evaluations_skipped"] > 0
+    assert stats["regex_evaluations"] + stats["regex_evaluations_skipped"] == \
+        sql_classifier_all.regex_stats["regex_evaluations"]
+    assert sql_classifier.get_categories(diff_txt_lst[-1]) == ["DML"]
+    # (the stage of the categories after 'Comments')
+    stage_prefilter = sql_classifier.prefilters[2]
+    assert stage_prefilter.get_candidates("create index idx on tab_1 (col)") == {"Index"}
+    assert stage_prefilter.get_candidates("id int primary key) engine=innodb") == {"PK", "Engine"}
+    assert stage_prefilter.get_candidates("insert into tab_1 values (1);") == set()
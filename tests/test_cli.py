@@ -0,0 +1,65 @@
+import os
+import sys
+import json
+import subprocess
+import pytest
+
+import main
+import prep
+import bench
+import history
+import classifier
+import cli
+
+SCRIPT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_cli(args, input_txt=""):
+    # a new process, with the imported heavy modules on stderr
+    code = ("import sys, cli\n"
+            "status = cli.main_cli(sys.argv[1:])\n"
+            "print(sorted({'pandas', 'git', 'tqdm'} & set(sys.modules)), file=sys.stderr)\n"
+            "sys.exit(status)")
+    return subprocess.run([sys.executable, "-c", code] + args, input=input_txt.encode("utf-8"),
+                          capture_output=True, cwd=SCRIPT_DIR, check=False)
+
+
+@pytest.mark.order(68)
+def test_cli_classify(tmp_path):
+    repo_path = os.path.join(tmp_path, "repo")
+    repo_cmd = bench.generate_repo(repo_path, commits_num=40, sql_files_num=4)
+    sql_classifier = classifier.Classifier(prep.get_json_data_regex())
+    commits = main.prepare_commits_df(main.get_commits(repo_cmd))["commit"].tolist()
+    commits_res = dict(main.iter_commits_res(repo_cmd, commits, sql_classifier))
+    for commit in commits:
+        assert cli.analyze_revision(repo_path, commit, sql_classifier) == \
+            (commit, commits_res[commit])
+        # (the same diffs as 'main' without files changed only in whitespace)
+        if "Whitespace" in commits_res[commit]:
+            continue
+        diff_txt = repo_cmd.execute(["git", "show", "--format=", commit] + history.DIFF_OPTIONS)
+        assert cli.analyze_diff(diff_txt, sql_classifier) == commits_res[commit]
+    diff_txt = "@@ -1 +1 @@\n-insert into t values (1);\n+insert into t values (2);"
+    assert cli.analyze_diff(diff_txt, sql_classifier) == {"ChangedFilesNum": 1, "SQLFilesNum": 1,
+                                                          "DML": ["-"]}
+
+    # (neither pandas nor tqdm, GitPython only for a commit)
+    proc = run_cli(["classify", commits[-1], "--repo", repo_path, "--json"])
+    assert proc.returncode == 0
+    assert json.loads(proc.stdout) == {"commit": commits[-1], "result": commits_res[commits[-1]]}
+    assert proc.stderr.decode().splitlines()[-1] == "['git']"
+    proc = run_cli(["classify", "--fail-on", "DML", "Other"], "@@ -1 +1 @@\n+delete from t;")
+    assert proc.returncode == 1
+    assert proc.stdout.decode().splitlines() == ["ChangedFilesNum: 1", "SQLFilesNum: 1",
+                                                 "DML: -"]
+    assert proc.stderr.decode().splitlines()[-1] == "[]"
+
+    # (the new paths of the renames, classified as by 'main')
+    sql_file = repo_cmd.execute(["git", "ls-files", "sql"]).split("\n")[0]
+    repo_cmd.execute(["git", "mv", sql_file, "sql/new name.sql"])
+    repo_cmd.execute(["git", "-c", "user.name=Test", "-c", "user.email=test@example.com",
+                      "commit", "-q", "-m", "Rename"])
+    proc = run_cli(["classify", "--json"], repo_cmd.execute(["git", "show"]))
+    assert json.loads(proc.stdout)["result"] == cli.analyze_revision(repo_path, "HEAD",
+                                                                     sql_classifier)[1] == \
+        {"ChangedFilesNum": 1, "SQLFilesNum": 1, "Renaming": ["sql/new name.sql"]}
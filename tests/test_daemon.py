@@ -0,0 +1,111 @@
+import os
+import threading
+from functools import partial
+import git
+import pytest
+
+import main
+import prep
+import gitpool
+import classifier
+import bench
+import daemon
+
+
+def start_daemon(tmp_path, monkeypatch, argv, socket_path=None):
+    # a daemon for a synthetic project in 'tmp_path' (in a thread), its address (the socket
+    # path or the host and port) and the function of its requests (with the token of the
+    # HTTP server)
+    monkeypatch.setattr(main, "HOME_DIR", str(tmp_path))
+    repo_path = os.path.join(tmp_path, "repos", "prj")
+    if not os.path.exists(repo_path):
+        bench.generate_repo(repo_path, commits_num=40, sql_files_num=4)
+    service = daemon.AnalysisService(main.parse_args(argv), [{"name": "prj"}])
+    token_path = os.path.join(tmp_path, "daemon.token")
+    server = daemon.create_server(service, port=0, socket_path=socket_path,
+                                  token_path=token_path)
+    thread = threading.Thread(target=daemon.serve, args=(server,))
+    thread.start()
+    if socket_path is not None:
+        return socket_path, partial(daemon.request, socket_path), thread
+    address = server.server_address[:2]
+    return address, partial(daemon.request, address,
+                            token=daemon.read_token(token_path)), thread
+
+
+@pytest.mark.order(66)
+def test_daemon_classify_refresh(tmp_path, monkeypatch):
+    address, request, thread = start_daemon(tmp_path, monkeypatch, [])
+    repo_cmd = git.cmd.Git(os.path.join(tmp_path, "repos", "prj"))
+    try:
+        status, res = request("GET", "/status")
+        assert (status, res["projects"], res["warm_projects"]) == (200, ["prj"], [])
+
+        # (the same results as the analysis of 'main')
+        commits = main.prepare_commits_df(main.get_commits(repo_cmd))["commit"].tolist()
+        commits_res = dict(main.iter_commits_res(
+            repo_cmd, commits, classifier.Classifier(prep.get_json_data_regex())))
+        for commit in commits:
+            status, res = request("GET", "/classify", {"project": "prj", "commit": commit})
+            assert (status, res["cached"], res["result"]) == (200, False, commits_res[commit])
+        status, res = request("GET", "/classify", {"project": "prj", "commit": "HEAD"})
+        assert (status, res["commit"], res["cached"]) == (200, commits[-1], True)
+
+        status, res = request("POST", "/refresh",
+                              {"project": "prj", "since": "2020-01-01T00:30:00+00:00"})
+        assert status == 200
+        with open(f'{res["results"]}.csv', encoding="utf-8") as csv_f:
+            assert len(csv_f.read().splitlines()) == 11
+        assert os.path.basename(res["results"]).startswith("prj_window_")
+
+        for params in [{"project": "other", "commit": "HEAD"},
+                       {"project": "prj", "commit": "x"}, {"project": "prj", "commit": "0" * 40}]:
+            assert request("GET", "/classify", params)[0] == 404
+        assert request("GET", "/classify", {"project": "prj"}) == \
+            (400, {"error": "missing parameter 'commit'"})
+        assert request("GET", "/unknown")[0] == 404
+        assert request("GET", "/status")[1]["warm_projects"] == ["prj"]
+
+        # (the revisions are resolved, not passed to git as options)
+        status, res = request("POST", "/refresh", {"project": "prj",
+                                                   "rev_range": f"{commits[29]}..HEAD"})
+        assert status == 200
+        with open(f'{res["results"]}.csv', encoding="utf-8") as csv_f:
+            assert len(csv_f.read().splitlines()) == 11
+        pwned_path = os.path.join(tmp_path, "pwned.txt")
+        for rev_range in [f"--output={pwned_path}", f"HEAD..--output={pwned_path}"]:
+            assert request("POST", "/refresh", {"project": "prj", "rev_range": rev_range})[0] == 400
+        assert request("POST", "/refresh", {"project": "prj", "rev_range": "x..HEAD"})[0] == 404
+        assert not os.path.exists(pwned_path)
+
+        # (the failures of git without their details)
+        def analyze_single_commit_failed(*_args):
+            raise gitpool.GitProcessError("'git cat-file --batch' failed: details")
+
+        monkeypatch.setattr(main, "analyze_single_commit", analyze_single_commit_failed)
+        assert request("GET", "/classify", {"project": "prj", "commit": "0" * 40}) == \
+            (500, {"error": "git failed for the request"})
+
+        # (without the token of the HTTP server)
+        for method, path in [("GET", "/status"), ("POST", "/shutdown")]:
+            assert daemon.request(address, method, path)[0] == 401
+            assert daemon.request(address, method, path, token="x")[0] == 401
+    finally:
+        request("POST", "/shutdown")
+        thread.join()
+    assert not os.path.exists(os.path.join(tmp_path, "daemon.token"))
+
+
+@pytest.mark.order(67)
+def test_daemon_unix_socket(tmp_path, monkeypatch):
+    socket_path = os.path.join(tmp_path, "daemon.sock")
+    _, request, thread = start_daemon(tmp_path, monkeypatch, ["--diff-engine", "python"],
+                                      socket_path)
+    try:
+        status, res = request("GET", "/classify", {"project": "prj", "commit": "HEAD"})
+        assert (status, res["cached"]) == (200, False)
+        assert res["result"]["SQLFilesNum"] == 1
+    finally:
+        request("POST", "/shutdown")
+        thread.join()
+    assert not os.path.exists(socket_path)
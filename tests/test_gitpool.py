@@ -0,0 +1,59 @@
+import os
+import pytest
+
+import main
+import bench
+import history
+import gitpool
+import metrics
+
+
+@pytest.mark.order(60)
+def test_git_process_pool(tmp_path):
+    repo_path = os.path.join(tmp_path, "repo")
+    repo_cmd = bench.generate_repo(repo_path, commits_num=30, sql_files_num=3,
+                                   change_weights=bench.get_change_weights("rename=1,dml=1"))
+    commits = repo_cmd.execute(["git", "rev-list", "--reverse", "master"]).split()
+    pool = gitpool.get_pool(repo_cmd)
+    assert gitpool.get_pool(repo_cmd) is pool
+
+    try:
+        records = list(history.iter_status_records(repo_cmd, commits))
+        for commit, record in zip(commits, records):
+            # the same data as the git command per commit/file
+            status_record = history.get_status_record(repo_cmd, commit)
+            assert status_record == record
+            assert status_record.type_files_lst == main.get_change_type(repo_cmd, commit)
+            diff_txt_dict = history.get_diff_txt_dict(repo_cmd, commit)
+            for _, sql_file in main.keep_only_sql_files(record.type_files_lst):
+                diff_txt = main.get_commit_file_diff_text(repo_cmd, commit, sql_file)
+                assert diff_txt_dict.get(sql_file, "") == "\n".join(diff_txt.split("\n")[1:])
+
+        blobs = [blob for blob_pair in records[-1].blobs_dict.values() for blob in blob_pair]
+        assert pool.get_blobs(blobs) == [
+            b"" if set(blob) == {"0"} else repo_cmd.get_object_data(blob)[3] for blob in blobs]
+        blob = next(blob for blob in blobs if set(blob) != {"0"})
+        assert pool.get_object_info([commits[0], blob, "1" * 40]) == [
+            ("commit", int(repo_cmd.execute(["git", "cat-file", "-s", commits[0]]))),
+            ("blob", len(repo_cmd.get_object_data(blob)[3])), None]
+        with pytest.raises(ValueError):
+            pool.get_blob("1" * 40)
+        with pytest.raises(ValueError):
+            history.get_status_record(repo_cmd, "1" * 40)
+
+        # a failed process is restarted
+        pool_metrics = metrics.activate(metrics.Metrics())
+        try:
+            for processes in pool.processes.values():
+                for process in processes:
+                    process.proc.kill()
+                    process.proc.wait()
+            assert history.get_status_record(repo_cmd, commits[-1]) == records[-1]
+            assert pool.get_blob(blob) == repo_cmd.get_object_data(blob)[3]
+        finally:
+            metrics.deactivate()
+        assert pool_metrics.counters["git_process_restarts"] == 2
+    finally:
+        gitpool.close_pools()
+    assert gitpool.get_pool(repo_cmd) is not pool
+    gitpool.close_pools()
@@ -0,0 +1,213 @@
+import io
+import os
+import git
+import pytest
+
+import main
+import prep
+import bench
+import history
+import classifier
+
+
+@pytest.mark.parametrize(
+    "name_status_lines, type_files_lst_expected",
+    [(["M\tsql/schema.sql", "R100\told.sql\tnew.sql", "R087\ta/b.sql\ta/c.sql", "D\tREADME"],
+      [("M", "sql/schema.sql"), ("R100", "new.sql"), ("R087", "a/c.sql"), ("D", "README")]),
+     ([], [])])
+@pytest.mark.order(22)
+def test_parse_name_status(name_status_lines, type_files_lst_expected):
+    assert history.parse_name_status(name_status_lines) == type_files_lst_expected
+
+
+@pytest.mark.order(39)
+def test_parse_raw():
+    blob_1, blob_2, blob_3 = "9c5b2f6" * 5 + "12345", "427fb33" * 5 + "12345", "0" * 40
+    raw_lines = [f":100644 100644 {blob_1} {blob_2} M\tsql/schema.sql",
+                 f":100644 100644 {blob_1} {blob_2} R087\told.sql\tnew.sql",
+                 f":000000 100644 {blob_3} {blob_1} A\tREADME"]
+    type_files_lst, blobs_dict, modes_dict = history.parse_raw(raw_lines)
+    assert type_files_lst == [("M", "sql/schema.sql"), ("R087", "new.sql"), ("A", "README")]
+    # renamed files are compared with nothing (no renames in the diffs)
+    assert blobs_dict == {"sql/schema.sql": (blob_1, blob_2), "new.sql": (blob_3, blob_2),
+                          "README": (blob_3, blob_1)}
+    assert modes_dict == {"sql/schema.sql": ("100644", "100644"), "new.sql": ("000000", "100644"),
+                          "README": ("000000", "100644")}
+
+
+@pytest.mark.order(23)
+def test_split_file_sections():
+    diff_lines = ["",
+                  "diff --git a/sql/a.sql b/sql/a.sql",
+                  "index 9c5b2f6..427fb33 100644",
+                  "--- a/sql/a.sql",
+                  "+++ b/sql/a.sql",
+                  "@@ -33 +32,0 @@ set feedback off",
+                  "-set lines 200",
+                  "diff --git a/b c.sql b/b c.sql",
+                  "new file mode 100644",
+                  "index 0000000..e69de29",
+                  "diff --git a/a b.sql b/a b.sql",
+                  "index 9c5b2f6..427fb33 100644",
+                  "--- a/a b.sql\t",
+                  "+++ b/a b.sql\t",
+                  "@@ -1 +1 @@",
+                  "-select 1;",
+                  'diff --git "a/\\303\\244.sql" "b/\\303\\244.sql"',
+                  "deleted file mode 100644",
+                  "diff --git a/old.sql b/db/new name.sql",
+                  "similarity index 90%",
+                  "rename from old.sql",
+                  "rename to db/new name.sql",
+                  "@@ -1 +1 @@",
+                  "-select 1;",
+                  "+++ b/select 2;"]
+    diff_txt_dict = history.split_file_sections(diff_lines)
+    assert list(diff_txt_dict.keys()) == ["sql/a.sql", "b c.sql", "a b.sql",
+                                          '"\\303\\244.sql"', "db/new name.sql"]
+    assert [history.get_rename_similarity(diff_txt) for diff_txt in diff_txt_dict.values()] == \
+        [None, None, None, None, 90]
+    assert diff_txt_dict["sql/a.sql"].split("\n")[-1] == "-set lines 200"
+    assert diff_txt_dict["b c.sql"] == ("diff --git a/b c.sql b/b c.sql\n"
+                                        "new file mode 100644\n"
+                                        "index 0000000..e69de29")
+
+
+@pytest.mark.dependency(name="iter-commit-records",
+                        depends=["get-commits-check-num"],
+                        scope="session")
+@pytest.mark.order(24)
+def test_iter_commit_records_same_as_git_show(get_repo_path):
+    _, path = get_repo_path
+    repo_cmd = git.cmd.Git(path)
+    df = main.prepare_df(main.get_commits(repo_cmd))
+    commits = df["commit"].tolist()[:50]
+    records = list(history.iter_commit_records(repo_cmd, commits))
+    assert [record.commit for record in records] == commits
+    for record in records:
+        assert record.type_files_lst == main.get_change_type(repo_cmd, record.commit)
+        for _, sql_file in main.keep_only_sql_files(record.type_files_lst):
+            diff_txt = main.get_commit_file_diff_text(repo_cmd, record.commit, sql_file)
+            assert record.diff_txt_dict.get(sql_file, "") == "\n".join(diff_txt.split("\n")[1:])
+
+
+@pytest.mark.order(64)
+def test_get_commits_query(tmp_path):
+    assert history.get_log_args() == ["--follow", "--", "*.sql"]
+    assert history.get_log_args(history.CommitQuery("v1..v2", "2024-01-01", None,
+                                                    ["db/", "a.sql"])) == \
+        ["--since=2024-01-01", "--end-of-options", "v1..v2", "--", "db/*.sql", "a.sql"]
+    # (the revisions are not options of git)
+    for query in [history.CommitQuery(rev_range="--output=pwned.txt"),
+                  history.CommitQuery(refs=["master", "-p"])]:
+        with pytest.raises(ValueError):
+            history.get_log_args(query)
+
+    repo_cmd = bench.generate_repo(str(tmp_path), commits_num=60, sql_files_num=4)
+    commits = main.prepare_commits_df(main.get_commits(repo_cmd))["commit"].tolist()
+    # (a commit per minute since 2020-01-01)
+    window_df = main.prepare_commits_df(main.get_commits(repo_cmd, history.CommitQuery(
+        since="2020-01-01T00:30:00+00:00", until="2020-01-01T00:39:00+00:00")))
+    assert window_df["commit"].tolist() == commits[30:40]
+    range_df = main.prepare_commits_df(main.get_commits(
+        repo_cmd, history.CommitQuery(rev_range=f"{commits[49]}..master")))
+    assert range_df["commit"].tolist() == commits[50:]
+    files_df = main.prepare_commits_df(main.get_commits(
+        repo_cmd, history.CommitQuery(paths=["sql/schema_1.sql", "sql/schema_2.sql"])))
+    assert set(files_df["commit"]) == set(repo_cmd.execute(
+        ["git", "log", "--format=%H", "--", "sql/schema_1.sql", "sql/schema_2.sql"]).split())
+    assert len(main.prepare_commits_df(main.get_commits(
+        repo_cmd, history.CommitQuery(since="2030-01-01")))) == 0
+
+
+def commit_files(repo_cmd, files):
+    # files: path -> the new content (bytes)
+    for path, data in files.items():
+        file_path = os.path.join(repo_cmd.working_dir, path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, "wb") as file_f:
+            file_f.write(data)
+        repo_cmd.execute(["git", "add", path])
+    repo_cmd.execute(["git", "-c", "user.name=Test", "-c", "user.email=test@example.com",
+                      "commit", "-q", "-m", "Commit"])
+    return repo_cmd.execute(["git", "rev-parse", "HEAD"])
+
+
+def get_baseline_commit_res(repo_cmd, commit, sql_classifier):
+    # the result of a commit by a git command per commit and SQL file
+    type_files_lst = main.get_change_type(repo_cmd, commit)
+    diff_txt_dict = {sql_file: "\n".join(main.get_commit_file_diff_text(
+        repo_cmd, commit, sql_file).split("\n")[1:])
+        for _, sql_file in main.keep_only_sql_files(type_files_lst)}
+    return main.analyze_commit(history.CommitRecord(commit, type_files_lst, diff_txt_dict, {}, {}),
+                               sql_classifier)
+
+
+@pytest.mark.order(70)
+def test_commit_records_special_paths(tmp_path):
+    # (git ends the '+++' lines of a path with a space with a TAB)
+    repo_cmd = git.cmd.Git(str(tmp_path))
+    repo_cmd.execute(["git", "init", "-q"])
+    sql_file = "sql/my schema.sql"
+    commits = [commit_files(repo_cmd, {sql_file: b"create table t (a int);\n"}),
+               commit_files(repo_cmd, {sql_file: b"-- the table t\ncreate table t (a int);\n"})]
+    sql_classifier = classifier.Classifier(prep.get_json_data_regex())
+    commits_res = dict(main.iter_commits_res(repo_cmd, commits, sql_classifier))
+    assert commits_res[commits[1]] == {"ChangedFilesNum": 1, "SQLFilesNum": 1,
+                                       "Comments": [sql_file]}
+    for commit in commits:
+        assert commits_res[commit] == get_baseline_commit_res(repo_cmd, commit, sql_classifier)
+
+
+@pytest.mark.order(71)
+def test_commit_records_nul_bytes(tmp_path):
+    # (a NUL byte after the binary check of git, in the first 8000 bytes, is in the text diff
+    # and does not start the output of another commit)
+    repo_cmd = git.cmd.Git(str(tmp_path))
+    repo_cmd.execute(["git", "init", "-q"])
+    padding = b"".join(b"insert into t values (%d);\n" % i for i in range(400))
+    commits = [commit_files(repo_cmd, {"a.sql": padding, "b.sql": b"create table t (a int);\n"}),
+               commit_files(repo_cmd, {"a.sql": padding + b"select '\0';\n"}),
+               commit_files(repo_cmd, {"b.sql": b"create table t (a int, b int);\n"}),
+               commit_files(repo_cmd, {"a.sql": padding + b"select '\0\0';\n"})]
+    sql_classifier = classifier.Classifier(prep.get_json_data_regex())
+    commits_res = dict(main.iter_commits_res(repo_cmd, commits, sql_classifier))
+    for commit in commits:
+        assert commits_res[commit] == get_baseline_commit_res(repo_cmd, commit, sql_classifier)
+
+    # (also with a marker split between the blocks read)
+    class Output:
+        def __init__(self, data):
+            self.stdout = io.BytesIO(data)
+
+    marker = history.get_chunk_marker()
+    data = b"".join(marker + b"%d\n+\0x%s\n" % (i, marker[:i]) for i in range(len(marker)))
+    for read_size in [1, 2, 5, 1 << 16]:
+        assert list(history.iter_commit_chunks(Output(data), marker, read_size=read_size)) == \
+            [(str(i), [f"+\0x{marker[:i].decode()}"]) for i in range(len(marker))]
+
+
+@pytest.mark.order(72)
+def test_commit_records_need_diff_chunks(tmp_path):
+    repo_cmd = bench.generate_repo(str(tmp_path), commits_num=30, sql_files_num=4)
+    commits = main.prepare_commits_df(main.get_commits(repo_cmd))["commit"].tolist()
+    expected_records = list(history.iter_commit_records(repo_cmd, commits))
+    need_diff_commits = []
+
+    def need_diff(record):
+        need_diff_commits.append(record.commit)
+        return commits.index(record.commit) % 3 != 0
+
+    records = history.iter_commit_records(repo_cmd, commits, need_diff=need_diff,
+                                          need_diff_chunk_size=7)
+    # (the statuses are read in chunks, not all before the first record)
+    first_record = next(records)
+    assert need_diff_commits == commits[:7]
+    records = [first_record] + list(records)
+    assert need_diff_commits == commits
+    assert [record.commit for record in records] == commits
+    for position, (record, expected_record) in enumerate(zip(records, expected_records)):
+        if position % 3 == 0:
+            assert record == expected_record._replace(diff_txt_dict=None)
+        else:
+            assert record == expected_record
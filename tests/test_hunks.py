@@ -0,0 +1,70 @@
+import time
+import pytest
+
+import main
+import hunks
+
+
+def get_synthetic_diff_text(hunks_num):
+    diff_lst = ["diff --git a/schema.sql b/schema.sql",
+                "index 9c5b2f6..427fb33 100644",
+                "--- a/schema.sql",
+                "+++ b/schema.sql"]
+    for i in range(hunks_num):
+        # the same header for every hunk
+        diff_lst += ["@@ -1 +1 @@",
+                     f"-insert into tab_1 values ({i});",
+                     f"+insert into tab_1 values ({i + 1});"]
+    return "\n".join(diff_lst)
+
+
+@pytest.mark.parametrize(
+    "header_line, header_values",
+    [("@@ -33 +32,0 @@ set feedback off", (33, 1, 32, 0)),
+     ("@@ -0,0 +1,12 @@", (0, 0, 1, 12)),
+     ("@@ -5,2 +7 @@", (5, 2, 7, 1)),
+     ("@@ invalid @@", (None, None, None, None))])
+@pytest.mark.order(25)
+def test_parse_hunk_header(header_line, header_values):
+    assert hunks.parse_hunk_header(header_line) == header_values
+
+
+@pytest.mark.order(26)
+def test_iter_hunks():
+    diff_txt = ("--- a/schema.sql\n"
+                "+++ b/schema.sql\n"
+                "@@ -3,2 +3 @@ create table tab_1 (\n"
+                "-    col_1 int,\n"
+                "-    col_2 int\n"
+                "+    col_1 bigint\n"
+                "@@ -10 +9,0 @@\n"
+                "--- comment")
+    hunks_lst = list(hunks.iter_hunks(diff_txt))
+    assert len(hunks_lst) == 2
+    assert hunks_lst[0][:4] == (3, 2, 3, 1)
+    assert hunks_lst[0].removed_lines == ["    col_1 int,", "    col_2 int"]
+    assert hunks_lst[0].added_lines == ["    col_1 bigint"]
+    assert hunks_lst[1].removed_lines == ["-- comment"]
+    assert hunks_lst[1].added_lines == []
+
+
+@pytest.mark.order(27)
+def test_changed_blocks_duplicate_headers():
+    changed_blocks_lst = main.prepare_changed_blocks(get_synthetic_diff_text(3))
+    assert changed_blocks_lst == [f"insert into tab_1 values ({i});\n"
+                                  f"insert into tab_1 values ({i + 1});" for i in range(3)]
+
+
+@pytest.mark.order(28)
+def test_changed_blocks_preparation_scales_linearly():
+    def get_duration(hunks_num):
+        diff_txt = get_synthetic_diff_text(hunks_num)
+        durations = []
+        for _ in range(3):
+            start = time.perf_counter()
+            main.prepare_changed_blocks(diff_txt)
+            durations.append(time.perf_counter() - start)
+        return min(durations)
+
+    # 10 times more hunks, which would be ~100 times slower with a quadratic algorithm
+    assert get_duration(50000) < 30 * get_duration(5000)
@@ -5,6 +5,7 @@ import requests
 
 import main
 import prep
+import classifier
 
 
 change_type_scenarios = {
@@ -199,3 +200,17 @@ def test_changed_blocks_preparation(user, repo, commit_1, commit_2,
     changed_blocks_lst = main.prepare_changed_blocks(diff_text)
     assert len(changed_blocks_lst) == blocks_num
     assert len("\n".join(changed_blocks_lst).split("\n")) == total_diff_size
+
+
+@pytest.mark.dependency(name="commits-res-shards",
+                        depends=["get-commits-check-num"],
+                        scope="session")
+@pytest.mark.order(34)
+def test_iter_commits_res_shards_same_as_sequential(get_repo_path):
+    _, path = get_repo_path
+    repo_cmd = git.cmd.Git(path)
+    commits = main.prepare_df(main.get_commits(repo_cmd))["commit"].tolist()[:100]
+    sql_classifier = classifier.Classifier(prep.get_json_data_regex())
+    commits_res = list(main.iter_commits_res(repo_cmd, commits, sql_classifier))
+    assert [commit for commit, _ in commits_res] == commits
+    assert list(main.iter_commits_res(repo_cmd, commits, sql_classifier, shards=3)) == commits_res
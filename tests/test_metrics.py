@@ -0,0 +1,74 @@
+import os
+import json
+import pstats
+import argparse
+import pytest
+import pandas as pd
+
+import main
+import prep
+import metrics
+import classifier
+
+
+@pytest.mark.order(43)
+def test_metrics_write(tmp_path):
+    metrics_obj = metrics.Metrics()
+    with metrics_obj.timer("git_read"):
+        metrics_obj.count("git_diff_bytes", 100)
+    metrics_obj.end_commit("commit_1")
+    with metrics_obj.timer("populate", per_commit=False):
+        metrics_obj.count("git_diff_bytes", 50)
+    metrics_obj.end_commit("commit_2")
+    # e.g. the metrics of a worker process
+    other_metrics = metrics.Metrics()
+    other_metrics.count("files_classified", 3)
+    other_metrics.end_commit("commit_3")
+    metrics_obj.merge(other_metrics)
+
+    metrics_obj.write(os.path.join(tmp_path, "prj"))
+    with open(os.path.join(tmp_path, "prj.metrics.json"), encoding="utf-8") as json_f:
+        metrics_dict = json.load(json_f)
+    assert sorted(metrics_dict["stages"]) == ["git_read", "populate"]
+    assert metrics_dict["counters"] == {"git_diff_bytes": 150, "files_classified": 3}
+    assert metrics_dict["commits"] == 3
+    df = pd.read_csv(os.path.join(tmp_path, "prj.metrics.csv"))
+    assert df["commit"].tolist() == ["commit_1", "commit_2", "commit_3"]
+    assert df["git_diff_bytes"].tolist() == [100, 50, 0]
+    assert df["files_classified"].tolist() == [0, 0, 3]
+    assert "populate" not in df.columns
+
+
+@pytest.mark.order(44)
+def test_classifier_metrics():
+    diff_txt = ("@@ -1,0 +1,3 @@\n"
+                "+-- new comment\n"
+                "+insert into tab values (1);\n"
+                "+create index idx on tab (col);")
+    sql_classifier = classifier.Classifier(prep.get_json_data_regex())
+    categories_lst = sql_classifier.get_categories(diff_txt)
+    metrics_obj = metrics.activate(metrics.Metrics())
+    try:
+        assert sql_classifier.get_categories(diff_txt) == categories_lst
+    finally:
+        metrics.deactivate()
+    assert metrics_obj.counters["lines_classified"] == 3
+    assert {"hunk_splitting", "regex:Comments", "regex:DML",
+            "regex:Index"} <= set(metrics_obj.timings)
+
+
+@pytest.mark.order(45)
+def test_commit_range_profiler(tmp_path):
+    assert main.parse_commit_range("5:10") == (5, 10)
+    assert main.parse_commit_range("5:") == (5, None)
+    with pytest.raises(argparse.ArgumentTypeError):
+        main.parse_commit_range("10:5")
+
+    profiler = metrics.CommitRangeProfiler(1, 2)
+    for position in range(3):
+        profiler.step(position)
+        assert profiler.enabled == (position == 1)
+        sorted(range(1000))
+    prof_path = os.path.join(tmp_path, "prj.prof")
+    profiler.dump(prof_path)
+    assert pstats.Stats(prof_path).total_calls > 0
@@ -0,0 +1,86 @@
+import os
+import time
+import pickle
+import threading
+import pytest
+
+import main
+import prep
+import bench
+import cache
+import metrics
+import pipeline
+import classifier
+
+
+@pytest.mark.order(57)
+def test_iter_prefetched():
+    assert list(pipeline.iter_prefetched(range(100), 3)) == list(range(100))
+
+    # the exception of the producer is raised in the consumer
+    def iter_failing():
+        yield 1
+        raise ValueError("producer")
+
+    items = []
+    with pytest.raises(ValueError, match="producer"):
+        for item in pipeline.iter_prefetched(iter_failing(), 2):
+            items.append(item)
+    assert items == [1]
+
+    # a closed consumer stops the producer (which is blocked by the full queue)
+    produced = []
+    closed = threading.Event()
+
+    def iter_endless():
+        try:
+            while True:
+                produced.append(len(produced))
+                yield produced[-1]
+        finally:
+            closed.set()
+
+    items = pipeline.iter_prefetched(iter_endless(), 2)
+    assert next(items) == 0
+    time.sleep(0.1)
+    items.close()
+    assert closed.is_set()
+    assert len(produced) <= 4
+
+
+@pytest.mark.order(58)
+def test_iter_mapped():
+    def fetch(item):
+        # (later items are fetched faster)
+        time.sleep(0.01 * (10 - item))
+        return item * 2
+
+    assert list(pipeline.iter_mapped(fetch, range(10), workers=4, queue_size=4)) == \
+        [item * 2 for item in range(10)]
+    assert list(pipeline.iter_mapped(fetch, [], workers=2, queue_size=2)) == []
+
+
+@pytest.mark.parametrize("diff_engine", ["python", "git"])
+@pytest.mark.order(59)
+def test_pipelined_commits_res(tmp_path, diff_engine):
+    repo_path = os.path.join(tmp_path, "repo")
+    repo_cmd = bench.generate_repo(repo_path, commits_num=40, sql_files_num=3)
+    commits = repo_cmd.execute(["git", "rev-list", "--reverse", "master"]).split()
+    sql_classifier = classifier.Classifier(prep.get_json_data_regex())
+    expected_commits_res = list(main.iter_commits_res(repo_cmd, commits, sql_classifier,
+                                                      diff_engine=diff_engine))
+
+    pipeline_metrics = metrics.activate(metrics.Metrics())
+    try:
+        commits_res = list(main.iter_commits_res(
+            repo_cmd, commits, sql_classifier,
+            blob_cache=cache.BlobPairCache("regex_hash", maxsize=10), diff_engine=diff_engine,
+            pipeline_config=pipeline.PipelineConfig(4, 2)))
+    finally:
+        metrics.deactivate()
+    assert commits_res == expected_commits_res
+    # (the counters of the fetch threads are not lost)
+    bytes_counter = "blob_bytes" if diff_engine == "python" else "git_diff_bytes"
+    assert pipeline_metrics.counters[bytes_counter] > 0
+    # the metrics (without the lock) are passed from the worker processes
+    assert pickle.loads(pickle.dumps(pipeline_metrics)).counters == pipeline_metrics.counters
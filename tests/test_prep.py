@@ -1,8 +1,14 @@
 import os
 import git
 import pytest
+import pandas as pd
 
 import prep
+import main
+import bench
+import cache
+import history
+import classifier
 
 
 @pytest.mark.order(8)
@@ -38,3 +44,129 @@ def test_check_create_results_folder():
     prep.check_create_results_folder(results_dir_path)
     assert os.path.exists(results_dir_path)
     # os.rmdir(results_dir_path)
+
+
+def create_remote_repo(tmp_path):
+    # a local bare repository as remote (with a file:// URL, so that partial clones work)
+    work_path = os.path.join(tmp_path, "work")
+    bench.generate_repo(work_path, commits_num=40, sql_files_num=3)
+    remote_path = os.path.join(tmp_path, "remote.git")
+    git.Repo.clone_from(work_path, remote_path, bare=True)
+    remote_cmd = git.cmd.Git(remote_path)
+    remote_cmd.execute(["git", "config", "uploadpack.allowFilter", "true"])
+    remote_cmd.execute(["git", "config", "uploadpack.allowAnySHA1InWant", "true"])
+    return work_path, remote_path
+
+
+@pytest.mark.order(49)
+def test_check_clone_repos_partial_update(tmp_path, monkeypatch):
+    work_path, remote_path = create_remote_repo(tmp_path)
+    monkeypatch.setattr(prep, "HOME_DIR", str(tmp_path))
+    os.mkdir(os.path.join(tmp_path, "repos"))
+    full_prj = {"name": "full", "check": True, "url": f"file://{remote_path}"}
+    partial_prj = {"name": "partial", "check": True, "url": f"file://{remote_path}"}
+    assert prep.check_clone_repos([full_prj], jobs=2) == []
+    assert prep.check_clone_repos([partial_prj], jobs=2, partial=True) == []
+
+    full_cmd = git.cmd.Git(prep.get_repo_path(full_prj))
+    partial_cmd = git.cmd.Git(prep.get_repo_path(partial_prj))
+    assert not prep.is_partial_clone(full_cmd)
+    assert prep.is_partial_clone(partial_cmd)
+    assert git.Repo(prep.get_repo_path(partial_prj)).active_branch.name == "master"
+    # all blobs of the SQL files, but not the other blobs
+    assert prep.get_missing_sql_blobs(partial_cmd) == []
+    assert "?" in partial_cmd.execute(["git", "rev-list", "--objects", "--missing=print", "HEAD"])
+    assert main.get_commits(partial_cmd) == main.get_commits(full_cmd)
+
+    # new commits are fetched into the existing clones
+    work_cmd = git.cmd.Git(work_path)
+    with open(os.path.join(work_path, "sql", "new.sql"), "w", encoding="utf-8") as sql_f:
+        sql_f.write("insert into tab_0 values (1);\n")
+    work_cmd.execute(["git", "add", "sql/new.sql"])
+    work_cmd.execute(["git", "-c", "user.name=Test", "-c", "user.email=test@example.com",
+                      "commit", "-q", "-m", "New commit"])
+    work_cmd.execute(["git", "push", "-q", remote_path, "master"])
+    failed_projects = prep.check_clone_repos([full_prj, partial_prj], jobs=2, partial=True,
+                                             update=True)
+    assert failed_projects == []
+    head = work_cmd.execute(["git", "rev-parse", "HEAD"])
+    for repo_cmd in [full_cmd, partial_cmd]:
+        assert repo_cmd.execute(["git", "rev-parse", "master"]) == head
+    assert prep.get_missing_sql_blobs(partial_cmd) == []
+
+
+@pytest.mark.order(50)
+def test_check_clone_repos_failed(tmp_path, monkeypatch):
+    monkeypatch.setattr(prep, "HOME_DIR", str(tmp_path))
+    os.mkdir(os.path.join(tmp_path, "repos"))
+    missing_prj = {"name": "missing", "check": True,
+                   "url": f"file://{os.path.join(tmp_path, 'missing.git')}"}
+    assert prep.check_clone_repos([missing_prj]) == ["missing"]
+
+
+def commit_sql_file(work_cmd, work_path, sql_txt):
+    with open(os.path.join(work_path, "sql", "new.sql"), "a", encoding="utf-8") as sql_f:
+        sql_f.write(sql_txt)
+    work_cmd.execute(["git", "add", "sql/new.sql"])
+    work_cmd.execute(["git", "-c", "user.name=Test", "-c", "user.email=test@example.com",
+                      "commit", "-q", "-m", "New commit"])
+    return work_cmd.execute(["git", "rev-parse", "HEAD"])
+
+
+@pytest.mark.order(69)
+def test_analyze_refs(tmp_path, monkeypatch):
+    work_path, remote_path = create_remote_repo(tmp_path)
+    # (a release branch with 2 commits of its own, started 10 commits before master)
+    work_cmd = git.cmd.Git(work_path)
+    work_cmd.execute(["git", "checkout", "-q", "-b", "release", "master~10"])
+    release_commits = [commit_sql_file(work_cmd, work_path, f"insert into t values ({i});\n")
+                       for i in range(2)]
+    work_cmd.execute(["git", "push", "-q", remote_path, "release"])
+    data_regex = prep.get_json_data_regex()
+    monkeypatch.setattr(prep, "HOME_DIR", str(tmp_path))
+    monkeypatch.setattr(main, "HOME_DIR", str(tmp_path))
+    os.mkdir(os.path.join(tmp_path, "repos"))
+    prjs = [{"name": name, "check": True, "url": f"file://{remote_path}",
+             "refs": ["master", "release"]} for name in ["full", "partial"]]
+    assert prep.check_clone_repos(prjs[:1]) == []
+    assert prep.check_clone_repos(prjs[1:], partial=True) == []
+    partial_cmd = git.cmd.Git(prep.get_repo_path(prjs[1]))
+    assert prep.get_missing_sql_blobs(partial_cmd, ["master", "release"]) == []
+
+    # each commit of both branches once, with the branches containing it
+    master_commits = work_cmd.execute(["git", "rev-list", "master", "--", "*.sql"]).split()
+    results_dir_path = os.path.join(tmp_path, "results")
+    os.mkdir(results_dir_path)
+    for prj in prjs:
+        main.analyze_project(prj, classifier.Classifier(data_regex),
+                             cache.get_regex_hash(data_regex), results_dir_path,
+                             main.parse_args([]))
+        df = pd.read_csv(os.path.join(results_dir_path, f'{prj["name"]}.csv'))
+        assert df.columns[3] == "refs"
+        assert len(df) == df["commit"].nunique() == len(master_commits) + 2
+        commit_refs = dict(zip(df["commit"], df["refs"]))
+        assert [commit_refs[commit] for commit in release_commits] == ["{'release'}"] * 2
+        assert commit_refs[master_commits[0]] == "{'master'}"
+        assert commit_refs[master_commits[-1]] == "{'master', 'release'}"
+        assert df.loc[df["commit"] == release_commits[0], "DML"].item() == "{'sql/new.sql'}"
+
+    # (the walk of the refs stops at '--since', the commits of the release branch are newer)
+    commit_refs = history.get_commit_refs(partial_cmd, ["master", "release"], since="2021-01-01")
+    assert [commit_refs[commit] for commit in release_commits] == [2, 2]
+    assert master_commits[-1] not in commit_refs
+
+    # new commits of both branches are fetched into the existing clones
+    # (also if another branch than the first ref is checked out)
+    release_commits.append(commit_sql_file(work_cmd, work_path, "delete from t;\n"))
+    work_cmd.execute(["git", "checkout", "-q", "master"])
+    master_commit = commit_sql_file(work_cmd, work_path, "update t set a = 1;\n")
+    work_cmd.execute(["git", "push", "-q", remote_path, "master", "release"])
+    git.cmd.Git(prep.get_repo_path(prjs[0])).execute(["git", "checkout", "-q", "release"])
+    assert prep.check_clone_repos(prjs, partial=True, update=True) == []
+    for prj in prjs:
+        repo_cmd = git.cmd.Git(prep.get_repo_path(prj))
+        assert repo_cmd.execute(["git", "rev-parse", "release"]) == release_commits[-1]
+        assert repo_cmd.execute(["git", "rev-parse", "master"]) == master_commit
+        assert repo_cmd.execute(["git", "symbolic-ref", "--short", "HEAD"]) == "master"
+        assert history.get_commit_refs(repo_cmd, ["master", "release"])[release_commits[-1]] == 2
+    assert prep.get_missing_sql_blobs(partial_cmd, ["master", "release"]) == []
@@ -0,0 +1,166 @@
+import os
+import pytest
+import pandas as pd
+
+import main
+import prep
+import bench
+import cache
+import results
+import classifier
+
+
+@pytest.mark.parametrize(
+    "sql_files, sql_files_txt",
+    [(set(), "set()"),
+     ({"sql_file_1"}, "{'sql_file_1'}"),
+     ({"b/sql_file_2", "a/sql_file_3", "sql_file_1"},
+      "{'a/sql_file_3', 'b/sql_file_2', 'sql_file_1'}")])
+@pytest.mark.order(33)
+def test_format_sql_files(sql_files, sql_files_txt):
+    assert results.format_sql_files(sql_files) == sql_files_txt
+    assert eval(sql_files_txt) == sql_files  # pylint: disable=eval-used
+
+
+COMMITS_INFO_TXT = \
+    "a20812702f34235202384c23842805b923293841;2008-03-28T15:01:43+00:00;" \
+    "2008-03-28T15:01:43+00:00\n" \
+    "b892380230e23123124ac80e8238402739427312;2019-01-12T11:55:37-08:00;" \
+    "2019-01-12T11:55:37-08:00\n" \
+    "c7148304923804223e2342f232342a234234ff33;2011-05-16T11:55:22-04:00;" \
+    "2011-05-16T11:55:22-04:00"
+
+
+def get_result_store():
+    result_store = results.ResultStore(main.prepare_commits_df(COMMITS_INFO_TXT))
+    result_store.add_commit_res("a20812702f34235202384c23842805b923293841",
+                                {"ChangedFilesNum": 3, "SQLFilesNum": 2,
+                                 "DML": ["sql_file_1", "sql_file_2"], "Other": ["sql_file_1"]})
+    result_store.add_commit_res("b892380230e23123124ac80e8238402739427312",
+                                {"ChangedFilesNum": 1, "SQLFilesNum": 1,
+                                 "Renaming": ["sql_file_1"]})
+    return result_store
+
+
+@pytest.mark.order(35)
+def test_result_store():
+    result_store = get_result_store()
+    assert len(result_store) == 4
+    assert result_store.files == ["sql_file_1", "sql_file_2"]
+    assert ("b892380230e23123124ac80e8238402739427312", "sql_file_1", "Renaming") in \
+        list(result_store.iter_rows())
+
+    df = result_store.to_df()
+    assert df.columns.tolist() == main.prepare_df(COMMITS_INFO_TXT).columns.tolist()
+    # sorted by commit date
+    assert df["commit"].str[0].tolist() == ["a", "c", "b"]
+    assert df[["ChangedFilesNum", "SQLFilesNum"]].values.tolist() == [[3, 2], [0, 0], [1, 1]]
+    assert df["DML"].tolist() == ["{'sql_file_1', 'sql_file_2'}", "set()", "set()"]
+    assert df["Renaming"].tolist() == ["set()", "set()", "{'sql_file_1'}"]
+    assert result_store.to_df(set)["Other"].tolist() == [{"sql_file_1"}, set(), set()]
+
+
+@pytest.mark.parametrize("output_format", ["parquet", "feather"])
+@pytest.mark.order(36)
+def test_result_store_columnar_output(tmp_path, output_format):
+    pytest.importorskip("pyarrow")
+    path_prefix = os.path.join(tmp_path, "prj")
+    get_result_store().write(path_prefix, output_format)
+    commits_df, files_df = results.read_results(path_prefix, output_format)
+    assert str(commits_df["commit_date"].dtype) == "datetime64[ns, UTC]"
+    assert commits_df["commit_date"].dt.year.tolist() == [2008, 2011, 2019]
+    assert commits_df["author_date_utc_offset"].tolist() == [0, -240, -480]
+    local_dates = commits_df["commit_date"] + pd.to_timedelta(
+        commits_df["commit_date_utc_offset"], unit="min")
+    assert local_dates.dt.hour.tolist() == [15, 11, 11]
+    assert commits_df["SQLFilesNum"].tolist() == [2, 0, 1]
+    assert len(files_df) == 4
+    assert files_df[files_df["category"] == "DML"]["file"].tolist() == ["sql_file_1",
+                                                                         "sql_file_2"]
+
+
+def analyze_repo_project(tmp_path, monkeypatch, argv):
+    # a synthetic project in 'tmp_path' (results in 'tmp_path/results')
+    monkeypatch.setattr(main, "HOME_DIR", str(tmp_path))
+    repo_path = os.path.join(tmp_path, "repos", "prj")
+    if not os.path.exists(repo_path):
+        bench.generate_repo(repo_path, commits_num=60, sql_files_num=4)
+    results_dir_path = os.path.join(tmp_path, "results")
+    os.makedirs(results_dir_path, exist_ok=True)
+    data_regex = prep.get_json_data_regex()
+    return main.analyze_project({"name": "prj"}, classifier.Classifier(data_regex),
+                                cache.get_regex_hash(data_regex), results_dir_path,
+                                main.parse_args(argv))
+
+
+@pytest.mark.order(52)
+def test_stream_csv_resume(tmp_path, monkeypatch):
+    path_prefix = analyze_repo_project(tmp_path, monkeypatch, [])
+    with open(f"{path_prefix}.csv", encoding="utf-8") as csv_f:
+        expected_csv = csv_f.read()
+    os.remove(f"{path_prefix}.sqlite")
+
+    # interrupted after 3 chunks (of 10 commits)
+    class Interrupted(Exception):
+        pass
+
+    write_chunk = results.ResultStreamWriter.write_chunk
+    written_commits = []
+    interrupted = []
+
+    def write_chunk_interrupted(self, result_store):
+        if len(written_commits) == 30 and not interrupted:
+            interrupted.append(True)
+            raise Interrupted
+        written_commits.extend(result_store.commits_df["commit"])
+        write_chunk(self, result_store)
+
+    monkeypatch.setattr(results.ResultStreamWriter, "write_chunk", write_chunk_interrupted)
+    with pytest.raises(Interrupted):
+        analyze_repo_project(tmp_path, monkeypatch, ["--stream", "--chunk-size", "10"])
+    assert os.path.exists(f"{path_prefix}.csv.partial")
+    assert results.ResultStreamWriter(path_prefix).read_progress()["commits"] == 30
+
+    # the written chunks are not written again
+    analyze_repo_project(tmp_path, monkeypatch, ["--stream", "--chunk-size", "10"])
+    assert len(written_commits) == len(set(written_commits)) == 60
+    assert not os.path.exists(f"{path_prefix}.csv.partial")
+    assert not os.path.exists(f"{path_prefix}.csv.progress")
+    with open(f"{path_prefix}.csv", encoding="utf-8") as csv_f:
+        assert csv_f.read() == expected_csv
+
+
+@pytest.mark.order(53)
+def test_stream_parquet(tmp_path, monkeypatch):
+    pytest.importorskip("pyarrow")
+    path_prefix = analyze_repo_project(tmp_path, monkeypatch, ["--output-format", "parquet"])
+    expected_commits_df, expected_files_df = results.read_results(path_prefix)
+    analyze_repo_project(tmp_path, monkeypatch, ["--output-format", "parquet", "--stream",
+                                                 "--chunk-size", "7", "--no-cache"])
+    commits_df, files_df = results.read_results(path_prefix)
+    assert not os.path.exists(f"{path_prefix}.parquet.parts")
+    pd.testing.assert_frame_equal(commits_df, expected_commits_df)
+    assert str(files_df["file"].dtype) == "category"
+    assert files_df.astype(str).values.tolist() == expected_files_df.astype(str).values.tolist()
+    with pytest.raises(SystemExit):
+        main.parse_args(["--stream", "--output-format", "feather"])
+
+
+@pytest.mark.order(65)
+def test_analyze_commit_query(tmp_path, monkeypatch):
+    full_path_prefix = analyze_repo_project(tmp_path, monkeypatch, [])
+    assert full_path_prefix == os.path.join(tmp_path, "results", "prj")
+    full_df = pd.read_csv(f"{full_path_prefix}.csv")
+    # (the cached results of the full run are reused)
+    window_argv = ["--since", "2020-01-01T00:30:00+00:00", "--until", "2020-01-01T00:39:00+00:00"]
+    path_prefix = analyze_repo_project(tmp_path, monkeypatch, window_argv)
+    window_df = pd.read_csv(f"{path_prefix}.csv")
+    assert window_df.equals(full_df.iloc[30:40].reset_index(drop=True))
+    # (a window does not replace the full results, the same window replaces its own)
+    assert os.path.basename(path_prefix).startswith("prj_window_")
+    assert pd.read_csv(f"{full_path_prefix}.csv").equals(full_df)
+    assert analyze_repo_project(tmp_path, monkeypatch, window_argv) == path_prefix
+    path_prefix = analyze_repo_project(tmp_path, monkeypatch, ["--no-cache", "--stream",
+                                                               "--since", "2030-01-01"])
+    assert len(pd.read_csv(f"{path_prefix}.csv")) == 0
+    assert pd.read_csv(f"{full_path_prefix}.csv").equals(full_df)
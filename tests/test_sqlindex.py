@@ -0,0 +1,42 @@
+import os
+import git
+import pytest
+
+import main
+import bench
+import history
+import sqlindex
+
+
+@pytest.mark.order(51)
+def test_sql_change_index(tmp_path):
+    repo_path = os.path.join(tmp_path, "repo")
+    bench.generate_repo(repo_path, commits_num=40, sql_files_num=3,
+                        change_weights=bench.get_change_weights("rename=1,dml=1,ddl=1"))
+    repo_cmd = git.cmd.Git(repo_path)
+    commits = repo_cmd.execute(["git", "rev-list", "--reverse", "master"]).split()
+    index_path = sqlindex.get_index_path(repo_cmd)
+    assert os.path.dirname(index_path) == os.path.join(repo_path, ".git")
+
+    with sqlindex.SQLChangeIndex(index_path) as sql_index:
+        assert sql_index.update(repo_cmd, commits[:30]) == 30
+    # incremental update (the index is reopened)
+    with sqlindex.SQLChangeIndex(index_path) as sql_index:
+        assert sql_index.update(repo_cmd, commits) == 10
+        assert sql_index.update(repo_cmd, commits) == 0
+        index_records = list(sql_index.iter_records(commits))
+
+        assert [record.commit for record in index_records] == commits
+        for index_record, record in zip(index_records,
+                                        history.iter_status_records(repo_cmd, commits)):
+            assert index_record.changed_files_num == len(record.type_files_lst)
+            assert index_record.type_files_lst == main.keep_only_sql_files(record.type_files_lst)
+            for _, path in index_record.type_files_lst:
+                assert index_record.blobs_dict[path] == record.blobs_dict[path]
+                assert index_record.modes_dict[path] == record.modes_dict[path]
+
+        path = index_records[-1].type_files_lst[0][1]
+        file_commits = [commit for commit, _, _, _, _ in sql_index.get_file_commits(path)]
+        assert file_commits
+        assert set(file_commits) == {record.commit for record in index_records
+                                     if path in record.blobs_dict}
@@ -0,0 +1,49 @@
+import time
+import pytest
+
+import bench
+import sqllexer
+
+
+@pytest.mark.parametrize(
+    "text, tokens",
+    [("select 1; -- one\nselect 2;",
+      [("code", "select 1; "), ("line_comment", "-- one"), ("code", "\nselect 2;")]),
+     ("insert into t values ('it''s -- no', \"a\\\" # b\");",
+      [("code", "insert into t values ("), ("string", "'it''s -- no'"), ("code", ", "),
+       ("string", '"a\\" # b"'), ("code", ");")]),
+     ("select $1, $$ /* x */ $$, $tag$ $$ $tag$ from t$1",
+      [("code", "select $1, "), ("dollar_string", "$$ /* x */ $$"), ("code", ", "),
+       ("dollar_string", "$tag$ $$ $tag$"), ("code", " from t$1")]),
+     ("select `a/*` /* b */ # c",
+      [("code", "select "), ("string", "`a/*`"), ("code", " "),
+       ("block_comment", "/* b */"), ("code", " "), ("line_comment", "# c")]),
+     # (unterminated openers are code, as are the same openers after them)
+     ("x /* not closed\n y", [("code", "x /* not closed\n y")]),
+     ("x 'not closed -- y", [("code", "x 'not closed "), ("line_comment", "-- y")]),
+     ("a /* b /* c */", [("code", "a "), ("block_comment", "/* b /* c */")]),
+     ("$$ a /* b */ 'c", [("code", "$$ a "), ("block_comment", "/* b */"), ("code", " 'c")])])
+@pytest.mark.order(62)
+def test_sqllexer_tokens(text, tokens):
+    lexed_tokens = list(sqllexer.iter_tokens(text))
+    assert [(token.kind, token.text) for token in lexed_tokens] == tokens
+    assert all(text[token.start:].startswith(token.text) for token in lexed_tokens)
+    assert "".join(token.text for token in lexed_tokens) == text
+
+
+@pytest.mark.order(63)
+def test_sqllexer_strip_comments():
+    assert sqllexer.strip_comments("a -- b\n/* c */d # e") == "a \nd "
+    assert sqllexer.strip_comments("select '-- kept', \"# kept\";") == \
+        "select '-- kept', \"# kept\";"
+    assert sqllexer.strip_comments("name varchar(20) /* name") == "name varchar(20) /* name"
+    assert sqllexer.strip_comments("no comments") == "no comments"
+    # (linear time on the unclosed comments on which the regex backtracks)
+    start = time.perf_counter()
+    assert sqllexer.strip_comments("/* a " * 100000) == "/* a " * 100000
+    assert sqllexer.strip_comments("'a' /* b " * 100000) == "'a' /* b " * 100000
+    # (distinct dollar tags, each unterminated)
+    text = bench.get_adversarial_block(bench.ADVERSARIAL_COMMENTS["unclosed_distinct_dollar_tags"],
+                                       20000) + " -- c"
+    assert sqllexer.strip_comments(text) == text[:-len("-- c")]
+    assert time.perf_counter() - start < 1
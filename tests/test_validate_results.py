@@ -0,0 +1,49 @@
+import os
+import pytest
+import pandas as pd
+
+import main
+import results
+import validate_results
+
+COMMITS_INFO_TXT = "\n".join(
+    f"{i:040x};2019-01-{i + 1:02d}T11:55:37-08:00;2019-01-{i + 1:02d}T11:55:37-08:00"
+    for i in range(1, 11))
+
+
+@pytest.mark.order(61)
+def test_validate_results(tmp_path):
+    result_store = results.ResultStore(main.prepare_commits_df(COMMITS_INFO_TXT))
+    for commit in result_store.commits_df["commit"]:
+        result_store.add_commit_res(commit, {"ChangedFilesNum": 2, "SQLFilesNum": 1,
+                                             "DML": ["db/schema.sql"]})
+    valid_csv_path = os.path.join(tmp_path, "valid.csv")
+    result_store.write_csv(valid_csv_path)
+    df = pd.read_csv(valid_csv_path)
+    df.loc[2, "commit"] = "not a commit"
+    df.loc[5, "DML"] = "{'notes.txt'}"
+    df.loc[5, "SQLFilesNum"] = 0
+    df.loc[8, "author_date"] = "1999-12-31 00:00:00+00:00"
+    invalid_csv_path = os.path.join(tmp_path, "invalid.csv")
+    df.to_csv(invalid_csv_path, index=False)
+    df.drop(columns=["PK"]).to_csv(os.path.join(tmp_path, "prj.metrics.csv"), index=False)
+
+    csv_files = validate_results.get_result_files(tmp_path)
+    assert csv_files == [invalid_csv_path, valid_csv_path]
+    # (in chunks of 3 rows, both files in parallel)
+    invalid_res, valid_res = validate_results.validate_results(csv_files, chunk_size=3, jobs=2)
+    assert (valid_res.rows, valid_res.violations_num, valid_res.violations) == (10, 0, [])
+    assert invalid_res.rows == 10
+    assert invalid_res.violations_num == 4
+    assert [(violation.line, violation.column, violation.check)
+            for violation in invalid_res.violations] == [
+        (4, "commit", "commit hash"), (7, "SQLFilesNum", "positive count"),
+        (7, "DML", "set of SQL files"), (10, "author_date", "date since 2000")]
+    limited_res = validate_results.validate_file(invalid_csv_path, max_violations=1)
+    assert (limited_res.violations_num, len(limited_res.violations)) == (4, 1)
+
+    missing_res = validate_results.validate_file(os.path.join(tmp_path, "prj.metrics.csv"))
+    assert missing_res.violations == [validate_results.Violation(
+        os.path.join(tmp_path, "prj.metrics.csv"), 1, "PK", None, "missing column")]
+    assert validate_results.main([valid_csv_path]) == 0
+    assert validate_results.main([invalid_csv_path, "--jobs", "2"]) == 1
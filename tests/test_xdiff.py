@@ -0,0 +1,66 @@
+import random
+import subprocess
+import pytest
+
+import xdiff
+import history
+
+
+def get_git_hunks_text(tmp_path, data_1, data_2):
+    # the hunks of 'git diff' (without the function names in the hunk headers)
+    path_1, path_2 = tmp_path / "old.sql", tmp_path / "new.sql"
+    path_1.write_bytes(data_1)
+    path_2.write_bytes(data_2)
+    diff_txt = subprocess.run(["git", "diff", "--no-index", "--no-color"] + history.DIFF_OPTIONS +
+                              [str(path_1), str(path_2)],
+                              capture_output=True, check=False).stdout.decode("utf-8")
+    lines = []
+    for line in diff_txt.split("\n"):
+        if line.startswith("@@ "):
+            lines.append(line[:line.index(" @@") + 3])
+        elif len(lines) > 0 and line[:1] in ("+", "-"):
+            lines.append(line)
+    return "\n".join(lines)
+
+
+@pytest.mark.parametrize(
+    "data_1, data_2",
+    [(b"", b""),
+     (b"", b"create table t (\n  id int\n);\n"),
+     (b"a\nb\nc\n", b"a\n  b  \nc"),
+     (b"a\nb\n\n\nc\n", b"a\nb\nc\n"),
+     (b"begin\n  x;\nend;\nbegin\n  y;\nend;\n", b"begin\n  x;\nend;\nbegin\n  z;\nend;\n"
+                                                b"begin\n  y;\nend;\n"),
+     (b"x\r\ny\r\n", b"x\ny\nz\n")])
+@pytest.mark.order(46)
+def test_hunks_same_as_git(tmp_path, data_1, data_2):
+    assert xdiff.get_hunks_text(data_1, data_2) == get_git_hunks_text(tmp_path, data_1, data_2)
+
+
+@pytest.mark.order(47)
+def test_hunks_same_as_git_random(tmp_path):
+    rnd = random.Random(0)
+    vocab = ["", "  ", "begin", "end;", "  select 1;", "\tinsert into t values (1);", "/*", "*/"]
+    for _ in range(50):
+        lines = [rnd.choice(vocab) for _ in range(rnd.choice([5, 50, 500]))]
+        data_1 = "\n".join(lines).encode() + b"\n"
+        for _ in range(rnd.randint(1, 10)):
+            pos = rnd.randint(0, len(lines))
+            if rnd.random() < 0.5:
+                lines[pos:pos] = [rnd.choice(vocab) for _ in range(rnd.randint(1, 5))]
+            else:
+                del lines[pos:pos + rnd.randint(1, 5)]
+        data_2 = "\n".join(lines).encode() + b"\n"
+        assert xdiff.get_hunks_text(data_1, data_2) == get_git_hunks_text(tmp_path, data_1, data_2)
+
+
+@pytest.mark.order(48)
+def test_blob_diff_text():
+    assert history.get_blob_diff_text(b"a\n", b" a\n", "100644", "100644") == ""
+    # file headers shown by git without hunks
+    assert history.get_blob_diff_text(b"", b"", "000000", "100644") == "new file mode 100644"
+    assert history.get_blob_diff_text(b"a\n", b"a\n", "100644", "100755") == \
+        "old mode 100644\nnew mode 100755"
+    assert history.get_blob_diff_text(b"\0", b"\0\0", "100644", "100644") == "Binary files differ"
+    assert history.get_blob_diff_text(b"a\n", b"", "100644", "000000") == \
+        "deleted file mode 100644\n@@ -1 +0,0 @@\n-a"
@@ -1,49 +1,175 @@
 import os
+import sys
 import glob
+import argparse
 import datetime
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
-from pandera import DataFrameSchema, Column, Check
 
 
 HOME_DIR = os.getcwd()
 
+MIN_DATE = pd.Timestamp("2000-01-01 13:01:01", tz="UTC")
+DATE_COLUMNS = ["commit_date", "author_date"]
+COUNT_COLUMNS = ["ChangedFilesNum", "SQLFilesNum"]
+CATEGORY_COLUMNS = ["Whitespace", "DML", "Index", "Comments", "NoDiffInfo", "Privilege", "PK",
+                    "Engine", "Renaming", "Other"]
+COLUMNS = ["commit"] + DATE_COLUMNS + COUNT_COLUMNS + CATEGORY_COLUMNS
 
-def transform_date_column(col_name):
-    return pd.to_datetime(df[col_name], utc=True).dt.tz_localize(None)
+# line: the line of the row in the file (the header is line 1; rows without quoted line breaks)
+Violation = namedtuple("Violation", ["file", "line", "column", "value", "check"])
+# violations: the first 'max_violations' violations of the file
+ValidationResult = namedtuple("ValidationResult", ["file", "rows", "violations_num",
+                                                   "violations"])
+
+
+def transform_date_column(c):
+    return pd.to_datetime(c, utc=True, errors="coerce").dt.tz_localize(None)
+
+
+# the checks of the columns (string series -> boolean series of the valid values)
+def check_commit_column(c):
+    return c.str.fullmatch(r"[a-z,0-9]{40}").fillna(False).astype(bool)
 
 
 def check_cat_columns(c):
-    return ((c.str.len() == 5) and (c.str == "set()")) or \
-           ((c.str.len() > 5) and (".sql" in c.str))
+    return (c == "set()") | ((c.str.len() > 5) & c.str.contains(".sql", regex=False))
 
 
 def check_date_columns(c):
-    return c >= pd.to_datetime("01/01/2000  01:01:01 PM")
-
-
-schema = DataFrameSchema({
-    "commit":           Column(str, [Check.str_length(40),
-                                     Check.str_matches(r'^[a-z,0-9]+$')]),
-    "commit_date":      Column(datetime.datetime, Check(lambda c: check_date_columns)),
-    "author_date":      Column(datetime.datetime, Check(lambda c: check_date_columns)),
-    "ChangedFilesNum":  Column(int, Check(lambda c: c > 0)),
-    "SQLFilesNum":      Column(int, Check(lambda c: c > 0)),
-    "Whitespace":       Column(str, Check(lambda c: check_cat_columns)),
-    "DML":              Column(str, Check(lambda c: check_cat_columns)),
-    "Index":            Column(str, Check(lambda c: check_cat_columns)),
-    "Comments":         Column(str, Check(lambda c: check_cat_columns)),
-    "NoDiffInfo":       Column(str, Check(lambda c: check_cat_columns)),
-    "Privilege":        Column(str, Check(lambda c: check_cat_columns)),
-    "PK":               Column(str, Check(lambda c: check_cat_columns)),
-    "Engine":           Column(str, Check(lambda c: check_cat_columns)),
-    "Renaming":         Column(str, Check(lambda c: check_cat_columns)),
-    "Other":            Column(str, Check(lambda c: check_cat_columns))
-})
-
-csv_files = glob.glob(os.path.join(HOME_DIR, "results", "*.csv"))
-for csv_file in csv_files:
-    print(f"Checking {csv_file}")
+    dates = pd.to_datetime(c, utc=True, errors="coerce")
+    return dates.notna() & (dates >= MIN_DATE)
+
+
+def check_count_columns(c):
+    return pd.to_numeric(c, errors="coerce") > 0
+
+
+COLUMN_CHECKS = {"commit": ("commit hash", check_commit_column),
+                 **{column: ("date since 2000", check_date_columns) for column in DATE_COLUMNS},
+                 **{column: ("positive count", check_count_columns) for column in COUNT_COLUMNS},
+                 **{column: ("set of SQL files", check_cat_columns)
+                    for column in CATEGORY_COLUMNS}}
+
+
+def check_distinct_values(check, c):
+    # the check of each distinct value only (most values are repeated, e.g. 'set()')
+    codes, distinct_values = pd.factorize(c)
+    valid = check(pd.Series(distinct_values, dtype=object)).to_numpy()
+    return pd.Series(valid[codes], index=c.index)
+
+
+def get_chunk_violations(csv_file, df, max_violations):
+    # the number of the violations of a chunk and the first 'max_violations' of them
+    violations_num = 0
+    violations = []
+    for column, (check_name, check) in COLUMN_CHECKS.items():
+        invalid = ~check_distinct_values(check, df[column])
+        invalid_num = int(invalid.sum())
+        if invalid_num == 0:
+            continue
+        violations_num += invalid_num
+        invalid_values = df[column][invalid].iloc[:max(0, max_violations - len(violations))]
+        violations.extend(Violation(csv_file, row + 2, column, value, check_name)
+                          for row, value in invalid_values.items())
+    return violations_num, violations
+
+
+def validate_file(csv_file, chunk_size=100000, max_violations=100):
+    # the file is read in chunks (as strings), the checks run on whole columns
+    with open(csv_file, encoding="utf-8") as csv_f:
+        header = pd.read_csv(csv_f, nrows=0).columns.tolist()
+    missing_columns = [column for column in COLUMNS if column not in header]
+    if len(missing_columns) > 0:
+        return ValidationResult(csv_file, 0, len(missing_columns),
+                                [Violation(csv_file, 1, column, None, "missing column")
+                                 for column in missing_columns])
+    rows = 0
+    violations_num = 0
+    violations = []
+    for df in pd.read_csv(csv_file, usecols=COLUMNS, dtype=str, keep_default_na=False,
+                          chunksize=chunk_size):
+        rows += len(df)
+        chunk_violations_num, chunk_violations = get_chunk_violations(
+            csv_file, df, max_violations - len(violations))
+        violations_num += chunk_violations_num
+        violations.extend(chunk_violations)
+    violations.sort(key=lambda violation: violation.line)
+    return ValidationResult(csv_file, rows, violations_num, violations)
+
+
+def get_result_files(results_dir_path):
+    # (not the '<project>.metrics.csv' files of '--metrics')
+    return sorted(csv_file for csv_file in glob.glob(os.path.join(results_dir_path, "*.csv"))
+                  if not csv_file.endswith(".metrics.csv"))
+
+
+def validate_results(csv_files=None, chunk_size=100000, jobs=1, max_violations=100):
+    # the validation results of the result files (by default 'results/*.csv'),
+    # with 'jobs' files validated in parallel (in separate processes)
+    if csv_files is None:
+        csv_files = get_result_files(os.path.join(HOME_DIR, "results"))
+    if jobs <= 1:
+        return [validate_file(csv_file, chunk_size, max_violations) for csv_file in csv_files]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(validate_file, csv_files, [chunk_size] * len(csv_files),
+                                 [max_violations] * len(csv_files)))
+
+
+def get_schema():
+    # the pandera schema of a whole result file (see '--schema')
+    # pylint: disable=import-outside-toplevel
+    from pandera import DataFrameSchema, Column, Check
+    return DataFrameSchema({
+        "commit":           Column(str, [Check.str_length(40),
+                                         Check.str_matches(r'^[a-z,0-9]+$')]),
+        "commit_date":      Column(datetime.datetime,
+                                   Check(lambda c: c >= MIN_DATE.tz_localize(None))),
+        "author_date":      Column(datetime.datetime,
+                                   Check(lambda c: c >= MIN_DATE.tz_localize(None))),
+        "ChangedFilesNum":  Column(int, Check(lambda c: c > 0)),
+        "SQLFilesNum":      Column(int, Check(lambda c: c > 0)),
+        **{column: Column(str, Check(check_cat_columns)) for column in CATEGORY_COLUMNS}
+    })
+
+
+def validate_file_schema(csv_file):
     df = pd.read_csv(csv_file)
-    df['commit_date'] = transform_date_column('commit_date')
-    df['author_date'] = transform_date_column('author_date')
-    schema.validate(df)
+    for column in DATE_COLUMNS:
+        df[column] = transform_date_column(df[column])
+    get_schema().validate(df)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="validate the result files")
+    parser.add_argument("csv_files", nargs="*",
+                        help="the result files (by default 'results/*.csv')")
+    parser.add_argument("--chunk-size", type=int, default=100000,
+                        help="rows read at once from a file")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="number of files validated in parallel")
+    parser.add_argument("--max-violations", type=int, default=100,
+                        help="violations reported per file")
+    parser.add_argument("--schema", action="store_true",
+                        help="validate each whole file with the pandera schema instead")
+    args = parser.parse_args(argv)
+    csv_files = args.csv_files or get_result_files(os.path.join(HOME_DIR, "results"))
+    if args.schema:
+        for csv_file in csv_files:
+            print(f"Checking {csv_file}")
+            validate_file_schema(csv_file)
+        return 0
+
+    violations_num = 0
+    for result in validate_results(csv_files, args.chunk_size, args.jobs, args.max_violations):
+        print(f"Checking {result.file}: {result.rows} rows, {result.violations_num} violations")
+        for violation in result.violations:
+            print(f"{violation.file}:{violation.line}: {violation.column}={violation.value!r} "
+                  f"({violation.check})")
+        violations_num += result.violations_num
+    return 1 if violations_num > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,565 @@
+#!/usr/bin/env python3
+
+from collections import Counter
+
+# port of git's line diff (xdiff: Myers algorithm with the heuristics of git, compaction of
+# the changes with the indent heuristic) for the options of 'history.DIFF_OPTIONS'
+# ('-w' makes '-b' and '--ignore-space-at-eol' redundant, '--ignore-blank-lines', '-U0');
+# the hunks of a blob pair are close to those of git, but not always the same (e.g. in the
+# placement of ambiguous changes), hence 'git' is the default diff engine
+
+# whitespace as in git (no '\v' and '\f')
+WHITESPACE = b" \t\n\r"
+LINE_WHITESPACE = b" \t\r"
+# bytes checked for NUL characters (binary files)
+BINARY_CHECK_SIZE = 8000
+
+MAX_EQLIMIT = 1024
+SIMSCAN_WINDOW = 100
+KPDIS_RUN = 4
+MAX_COST_MIN = 256
+HEUR_MIN_COST = 256
+SNAKE_CNT = 20
+K_HEUR = 4
+LINE_MAX = 2 ** 63 - 1
+
+MAX_INDENT = 200
+MAX_BLANKS = 20
+INDENT_HEURISTIC_MAX_SLIDING = 100
+START_OF_FILE_PENALTY = 1
+END_OF_FILE_PENALTY = 21
+TOTAL_BLANK_WEIGHT = -30
+POST_BLANK_WEIGHT = 6
+RELATIVE_INDENT_PENALTY = -4
+RELATIVE_INDENT_WITH_BLANK_PENALTY = 10
+RELATIVE_OUTDENT_PENALTY = 24
+RELATIVE_OUTDENT_WITH_BLANK_PENALTY = 17
+RELATIVE_DEDENT_PENALTY = 23
+RELATIVE_DEDENT_WITH_BLANK_PENALTY = 17
+INDENT_WEIGHT = 60
+
+
+def is_binary(data):
+    return b"\0" in data[:BINARY_CHECK_SIZE]
+
+
+def trim_common_tail(data_1, data_2):
+    # (git skips common 1KB blocks at the end of the files if no context is shown)
+    blk = 1024
+    trimmed = 0
+    size_1, size_2 = len(data_1), len(data_2)
+    smaller = min(size_1, size_2)
+    while (blk + trimmed <= smaller and
+           data_1[size_1 - trimmed - blk:size_1 - trimmed] ==
+           data_2[size_2 - trimmed - blk:size_2 - trimmed]):
+        trimmed += blk
+    recovered = 0
+    while recovered < trimmed:
+        recovered += 1
+        if data_1[size_1 - trimmed + recovered - 1] == ord("\n"):
+            break
+    return data_1[:size_1 - trimmed + recovered], data_2[:size_2 - trimmed + recovered]
+
+
+def split_records(data):
+    # the lines (without '\n'; a missing newline at the end of the file is irrelevant with '-w')
+    records = data.split(b"\n")
+    if records[-1] == b"":
+        records.pop()
+    return records
+
+
+def is_blank(record):
+    return record.strip(WHITESPACE) == b""
+
+
+def bogosqrt(n):
+    i = 1
+    while n > 0:
+        n >>= 2
+        i <<= 1
+    return i
+
+
+class DiffFile:
+    # the records of a file with their key without whitespace ('ha', equal records have
+    # equal keys) and the changed records ('rchg' has a sentinel at the end,
+    # which is also 'rchg[-1]')
+
+    def __init__(self, data):
+        self.records = split_records(data)
+        self.nrec = len(self.records)
+        # (the whitespace is removed from all records at once)
+        self.ha = data.translate(None, LINE_WHITESPACE).split(b"\n")[:self.nrec]
+        self.counts = Counter(self.ha)
+        self.rchg = bytearray(self.nrec + 1)
+        self.dstart = 0
+        self.dend = self.nrec - 1
+        self.rindex = []
+        self.reff_ha = []
+
+
+def trim_ends(xdf_1, xdf_2):
+    ha_1, ha_2 = xdf_1.ha, xdf_2.ha
+    lim = min(xdf_1.nrec, xdf_2.nrec)
+    i = 0
+    while i < lim and ha_1[i] == ha_2[i]:
+        i += 1
+    xdf_1.dstart = xdf_2.dstart = i
+    lim -= i
+    i = 0
+    while i < lim and ha_1[xdf_1.nrec - 1 - i] == ha_2[xdf_2.nrec - 1 - i]:
+        i += 1
+    xdf_1.dend = xdf_1.nrec - i - 1
+    xdf_2.dend = xdf_2.nrec - i - 1
+
+
+def clean_mmatch(dis, i, s, e):
+    # a record with many matches is discarded if it is surrounded by discarded records
+    s = max(s, i - SIMSCAN_WINDOW)
+    e = min(e, i + SIMSCAN_WINDOW)
+    rdis0, rpdis0 = 0, 1
+    r = 1
+    while i - r >= s:
+        if dis[i - r] == 0:
+            rdis0 += 1
+        elif dis[i - r] == 2:
+            rpdis0 += 1
+        else:
+            break
+        r += 1
+    if rdis0 == 0:
+        return False
+    rdis1, rpdis1 = 0, 1
+    r = 1
+    while i + r <= e:
+        if dis[i + r] == 0:
+            rdis1 += 1
+        elif dis[i + r] == 2:
+            rpdis1 += 1
+        else:
+            break
+        r += 1
+    if rdis1 == 0:
+        return False
+    rdis1 += rdis0
+    rpdis1 += rpdis0
+    return rpdis1 * KPDIS_RUN < rpdis1 + rdis1
+
+
+def cleanup_records(xdf, xdfo, classes):
+    # records without a match in the other file are changed, the others are compared
+    # (by the number of their equivalence class)
+    mlim = min(bogosqrt(xdf.nrec), MAX_EQLIMIT)
+    dis = [0] * (xdf.nrec + 1)
+    for i in range(xdf.dstart, xdf.dend + 1):
+        nm = xdfo.counts[xdf.ha[i]]
+        dis[i] = 0 if nm == 0 else 2 if nm >= mlim else 1
+    for i in range(xdf.dstart, xdf.dend + 1):
+        if dis[i] == 1 or (dis[i] == 2 and not clean_mmatch(dis, i, xdf.dstart, xdf.dend)):
+            xdf.rindex.append(i)
+            xdf.reff_ha.append(classes.setdefault(xdf.ha[i], len(classes)))
+        else:
+            xdf.rchg[i] = 1
+
+
+def split(ha1, off1, lim1, ha2, off2, lim2, kvdf, kvdb, kv_off, need_min, mxcost):
+    # the middle snake (or a heuristic split) of the box; returns i1, i2, min_lo, min_hi
+    dmin, dmax = off1 - lim2, lim1 - off2
+    fmid, bmid = off1 - off2, lim1 - lim2
+    odd = (fmid - bmid) & 1
+    fmin = fmax = fmid
+    bmin = bmax = bmid
+    kvdf[kv_off + fmid] = off1
+    kvdb[kv_off + bmid] = lim1
+
+    ec = 0
+    while True:
+        ec += 1
+        got_snake = False
+
+        if fmin > dmin:
+            fmin -= 1
+            kvdf[kv_off + fmin - 1] = -1
+        else:
+            fmin += 1
+        if fmax < dmax:
+            fmax += 1
+            kvdf[kv_off + fmax + 1] = -1
+        else:
+            fmax -= 1
+
+        for d in range(fmax, fmin - 1, -2):
+            if kvdf[kv_off + d - 1] >= kvdf[kv_off + d + 1]:
+                i1 = kvdf[kv_off + d - 1] + 1
+            else:
+                i1 = kvdf[kv_off + d + 1]
+            prev1 = i1
+            i2 = i1 - d
+            while i1 < lim1 and i2 < lim2 and ha1[i1] == ha2[i2]:
+                i1 += 1
+                i2 += 1
+            if i1 - prev1 > SNAKE_CNT:
+                got_snake = True
+            kvdf[kv_off + d] = i1
+            if odd and bmin <= d <= bmax and kvdb[kv_off + d] <= i1:
+                return i1, i2, True, True
+
+        if bmin > dmin:
+            bmin -= 1
+            kvdb[kv_off + bmin - 1] = LINE_MAX
+        else:
+            bmin += 1
+        if bmax < dmax:
+            bmax += 1
+            kvdb[kv_off + bmax + 1] = LINE_MAX
+        else:
+            bmax -= 1
+
+        for d in range(bmax, bmin - 1, -2):
+            if kvdb[kv_off + d - 1] < kvdb[kv_off + d + 1]:
+                i1 = kvdb[kv_off + d - 1]
+            else:
+                i1 = kvdb[kv_off + d + 1] - 1
+            prev1 = i1
+            i2 = i1 - d
+            while i1 > off1 and i2 > off2 and ha1[i1 - 1] == ha2[i2 - 1]:
+                i1 -= 1
+                i2 -= 1
+            if prev1 - i1 > SNAKE_CNT:
+                got_snake = True
+            kvdb[kv_off + d] = i1
+            if not odd and fmin <= d <= fmax and i1 <= kvdf[kv_off + d]:
+                return i1, i2, True, True
+
+        if need_min:
+            continue
+
+        if got_snake and ec > HEUR_MIN_COST:
+            best = 0
+            for d in range(fmax, fmin - 1, -2):
+                dd = d - fmid if d > fmid else fmid - d
+                i1 = kvdf[kv_off + d]
+                i2 = i1 - d
+                v = (i1 - off1) + (i2 - off2) - dd
+                if (v > K_HEUR * ec and v > best and
+                        off1 + SNAKE_CNT <= i1 < lim1 and off2 + SNAKE_CNT <= i2 < lim2):
+                    k = 1
+                    while ha1[i1 - k] == ha2[i2 - k]:
+                        if k == SNAKE_CNT:
+                            best = v
+                            best_i1, best_i2 = i1, i2
+                            break
+                        k += 1
+            if best > 0:
+                return best_i1, best_i2, True, False
+
+            best = 0
+            for d in range(bmax, bmin - 1, -2):
+                dd = d - bmid if d > bmid else bmid - d
+                i1 = kvdb[kv_off + d]
+                i2 = i1 - d
+                v = (lim1 - i1) + (lim2 - i2) - dd
+                if (v > K_HEUR * ec and v > best and
+                        off1 < i1 <= lim1 - SNAKE_CNT and off2 < i2 <= lim2 - SNAKE_CNT):
+                    k = 0
+                    while ha1[i1 + k] == ha2[i2 + k]:
+                        if k == SNAKE_CNT - 1:
+                            best = v
+                            best_i1, best_i2 = i1, i2
+                            break
+                        k += 1
+            if best > 0:
+                return best_i1, best_i2, False, True
+
+        if ec >= mxcost:
+            # the furthest reaching path
+            fbest = fbest1 = -1
+            for d in range(fmax, fmin - 1, -2):
+                i1 = min(kvdf[kv_off + d], lim1)
+                i2 = i1 - d
+                if lim2 < i2:
+                    i1 = lim2 + d
+                    i2 = lim2
+                if fbest < i1 + i2:
+                    fbest = i1 + i2
+                    fbest1 = i1
+            bbest = bbest1 = LINE_MAX
+            for d in range(bmax, bmin - 1, -2):
+                i1 = max(off1, kvdb[kv_off + d])
+                i2 = i1 - d
+                if i2 < off2:
+                    i1 = off2 + d
+                    i2 = off2
+                if i1 + i2 < bbest:
+                    bbest = i1 + i2
+                    bbest1 = i1
+            if (lim1 + lim2) - bbest < fbest - (off1 + off2):
+                return fbest1, fbest - fbest1, True, False
+            return bbest1, bbest - bbest1, False, True
+
+
+def compare_records(xdf_1, xdf_2):
+    # divide and conquer (with a stack instead of recursion)
+    ha1, ha2 = xdf_1.reff_ha, xdf_2.reff_ha
+    ndiags = len(ha1) + len(ha2) + 3
+    kvdf, kvdb = [0] * ndiags, [0] * ndiags
+    kv_off = len(ha2) + 1
+    mxcost = max(bogosqrt(ndiags), MAX_COST_MIN)
+    stack = [(0, len(ha1), 0, len(ha2), False)]
+    while len(stack) > 0:
+        off1, lim1, off2, lim2, need_min = stack.pop()
+        while off1 < lim1 and off2 < lim2 and ha1[off1] == ha2[off2]:
+            off1 += 1
+            off2 += 1
+        while off1 < lim1 and off2 < lim2 and ha1[lim1 - 1] == ha2[lim2 - 1]:
+            lim1 -= 1
+            lim2 -= 1
+        if off1 == lim1:
+            for i in range(off2, lim2):
+                xdf_2.rchg[xdf_2.rindex[i]] = 1
+        elif off2 == lim2:
+            for i in range(off1, lim1):
+                xdf_1.rchg[xdf_1.rindex[i]] = 1
+        else:
+            i1, i2, min_lo, min_hi = split(ha1, off1, lim1, ha2, off2, lim2,
+                                           kvdf, kvdb, kv_off, need_min, mxcost)
+            stack.append((i1, lim1, i2, lim2, min_hi))
+            stack.append((off1, i1, off2, i2, min_lo))
+
+
+def get_indent(record):
+    # (-1 for blank lines)
+    indent = 0
+    for c in record:
+        if c not in WHITESPACE:
+            return indent
+        if c == 32:
+            indent += 1
+        elif c == 9:
+            indent += 8 - indent % 8
+        if indent >= MAX_INDENT:
+            return MAX_INDENT
+    return -1
+
+
+def measure_split(xdf, split_pos):
+    if split_pos >= xdf.nrec:
+        end_of_file, indent = True, -1
+    else:
+        end_of_file, indent = False, get_indent(xdf.records[split_pos])
+    pre_blank, pre_indent = 0, -1
+    for i in range(split_pos - 1, -1, -1):
+        pre_indent = get_indent(xdf.records[i])
+        if pre_indent != -1:
+            break
+        pre_blank += 1
+        if pre_blank == MAX_BLANKS:
+            pre_indent = 0
+            break
+    post_blank, post_indent = 0, -1
+    for i in range(split_pos + 1, xdf.nrec):
+        post_indent = get_indent(xdf.records[i])
+        if post_indent != -1:
+            break
+        post_blank += 1
+        if post_blank == MAX_BLANKS:
+            post_indent = 0
+            break
+    return end_of_file, indent, pre_blank, pre_indent, post_blank, post_indent
+
+
+def get_split_score(measurement):
+    # (effective indent, penalty) of a split
+    end_of_file, indent, pre_blank, pre_indent, post_blank, post_indent = measurement
+    penalty = 0
+    if pre_indent == -1 and pre_blank == 0:
+        penalty += START_OF_FILE_PENALTY
+    if end_of_file:
+        penalty += END_OF_FILE_PENALTY
+    post_blank = 1 + post_blank if indent == -1 else 0
+    total_blank = pre_blank + post_blank
+    penalty += TOTAL_BLANK_WEIGHT * total_blank
+    penalty += POST_BLANK_WEIGHT * post_blank
+    if indent == -1:
+        indent = post_indent
+    any_blanks = total_blank != 0
+    if indent == -1 or pre_indent == -1 or indent == pre_indent:
+        pass
+    elif indent > pre_indent:
+        penalty += RELATIVE_INDENT_WITH_BLANK_PENALTY if any_blanks else RELATIVE_INDENT_PENALTY
+    elif post_indent != -1 and post_indent > indent:
+        penalty += (RELATIVE_OUTDENT_WITH_BLANK_PENALTY if any_blanks else
+                    RELATIVE_OUTDENT_PENALTY)
+    else:
+        penalty += RELATIVE_DEDENT_WITH_BLANK_PENALTY if any_blanks else RELATIVE_DEDENT_PENALTY
+    return indent, penalty
+
+
+def compare_scores(score_1, score_2):
+    cmp_indents = (score_1[0] > score_2[0]) - (score_1[0] < score_2[0])
+    return INDENT_WEIGHT * cmp_indents + (score_1[1] - score_2[1])
+
+
+class Group:
+    # a group of changed records [start, end) of a file
+
+    def __init__(self, xdf, start=0):
+        self.xdf = xdf
+        self.start = self.end = start
+        while xdf.rchg[self.end]:
+            self.end += 1
+
+    def next(self):
+        if self.end == self.xdf.nrec:
+            return False
+        self.start = self.end + 1
+        self.end = self.start
+        while self.xdf.rchg[self.end]:
+            self.end += 1
+        return True
+
+    def previous(self):
+        if self.start == 0:
+            return False
+        self.end = self.start - 1
+        self.start = self.end
+        while self.xdf.rchg[self.start - 1]:
+            self.start -= 1
+        return True
+
+    def slide_down(self):
+        xdf = self.xdf
+        if self.end < xdf.nrec and xdf.ha[self.start] == xdf.ha[self.end]:
+            xdf.rchg[self.start] = 0
+            xdf.rchg[self.end] = 1
+            self.start += 1
+            self.end += 1
+            while xdf.rchg[self.end]:
+                self.end += 1
+            return True
+        return False
+
+    def slide_up(self):
+        xdf = self.xdf
+        if self.start > 0 and xdf.ha[self.start - 1] == xdf.ha[self.end - 1]:
+            self.start -= 1
+            self.end -= 1
+            xdf.rchg[self.start] = 1
+            xdf.rchg[self.end] = 0
+            while xdf.rchg[self.start - 1]:
+                self.start -= 1
+            return True
+        return False
+
+
+def change_compact(xdf, xdfo):
+    # moves the groups of changes to their most intuitive position (as git does);
+    # the groups before 'dstart' (the same in both files) are empty and
+    # there are no groups to be moved after 'dend'
+    g, go = Group(xdf, xdf.dstart), Group(xdfo, xdfo.dstart)
+    while True:
+        if g.end != g.start:
+            while True:
+                groupsize = g.end - g.start
+                end_matching_other = -1
+                while g.slide_up():
+                    go.previous()
+                earliest_end = g.end
+                if go.end > go.start:
+                    end_matching_other = g.end
+                while g.slide_down():
+                    go.next()
+                    if go.end > go.start:
+                        end_matching_other = g.end
+                if groupsize == g.end - g.start:
+                    break
+
+            if g.end == earliest_end:
+                pass
+            elif end_matching_other != -1:
+                while go.end == go.start:
+                    g.slide_up()
+                    go.previous()
+            else:
+                shift = max(earliest_end, g.end - groupsize - 1,
+                            g.end - INDENT_HEURISTIC_MAX_SLIDING)
+                best_shift, best_score = -1, None
+                while shift <= g.end:
+                    score_1 = get_split_score(measure_split(xdf, shift))
+                    score_2 = get_split_score(measure_split(xdf, shift - groupsize))
+                    score = (score_1[0] + score_2[0], score_1[1] + score_2[1])
+                    if best_shift == -1 or compare_scores(score, best_score) <= 0:
+                        best_score, best_shift = score, shift
+                    shift += 1
+                while g.end > best_shift:
+                    g.slide_up()
+                    go.previous()
+
+        if g.end > xdf.dend or not g.next():
+            break
+        go.next()
+
+
+def build_script(xdf_1, xdf_2):
+    # (old start, old count, new start, new count) of the changes
+    # (the unchanged records of both files are paired in their order)
+    rchg1, rchg2 = xdf_1.rchg, xdf_2.rchg
+    changes = []
+    i1 = i2 = 0
+    while i1 < xdf_1.nrec or i2 < xdf_2.nrec:
+        # (skip the unchanged records up to the next change in one of the files)
+        next_1, next_2 = rchg1.find(1, i1), rchg2.find(1, i2)
+        if next_1 == -1 and next_2 == -1:
+            break
+        unchanged = min(next_1 - i1 if next_1 != -1 else xdf_1.nrec - i1,
+                        next_2 - i2 if next_2 != -1 else xdf_2.nrec - i2)
+        i1 += unchanged
+        i2 += unchanged
+        l1, l2 = i1, i2
+        while rchg1[i1]:
+            i1 += 1
+        while rchg2[i2]:
+            i2 += 1
+        if i1 > l1 or i2 > l2:
+            changes.append((l1, i1 - l1, l2, i2 - l2))
+        i1 += 1
+        i2 += 1
+    return changes
+
+
+def get_changes(data_1, data_2):
+    # the changes of the records shown with '-U0' (changes of blank lines are ignored);
+    # returns the records of both files and the changes
+    data_1, data_2 = trim_common_tail(data_1, data_2)
+    xdf_1, xdf_2 = DiffFile(data_1), DiffFile(data_2)
+    trim_ends(xdf_1, xdf_2)
+    classes = {}
+    cleanup_records(xdf_1, xdf_2, classes)
+    cleanup_records(xdf_2, xdf_1, classes)
+    compare_records(xdf_1, xdf_2)
+    change_compact(xdf_1, xdf_2)
+    change_compact(xdf_2, xdf_1)
+    changes = [(i1, chg1, i2, chg2) for i1, chg1, i2, chg2 in build_script(xdf_1, xdf_2)
+               if not (all(is_blank(record) for record in xdf_1.records[i1:i1 + chg1]) and
+                       all(is_blank(record) for record in xdf_2.records[i2:i2 + chg2]))]
+    return xdf_1.records, xdf_2.records, changes
+
+
+def get_hunk_header(i1, chg1, i2, chg2):
+    old_range = str(i1 + 1 if chg1 else i1) + ("" if chg1 == 1 else f",{chg1}")
+    new_range = str(i2 + 1 if chg2 else i2) + ("" if chg2 == 1 else f",{chg2}")
+    return f"@@ -{old_range} +{new_range} @@"
+
+
+def get_hunks_text(data_1, data_2, encoding="utf-8"):
+    # the hunks of the diff as in the output of git (without the file headers)
+    records_1, records_2, changes = get_changes(data_1, data_2)
+    lines = []
+    for i1, chg1, i2, chg2 in changes:
+        lines.append(get_hunk_header(i1, chg1, i2, chg2))
+        lines.extend("-" + record.decode(encoding, "surrogateescape")
+                     for record in records_1[i1:i1 + chg1])
+        lines.extend("+" + record.decode(encoding, "surrogateescape")
+                     for record in records_2[i2:i2 + chg2])
+    return "\n".join(lines)